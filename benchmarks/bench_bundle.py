@@ -0,0 +1,60 @@
+"""
+Times building the code bundle from a real virtualenv's site-packages.
+
+Compares a full serial build, a full parallel build (checking both are byte-identical) and an
+incremental rebuild on top of them where nothing has changed.
+
+    python benchmarks/bench_bundle.py --site-packages venv/lib/python3.6/site-packages --jobs 4
+"""
+
+import argparse
+import filecmp
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from cloudseeder import deploy
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--site-packages', default=deploy.get_site_packages())
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        serial_path = os.path.join(workdir, 'serial.zip')
+        parallel_path = os.path.join(workdir, 'parallel.zip')
+        serial, manifest = timed(
+            deploy.write_environment_zip, serial_path, args.site_packages, incremental=False,
+        )
+        parallel, _ = timed(
+            deploy.write_environment_zip, parallel_path, args.site_packages, incremental=False, jobs=args.jobs,
+        )
+        identical = filecmp.cmp(serial_path, parallel_path, shallow=False)
+        size = os.path.getsize(serial_path)
+        incremental, _ = timed(deploy.write_environment_zip, serial_path, args.site_packages)
+    finally:
+        shutil.rmtree(workdir)
+
+    print('{} entries, {:.1f} MB compressed'.format(len(manifest['entries']), size / 1e6))
+    print('{:>20}: {:8.2f} s'.format('full serial', serial))
+    print('{:>20}: {:8.2f} s ({} jobs, {})'.format(
+        'full parallel', parallel, args.jobs, 'byte-identical' if identical else 'OUTPUT DIFFERS',
+    ))
+    print('{:>20}: {:8.2f} s'.format('incremental', incremental))
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
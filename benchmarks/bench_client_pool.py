@@ -0,0 +1,45 @@
+"""
+Compares per-invocation client setup with and without the process-wide client pool.
+
+The unpooled case mirrors the old handler behaviour: a new `boto3.Session()` per event, and a new
+client per resource method call. No requests are sent, only client construction is timed.
+
+    python benchmarks/bench_client_pool.py --invocations 200
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import boto3
+
+from cloudseeder import clients
+
+
+def unpooled(service_name):
+    boto3.Session().client(service_name)
+
+
+def pooled(service_name):
+    clients.get_session().client(service_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--invocations', type=int, default=200)
+    parser.add_argument('--service', default='cloudfront')
+    args = parser.parse_args(argv)
+
+    # credentials and region only need to resolve, nothing is sent
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIDEXAMPLE')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'secret')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    for name, func in (('unpooled', unpooled), ('pooled', pooled)):
+        elapsed = timeit.timeit(lambda: func(args.service), number=args.invocations)
+        print('{:>10}: {:8.3f} ms per invocation'.format(name, elapsed / args.invocations * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
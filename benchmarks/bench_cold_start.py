@@ -0,0 +1,92 @@
+"""
+Compares cold start import times of a source-only code bundle against a precompiled one.
+
+Both bundles are built from a real virtualenv's site-packages and extracted, then the target
+module is imported from each in fresh interpreters that can't write bytecode, like on Lambda's
+read-only filesystem. Must be run with the interpreter matching the deployed runtime.
+
+    python benchmarks/bench_cold_start.py --site-packages venv/lib/python3.6/site-packages
+
+The bundle only contains `cloudseeder` if it's installed normally rather than in develop mode;
+otherwise pass a `--target` such as `boto3`.
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from cloudseeder import deploy, prune
+
+IMPORT_SCRIPT = '''
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+__import__(sys.argv[2])
+print(time.perf_counter() - start)
+'''
+
+
+def build(workdir, name, site_packages, jobs, plan, bytecode_runtime=None):
+    zip_path = os.path.join(workdir, name + '.zip')
+    deploy.write_environment_zip(
+        zip_path, site_packages, incremental=False, jobs=jobs, plan=plan,
+        bytecode_runtime=bytecode_runtime,
+    )
+    extracted = os.path.join(workdir, name)
+    with zipfile.ZipFile(zip_path) as zipf:
+        zipf.extractall(extracted)
+    return zip_path, extracted
+
+
+def measure(extracted, target, repeat):
+    samples = []
+    for _ in range(repeat):
+        # -S and -E keep the build environment's own site-packages out of the way, -B stands in
+        # for the read-only filesystem
+        result = subprocess.run(
+            [sys.executable, '-S', '-E', '-B', '-c', IMPORT_SCRIPT, extracted, target],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True,
+        )
+        samples.append(float(result.stdout))
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--site-packages', default=deploy.get_site_packages())
+    parser.add_argument('--target', default='cloudseeder.handler')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--no-prune', dest='prune', action='store_false')
+    args = parser.parse_args(argv)
+
+    runtime = deploy.get_interpreter_runtime()
+    plan = prune.create_plan(args.site_packages) if args.prune else None
+    workdir = tempfile.mkdtemp()
+    try:
+        results = []
+        for name, bytecode_runtime in (('source-only', None), ('precompiled', runtime)):
+            zip_path, extracted = build(
+                workdir, name, args.site_packages, args.jobs, plan, bytecode_runtime,
+            )
+            samples = measure(extracted, args.target, args.repeat)
+            results.append((name, os.path.getsize(zip_path), samples))
+    finally:
+        shutil.rmtree(workdir)
+
+    print('importing {} on {}, {} runs each'.format(args.target, runtime, args.repeat))
+    for name, size, samples in results:
+        print('{:>12}: median {:7.1f} ms, min {:7.1f} ms, bundle {:.1f} MB'.format(
+            name, statistics.median(samples) * 1e3, min(samples) * 1e3, size / 1e6,
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Compares building resources with troposphere's `from_dict` against the compiled schemas the
+handler uses, on a DynamoDB table with a large nested property tree.
+
+    python benchmarks/bench_property_schemas.py --indexes 20 --attributes 50
+"""
+
+import argparse
+import sys
+import time
+
+from cloudseeder import schema
+from cloudseeder.resources import dynamodb
+
+
+def create_properties(indexes, attributes):
+    key_schema = [
+        {'AttributeName': 'Hash', 'KeyType': 'HASH'},
+        {'AttributeName': 'Range', 'KeyType': 'RANGE'},
+    ]
+    throughput = {'ReadCapacityUnits': '5', 'WriteCapacityUnits': '5'}
+    return {
+        'ServiceToken': 'arn:aws:lambda:us-east-1:123456789012:function:CloudSeeder',
+        'AttributeDefinitions': [
+            {'AttributeName': name, 'AttributeType': 'S'} for name in ('Hash', 'Range')
+        ],
+        'KeySchema': key_schema,
+        'ProvisionedThroughput': throughput,
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'Index{}'.format(i),
+                'KeySchema': key_schema,
+                'Projection': {
+                    'ProjectionType': 'INCLUDE',
+                    'NonKeyAttributes': ['Attribute{}'.format(j) for j in range(attributes)],
+                },
+                'ProvisionedThroughput': throughput,
+            }
+            for i in range(indexes)
+        ],
+    }
+
+
+def measure(construct, properties, count, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            construct(dynamodb.Table, 'Table', properties)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--indexes', type=int, default=20)
+    parser.add_argument('--attributes', type=int, default=50)
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    properties = create_properties(args.indexes, args.attributes)
+    table = schema.construct_resource(dynamodb.Table, 'Table', properties)
+    reference = dynamodb.Table.from_dict('Table', properties)
+    assert table.get_create_table_kwargs('name') == reference.get_create_table_kwargs('name')
+
+    legacy = measure(lambda cls, title, values: cls.from_dict(title, values), properties, args.count, args.repeat)
+    compiled = measure(schema.construct_resource, properties, args.count, args.repeat)
+    for name, elapsed in (('from_dict', legacy), ('compiled', compiled)):
+        print('{:>10}: {:8.2f} us per resource'.format(name, elapsed / args.count * 1e6))
+    print('{:>10}: {:8.1f}x'.format('speedup', legacy / compiled))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
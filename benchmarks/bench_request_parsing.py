@@ -0,0 +1,78 @@
+"""
+Parses a large corpus of Create/Update/Delete events with `Request.from_dict`.
+
+The previous implementation (a regex per key, a `globals()` lookup and validation through attrs on
+every call) is kept here for comparison.
+
+    python benchmarks/bench_request_parsing.py --events 100000
+"""
+
+import argparse
+import re
+import sys
+import time
+
+import attr
+
+from cloudseeder import types
+
+
+def legacy_from_dict(cls, obj):
+    request_cls = vars(types).get(obj.get('RequestType', cls.__name__), cls)
+    request_cls_attrs = set(field.name for field in attr.fields(request_cls))
+    kwargs = {re.sub('(?!^)([A-Z]+)', r'_\1', k).lower(): v for k, v in obj.items()}
+    request_cls_kwargs = {k: v for k, v in kwargs.items() if k in request_cls_attrs}
+    return request_cls(**request_cls_kwargs)
+
+
+def create_corpus(count):
+    corpus = []
+    for i in range(count):
+        request_type = ('Create', 'Update', 'Delete')[i % 3]
+        event = {
+            'RequestType': request_type,
+            'ServiceToken': 'arn:aws:lambda:us-east-1:123456789012:function:CloudSeeder',
+            'RequestId': 'request-{}'.format(i),
+            'ResponseURL': 'https://cloudformation-custom-resource-response.s3.amazonaws.com/{}'.format(i),
+            'ResourceType': 'Custom::AWS.CloudFront.OriginAccessIdentity',
+            'LogicalResourceId': 'Identity{}'.format(i % 50),
+            'StackId': 'arn:aws:cloudformation:us-east-1:123456789012:stack/stack/guid',
+            'ResourceProperties': {'CallerReference': str(i), 'Comment': 'resource {}'.format(i)},
+        }
+        if request_type != 'Create':
+            event['PhysicalResourceId'] = 'E{:013d}'.format(i)
+        if request_type == 'Update':
+            event['OldResourceProperties'] = {'CallerReference': str(i), 'Comment': 'old'}
+        corpus.append(event)
+    return corpus
+
+
+def measure(parse, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for event in corpus:
+            parse(event)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    corpus = create_corpus(args.events)
+    for event in corpus[:3]:
+        assert types.Request.from_dict(event) == legacy_from_dict(types.Request, event)
+
+    legacy = measure(lambda event: legacy_from_dict(types.Request, event), corpus, args.repeat)
+    current = measure(types.Request.from_dict, corpus, args.repeat)
+    for name, elapsed in (('legacy', legacy), ('from_dict', current)):
+        print('{:>10}: {:8.2f} us per event'.format(name, elapsed / len(corpus) * 1e6))
+    print('{:>10}: {:8.1f}x'.format('speedup', legacy / current))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Measures cold-start resource class lookup as the number of resource modules grows.
+
+Each measurement runs in a fresh interpreter so module imports aren't cached, comparing the full
+`pkgutil.walk_packages` scan against a lookup through the precomputed resource index.
+
+    python benchmarks/bench_resource_index.py --modules 1 10 50 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULE_TEMPLATE = '''
+from cloudseeder.resources import Resource, Property
+
+RESOURCE_TYPE_PREFIX = 'Bench.Module{index}'
+
+class Nested{index}(Property):
+    props = {{
+        'Name': (str, True),
+    }}
+
+class Thing{index}(Resource):
+    """
+    Synthetic resource number {index}.
+    """
+    props = {{
+        'Name': (str, True),
+        'Nested': ([Nested{index}], False),
+    }}
+
+    def create(self, request, session):
+        return self.Name
+'''
+
+# cloudseeder.loader (and with it troposphere) is imported before the clock starts in both
+# snippets, so the numbers only cover the lookup strategy itself.
+SCAN_SNIPPET = '''
+import time
+from cloudseeder import loader
+start = time.perf_counter()
+import {package}
+mapping = {{cls.resource_type: cls for cls in loader.load_custom_resources({package})}}
+cls = mapping[{resource_type!r}]
+print(time.perf_counter() - start)
+'''
+
+INDEX_SNIPPET = '''
+import json, time
+from cloudseeder import loader
+start = time.perf_counter()
+with open({index_path!r}) as f:
+    index = json.load(f)
+cls = loader.import_resource_class(index[{resource_type!r}])
+print(time.perf_counter() - start)
+'''
+
+
+def create_package(root, package, count):
+    package_dir = os.path.join(root, package)
+    os.makedirs(package_dir)
+    with open(os.path.join(package_dir, '__init__.py'), 'w') as f:
+        f.write('')
+    for index in range(count):
+        with open(os.path.join(package_dir, 'module{}.py'.format(index)), 'w') as f:
+            f.write(MODULE_TEMPLATE.format(index=index))
+
+
+def run_snippet(snippet, root, repeat):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (root, os.environ.get('PYTHONPATH')))))
+    timings = []
+    # the first run populates __pycache__, so compiling the synthetic modules is not counted
+    subprocess.check_output([sys.executable, '-c', snippet], env=env, cwd=root)
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', snippet], env=env, cwd=root)
+        timings.append(float(output))
+    return statistics.median(timings)
+
+
+def benchmark(count, repeat):
+    with tempfile.TemporaryDirectory() as root:
+        package = 'benchresources{}'.format(count)
+        create_package(root, package, count)
+        # look up the last module, as the full scan has to import everything anyway
+        resource_type = 'Custom::Bench.Module{}.Thing{}'.format(count - 1, count - 1)
+        index_path = os.path.join(root, 'resource_index.json')
+        build_snippet = (
+            'import json, {package}\n'
+            'from cloudseeder import loader\n'
+            'print(json.dumps(loader.build_resource_index({package})))\n'
+        ).format(package=package)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (root, os.environ.get('PYTHONPATH')))))
+        index = subprocess.check_output([sys.executable, '-c', build_snippet], env=env, cwd=root)
+        with open(index_path, 'wb') as f:
+            f.write(index)
+        assert resource_type in json.loads(index.decode('utf-8'))
+        scan = run_snippet(SCAN_SNIPPET.format(package=package, resource_type=resource_type), root, repeat)
+        indexed = run_snippet(INDEX_SNIPPET.format(index_path=index_path, resource_type=resource_type), root, repeat)
+    return scan, indexed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    print('{:>8} {:>12} {:>12} {:>8}'.format('modules', 'scan (ms)', 'index (ms)', 'speedup'))
+    for count in args.modules:
+        scan, indexed = benchmark(count, args.repeat)
+        print('{:>8} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(count, scan * 1000, indexed * 1000, scan / indexed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
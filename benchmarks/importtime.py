@@ -0,0 +1,145 @@
+"""
+Records per-module import times for the Lambda entry point and checks them against a budget.
+
+Every target is imported in a fresh interpreter with `-X importtime`, several times over, and the
+median self and cumulative time of each module is kept. Results are appended to a JSON lines
+history file so regressions can be tracked between commits.
+
+    python benchmarks/importtime.py --history .benchmarks/importtime.jsonl
+    python benchmarks/importtime.py --budget benchmarks/import_budget.json --top 15
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+
+DEFAULT_TARGETS = ('cloudseeder', 'cloudseeder.types', 'cloudseeder.handler')
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_budget.json')
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_importtime(stderr):
+    """
+    Parses `-X importtime` output into {module: (self_us, cumulative_us)}.
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, module = match.groups()
+            timings[module] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def measure_target(target, repeat):
+    """
+    Imports `target` in `repeat` fresh interpreters and returns median timings per module.
+    """
+    samples = collections.defaultdict(list)
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(target)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+        )
+        for module, timing in parse_importtime(result.stderr).items():
+            samples[module].append(timing)
+    return {
+        module: {
+            'self_us': int(statistics.median(s for s, _ in timings)),
+            'cumulative_us': int(statistics.median(c for _, c in timings)),
+        }
+        for module, timings in samples.items()
+    }
+
+
+def check_budget(results, budget):
+    """
+    Yields (target, module, measured_us, allowed_us) for every budget line that was exceeded.
+
+    A budget maps each target to either a cumulative microsecond limit for the target itself, or
+    to a dict of per-module limits. A limit of 0 means the module must not be imported at all.
+    """
+    for target, limits in budget.items():
+        modules = results.get(target, {})
+        if not isinstance(limits, dict):
+            limits = {target: limits}
+        for module, allowed_us in limits.items():
+            if module not in modules:
+                continue
+            measured_us = modules[module]['cumulative_us']
+            if allowed_us == 0 or measured_us > allowed_us:
+                yield target, module, measured_us, allowed_us
+
+
+def append_history(path, results):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    record = {
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'revision': get_revision(),
+        'results': results,
+    }
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, top):
+    for target, modules in results.items():
+        print('{} ({:.1f} ms cumulative)'.format(target, modules.get(target, {}).get('cumulative_us', 0) / 1000))
+        ranked = sorted(modules.items(), key=lambda item: item[1]['self_us'], reverse=True)
+        for module, timing in ranked[:top]:
+            print('    {:>9.1f} ms self {:>9.1f} ms cumulative  {}'.format(
+                timing['self_us'] / 1000, timing['cumulative_us'] / 1000, module,
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('targets', nargs='*', default=list(DEFAULT_TARGETS))
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--budget', default=DEFAULT_BUDGET)
+    parser.add_argument('--history', help='JSON lines file to append this run to')
+    args = parser.parse_args(argv)
+
+    results = collections.OrderedDict((target, measure_target(target, args.repeat)) for target in args.targets)
+    print_report(results, args.top)
+    if args.history:
+        append_history(args.history, results)
+
+    if not args.budget:
+        return 0
+    with open(args.budget) as f:
+        budget = json.load(f)
+    violations = list(check_budget(results, budget))
+    for target, module, measured_us, allowed_us in violations:
+        if allowed_us == 0:
+            print('BUDGET: importing {} pulled in {}'.format(target, module))
+        else:
+            print('BUDGET: {} via {} took {:.1f} ms, budget is {:.1f} ms'.format(
+                module, target, measured_us / 1000, allowed_us / 1000,
+            ))
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -28,6 +28,7 @@ setup(
         'awscli',
         'backports.functools_lru_cache; python_version < "3.3"',
         'boto3',
+        'futures; python_version < "3.2"',
         'requests',
         'troposphere',
     ],
@@ -1 +1,13 @@
-from .handler import handler as lambda_handler
+import sys
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # Lambda resolves `cloudseeder.lambda_handler` during its init phase, but tooling such as
+        # `cloudseeder.deploy` and `cloudseeder.docs` shouldn't pay for importing the handler's
+        # runtime dependencies just by importing the package.
+        if name == 'lambda_handler':
+            from .handler import handler
+            return handler
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+else:
+    from .handler import handler as lambda_handler
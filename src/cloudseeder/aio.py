@@ -0,0 +1,121 @@
+"""
+Implements the asyncio flavor of the resource API.
+
+Lifecycle methods and `poll` can be defined with `async def`, in which case the handler runs them
+on a fresh event loop and passes an `AsyncSession` instead of the usual session. Its clients have
+a coroutine for every API operation, so independent calls can be awaited together:
+
+    async def create(self, request, session):
+        dynamodb = session.client('dynamodb')
+        await aio.gather_limited(
+            [dynamodb.update_table(TableName=name, ...) for name in names], limit=4,
+        )
+
+boto3 itself is blocking, so each call runs on a shared thread pool. That's still the pooled,
+rate limited client, and it still refuses calls past the operation's deadline.
+
+This module needs Python 3.5 or later, and is only imported for resources that use it.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from . import deadline
+from .util import lru_cache
+
+# bounds how many AWS calls all coroutines of an invocation have in flight together
+MAX_WORKERS = 16
+
+
+@lru_cache(1)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+
+class AsyncClient(object):
+    """
+    Wraps a boto3 client so that its API operations are coroutines.
+
+    Everything other than API operations, such as `exceptions` and `meta`, is passed through.
+    If `timeout` is set, calls that take longer raise `asyncio.TimeoutError`.
+    """
+
+    def __init__(self, client, timeout=None):
+        self._client = client
+        self._timeout = timeout
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name not in self._client.meta.method_to_api_mapping:
+            return attribute
+
+        async def call(**kwargs):
+            # the worker thread runs the call under the deadline of the operation making it
+            current = deadline.get_current_deadline()
+
+            def run():
+                with deadline.activate(current):
+                    return attribute(**kwargs)
+
+            future = asyncio.get_event_loop().run_in_executor(get_executor(), run)
+            if self._timeout is None:
+                return await future
+            return await with_timeout(future, self._timeout)
+
+        functools.update_wrapper(call, attribute)
+        return call
+
+
+class AsyncSession(object):
+    """
+    Wraps the session handed to resources so that `client` returns `AsyncClient` objects.
+
+    The wrapped session is available as `sync` for anything that needs a blocking client.
+    """
+
+    def __init__(self, session):
+        self.sync = session
+
+    def client(self, service_name, region_name=None, timeout=None, **kwargs):
+        return AsyncClient(self.sync.client(service_name, region_name=region_name, **kwargs), timeout)
+
+    def __getattr__(self, name):
+        return getattr(self.sync, name)
+
+
+async def gather_limited(awaitables, limit, return_exceptions=False):
+    """
+    Awaits `awaitables` with at most `limit` of them running at once, returning results in order.
+
+    Coroutines that haven't been started yet don't run until a slot is free.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(
+        *[run(awaitable) for awaitable in awaitables], return_exceptions=return_exceptions
+    )
+
+async def with_timeout(awaitable, seconds):
+    """
+    Awaits `awaitable` for up to `seconds`, or until the operation's deadline if that's sooner.
+
+    Raises `asyncio.TimeoutError` if it takes longer.
+    """
+    return await asyncio.wait_for(awaitable, deadline.get_current_deadline().cap(seconds))
+
+def run(coroutine):
+    """
+    Runs a lifecycle method's coroutine to completion on a new event loop.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,83 @@
+"""
+Implements handling of CloudFormation events delivered in SQS or SNS batches.
+
+CloudFormation can deliver custom resource events through SNS, and an SQS queue in front of the
+function absorbs bursts from large stacks. Each record is unwrapped into its CloudFormation event
+and handled on a bounded thread pool. Every record still sends its own CloudFormation response,
+and SQS records that couldn't be handled are reported back individually so only they are retried.
+"""
+
+import json
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .constants import BATCH_WORKERS_ENV
+from .exceptions import BatchProcessingException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_WORKERS = 8
+
+
+def is_sqs_record(record):
+    return record.get('eventSource') == 'aws:sqs'
+
+def is_sns_record(record):
+    return record.get('EventSource') == 'aws:sns'
+
+def is_batch_event(event):
+    """
+    Checks if an event is an SQS or SNS envelope rather than a CloudFormation event.
+    """
+    records = event.get('Records')
+    return (
+        isinstance(records, list) and bool(records) and
+        all(is_sqs_record(record) or is_sns_record(record) for record in records)
+    )
+
+def unwrap_record(record):
+    """
+    Gets the record identifier and the event carried by an SQS or SNS record.
+    """
+    if is_sns_record(record):
+        return record['Sns']['MessageId'], json.loads(record['Sns']['Message'])
+    body = json.loads(record['body'])
+    if body.get('Type') == 'Notification' and 'Message' in body:
+        # SNS to SQS without raw message delivery wraps the event in the notification
+        body = json.loads(body['Message'])
+    return record['messageId'], body
+
+def get_max_workers():
+    return int(os.environ.get(BATCH_WORKERS_ENV, DEFAULT_BATCH_WORKERS))
+
+def handle_record(record, handle_event):
+    record_id = None
+    try:
+        record_id, event = unwrap_record(record)
+        handle_event(event)
+    except Exception:
+        logger.exception('Failed to handle record %s', record_id)
+        return False
+    return True
+
+def process_batch(event, handle_event, max_workers=None):
+    """
+    Handles every record in a batch concurrently with `handle_event`.
+
+    Returns a partial batch response naming the SQS records that failed. Failed SNS records raise
+    `BatchProcessingException` instead, as SNS retries the whole delivery.
+    """
+    records = event['Records']
+    max_workers = min(max_workers or get_max_workers(), len(records))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = list(executor.map(lambda record: handle_record(record, handle_event), records))
+    failed = [record for record, succeeded in zip(records, outcomes) if not succeeded]
+    if any(is_sns_record(record) for record in failed):
+        raise BatchProcessingException(
+            '{} of {} records could not be handled'.format(len(failed), len(records)),
+        )
+    return {
+        'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in failed],
+    }
@@ -0,0 +1,442 @@
+"""
+Implements writing the zipped code bundle, reusing work from the previous build where possible.
+
+Every build leaves a manifest next to the archive recording the size, modification time and
+SHA-256 of each source file. On the next build, entries whose source is unchanged are copied from
+the previous archive as already-compressed bytes, and only new or changed files are deflated.
+
+Entries are always written in sorted order, and deflating can be spread over a process pool
+without changing a single byte of the output.
+
+Python sources can also be shipped precompiled, as bytecode that the importer never needs to
+validate against the source.
+
+Archives are reproducible: entry order, timestamps and attributes don't depend on the build
+machine, and every manifest carries a digest of the archive's contents so unchanged builds can be
+recognized without comparing compressed bytes.
+"""
+
+import hashlib
+import json
+import logging
+import marshal
+import os
+import struct
+import sys
+import zlib
+import zipfile
+
+import attr
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+# permissions for every entry, Lambda is particular about them
+EXTERNAL_ATTR = 0o755 << 16
+
+# record layouts from the zip format specification (PKWARE's APPNOTE.TXT)
+LOCAL_HEADER_FORMAT = '<4s2B4HL2L2H'
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+CENTRAL_HEADER_FORMAT = '<4s4B4HL2L5H2L'
+CENTRAL_HEADER_SIGNATURE = b'PK\x01\x02'
+END_RECORD_FORMAT = '<4s4H2LH'
+END_RECORD_SIGNATURE = b'PK\x05\x06'
+
+# version 2.0 of the format, which deflate needs, made on Unix so the permissions are kept
+ZIP_VERSION = 20
+ZIP_SYSTEM = 3
+ZIP_DEFLATED = 8
+UTF8_FLAG = 0x800
+
+# archives needing the zip64 extensions are far beyond what Lambda accepts
+MAX_ZIP_ENTRIES = 0xffff
+MAX_ZIP_OFFSET = 0xffffffff
+
+try:
+    from importlib.util import MAGIC_NUMBER
+except ImportError:
+    from imp import get_magic
+    MAGIC_NUMBER = get_magic()
+
+# timestamp of every entry, the earliest a zip archive can hold
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# modification time of every extracted entry, ZIP_DATE_TIME as a UTC timestamp
+ZIP_EPOCH = 315532800
+
+# hash-based bytecode that isn't checked against its source (PEP 552)
+UNCHECKED_HASH_FLAGS = 0b01
+
+
+@attr.s(frozen=True)
+class FileEntry(object):
+    """
+    An archive entry read from a file on disk.
+    """
+    name = attr.ib()
+    path = attr.ib()
+
+    def stat(self):
+        stat = os.stat(self.path)
+        return stat.st_size, getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1e9))
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+@attr.s(frozen=True)
+class DataEntry(object):
+    """
+    An archive entry generated during the build.
+    """
+    name = attr.ib()
+    data = attr.ib()
+
+    def stat(self):
+        return None
+
+    def read(self):
+        return self.data
+
+
+@attr.s(frozen=True)
+class BytecodeEntry(object):
+    """
+    An archive entry holding the compiled bytecode of a Python source file on disk.
+
+    Compiling happens when the entry is read; `read` returns None if the source doesn't compile
+    with this interpreter, in which case no entry is written.
+    """
+    name = attr.ib()
+    path = attr.ib()
+    source_name = attr.ib()
+
+    def stat(self):
+        return FileEntry(self.source_name, self.path).stat()
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            source = f.read()
+        try:
+            return compile_bytecode(source, self.source_name)
+        except (SyntaxError, ValueError):
+            return None
+
+
+@attr.s(frozen=True)
+class Member(object):
+    """
+    A compressed archive member, ready to be written.
+    """
+    name = attr.ib()
+    crc = attr.ib()
+    file_size = attr.ib()
+    compressed = attr.ib()
+
+
+class ZipWriter(object):
+    """
+    Writes a zip archive of already compressed members.
+
+    `zipfile` can only write members by compressing them itself, so the few records an archive
+    consists of are written here instead. Every entry gets the same timestamp and permissions.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.start = f.tell()
+        self.central_headers = []
+
+    def write(self, member):
+        name = member.name.encode('utf-8')
+        flags = 0 if len(name) == len(member.name) else UTF8_FLAG
+        offset = self.f.tell() - self.start
+        if len(self.central_headers) >= MAX_ZIP_ENTRIES or offset + len(member.compressed) > MAX_ZIP_OFFSET:
+            raise ValueError('Archive is too large to write without zip64 extensions')
+        dos_time, dos_date = get_dos_date_time(ZIP_DATE_TIME)
+        fields = (
+            flags, ZIP_DEFLATED, dos_time, dos_date,
+            member.crc, len(member.compressed), member.file_size, len(name),
+        )
+        self.f.write(struct.pack(LOCAL_HEADER_FORMAT, LOCAL_HEADER_SIGNATURE, ZIP_VERSION, 0, *(fields + (0,))))
+        self.f.write(name)
+        self.f.write(member.compressed)
+        self.central_headers.append(struct.pack(
+            CENTRAL_HEADER_FORMAT, CENTRAL_HEADER_SIGNATURE, ZIP_VERSION, ZIP_SYSTEM, ZIP_VERSION, 0,
+            *(fields + (0, 0, 0, 0, EXTERNAL_ATTR, offset))
+        ) + name)
+
+    def close(self):
+        """
+        Writes the central directory, which completes the archive.
+        """
+        directory_offset = self.f.tell() - self.start
+        for header in self.central_headers:
+            self.f.write(header)
+        directory_size = self.f.tell() - self.start - directory_offset
+        count = len(self.central_headers)
+        self.f.write(struct.pack(
+            END_RECORD_FORMAT, END_RECORD_SIGNATURE, 0, 0, count, count, directory_size, directory_offset, 0,
+        ))
+
+
+def get_bytecode_name(source_name):
+    """
+    Gets the name the import system looks for bytecode of `source_name` under, for this interpreter.
+    """
+    cache_tag = getattr(getattr(sys, 'implementation', None), 'cache_tag', None)
+    if cache_tag is None:
+        return source_name + 'c'
+    head, _, tail = source_name.rpartition('/')
+    filename = '__pycache__/{}.{}.pyc'.format(tail.rpartition('.')[0], cache_tag)
+    return '/'.join((head, filename)) if head else filename
+
+def compile_bytecode(source, source_name):
+    """
+    Compiles Python source into the contents of a `.pyc` file for this interpreter.
+
+    The importer doesn't revalidate the result against the source: it's either hash-based and
+    unchecked, or for interpreters predating that, stamped with the time every archive entry is
+    extracted with.
+    """
+    code = compile(source, source_name, 'exec', dont_inherit=True)
+    if sys.version_info >= (3, 7):
+        from importlib.util import source_hash
+        header = MAGIC_NUMBER + struct.pack('<I', UNCHECKED_HASH_FLAGS) + source_hash(source)
+    elif sys.version_info >= (3, 3):
+        header = MAGIC_NUMBER + struct.pack('<2I', ZIP_EPOCH, len(source) & 0xffffffff)
+    else:
+        header = MAGIC_NUMBER + struct.pack('<I', ZIP_EPOCH)
+    return header + marshal.dumps(code)
+
+def compress(name, data):
+    """
+    Deflates `data` exactly the way `zipfile` does for `ZIP_DEFLATED` entries.
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    return Member(name=name, crc=zlib.crc32(data) & 0xffffffff, file_size=len(data), compressed=compressed)
+
+def get_dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+def read_raw_member(f, zipi):
+    """
+    Reads the compressed bytes of a member from the archive file `f`, without inflating them.
+    """
+    f.seek(zipi.header_offset)
+    header = struct.unpack(LOCAL_HEADER_FORMAT, f.read(struct.calcsize(LOCAL_HEADER_FORMAT)))
+    if header[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipfile('Bad local header for {}'.format(zipi.filename))
+    name_length, extra_length = header[10], header[11]
+    f.seek(name_length + extra_length, os.SEEK_CUR)
+    return f.read(zipi.compress_size)
+
+
+class PreviousBuild(object):
+    """
+    The archive and manifest from the last build, used to skip recompressing unchanged entries.
+    """
+
+    def __init__(self, f, manifest):
+        self.f = f
+        self.manifest = manifest
+        self.infos = {zipi.filename: zipi for zipi in zipfile.ZipFile(f).infolist()}
+
+    @classmethod
+    def load(cls, zip_path, manifest_path):
+        """
+        Opens the previous build, or returns None if it's missing or unusable.
+        """
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('version') != MANIFEST_VERSION:
+                return None
+            f = open(zip_path, 'rb')
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            return cls(f, manifest['entries'])
+        except zipfile.BadZipfile:
+            f.close()
+            return None
+
+    def close(self):
+        self.f.close()
+
+    def _get_member(self, name, record):
+        zipi = self.infos.get(name)
+        if zipi is None:
+            return None
+        if zipi.compress_type != zipfile.ZIP_DEFLATED or zipi.CRC != record['crc']:
+            return None
+        return Member(
+            name=name,
+            crc=zipi.CRC,
+            file_size=zipi.file_size,
+            compressed=read_raw_member(self.f, zipi),
+        )
+
+    def get_unchanged_member(self, entry, stat=None, sha256=None):
+        """
+        Gets the previous member for an entry whose stat or content hash hasn't changed.
+        """
+        record = self.manifest.get(entry.name)
+        if record is None:
+            return None
+        if stat is not None and [record['size'], record['mtime_ns']] == list(stat):
+            return self._get_member(entry.name, record)
+        if sha256 is not None and record['sha256'] == sha256:
+            return self._get_member(entry.name, record)
+        return None
+
+
+def build_member(entry, previous=None):
+    """
+    Gets the compressed member for an entry along with its manifest record.
+
+    Returns a tuple of (member, record, reused), where member and record are None if the entry
+    has nothing to write.
+    """
+    stat = entry.stat()
+    if previous is not None and stat is not None:
+        member = previous.get_unchanged_member(entry, stat=stat)
+        if member is not None:
+            record = dict(previous.manifest[entry.name])
+            return member, record, True
+    data = entry.read()
+    if data is None:
+        return None, None, False
+    sha256 = hashlib.sha256(data).hexdigest()
+    member = None
+    if previous is not None:
+        member = previous.get_unchanged_member(entry, sha256=sha256)
+    reused = member is not None
+    if member is None:
+        member = compress(entry.name, data)
+    record = {
+        'size': len(data) if stat is None else stat[0],
+        'mtime_ns': None if stat is None else stat[1],
+        'sha256': sha256,
+        'crc': member.crc,
+    }
+    return member, record, reused
+
+def _build_new_member(entry):
+    # runs in the worker processes, so it mustn't touch the previous archive
+    return build_member(entry)
+
+def build_members_parallel(entries, previous, jobs):
+    """
+    Yields the same results as `build_member` for each entry, in order, deflating on `jobs` processes.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    reused = {}
+    pending = []
+    for entry in entries:
+        # reusing by stat alone is cheap, so it's done here rather than shipped to a worker
+        stat = entry.stat()
+        member = None
+        if previous is not None and stat is not None:
+            member = previous.get_unchanged_member(entry, stat=stat)
+        if member is not None:
+            reused[entry.name] = (member, dict(previous.manifest[entry.name]), True)
+        else:
+            pending.append(entry)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        built = executor.map(_build_new_member, pending, chunksize=64)
+        for entry in entries:
+            if entry.name in reused:
+                yield reused[entry.name]
+                continue
+            member, record, _ = next(built)
+            if member is None:
+                yield member, record, False
+                continue
+            previous_member = None
+            if previous is not None:
+                # prefer the previous bytes for unchanged content, as a serial build would
+                previous_member = previous.get_unchanged_member(entry, sha256=record['sha256'])
+            yield previous_member or member, record, previous_member is not None
+
+def write_zip(f, entries, previous=None, jobs=1):
+    """
+    Writes `entries` to a zip archive in `f`, reusing compressed members from `previous`.
+
+    With `jobs` above one, entries are deflated on that many processes. Returns the manifest for
+    the new archive.
+    """
+    entries = sorted(entries, key=lambda entry: entry.name)
+    if jobs > 1:
+        results = build_members_parallel(entries, previous, jobs)
+    else:
+        results = (build_member(entry, previous) for entry in entries)
+    records = {}
+    reused_count = 0
+    writer = ZipWriter(f)
+    for entry, (member, record, reused) in zip(entries, results):
+        if member is None:
+            continue
+        reused_count += reused
+        writer.write(member)
+        records[entry.name] = record
+    writer.close()
+    logger.info('Reused %d of %d compressed entries from the previous build', reused_count, len(records))
+    return {
+        'version': MANIFEST_VERSION,
+        'digest': get_content_digest(records),
+        'entries': records,
+    }
+
+def get_content_digest(records):
+    """
+    Hashes the names and contents of an archive's entries, given their manifest records.
+
+    Unlike a hash of the archive itself, this doesn't depend on the zlib version that deflated it.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(records):
+        digest.update('{}\0{}\n'.format(name, records[name]['sha256']).encode('utf-8'))
+    return digest.hexdigest()
+
+def is_build_intact(zip_path, manifest_path):
+    """
+    Checks that the archive at `zip_path` exists and holds the contents its manifest records.
+    """
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        with zipfile.ZipFile(zip_path) as zipf:
+            # reading every member also checks its CRC
+            records = {
+                zipi.filename: {'sha256': hashlib.sha256(zipf.read(zipi)).hexdigest()}
+                for zipi in zipf.infolist()
+            }
+    except (IOError, OSError, ValueError, EOFError, zipfile.BadZipfile, zlib.error):
+        return False
+    return manifest.get('version') == MANIFEST_VERSION and manifest.get('digest') == get_content_digest(records)
+
+def get_digest_manifest(manifest):
+    """
+    Strips a build manifest down to what only depends on the archive's contents.
+    """
+    return {
+        'digest': manifest['digest'],
+        'entries': {name: record['sha256'] for name, record in manifest['entries'].items()},
+    }
+
+def get_manifest_path(zip_path):
+    return zip_path + '.manifest.json'
+
+def get_digest_manifest_path(zip_path):
+    return zip_path + '.digest.json'
+
+def write_manifest(path, manifest):
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.write('\n')
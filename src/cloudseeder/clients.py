@@ -0,0 +1,114 @@
+"""
+Implements a process-wide pool of boto3 clients that is reused across warm Lambda invocations.
+
+Creating a client loads its botocore service model and sets up a new connection pool, so resources
+calling `session.client(...)` on every request would pay for both on each invocation. The pool
+keys clients by service, region, credentials and any extra client arguments, evicting the least
+recently used client once it is full. Pooled clients refuse calls made past the deadline of the
+operation calling them (see `cloudseeder.deadline`), and clients created by the process-wide pool
+are attached to the rate limiter in `cloudseeder.ratelimit`.
+"""
+
+import collections
+import threading
+
+import boto3
+
+from . import deadline, ratelimit
+from .util import lru_cache
+
+DEFAULT_POOL_SIZE = 32
+
+
+class ClientPool(object):
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE, rate_limiter=None):
+        self.maxsize = maxsize
+        self.rate_limiter = rate_limiter
+        self._clients = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._clients)
+
+    @staticmethod
+    def get_credentials_key(session):
+        """
+        Gets a hashable representation of the credentials a session currently resolves to.
+        """
+        credentials = session.get_credentials()
+        if credentials is None:
+            return None
+        frozen = credentials.get_frozen_credentials()
+        return (frozen.access_key, frozen.secret_key, frozen.token)
+
+    def _create_client(self, session, service_name, region_name, **kwargs):
+        client = session.client(service_name, region_name=region_name, **kwargs)
+        client.meta.events.register_first(
+            'before-call.*.*', deadline.check_current_deadline, unique_id='cloudseeder-deadline',
+        )
+        if self.rate_limiter is not None:
+            self.rate_limiter.attach(client)
+        return client
+
+    def get_client(self, session, service_name, region_name=None, **kwargs):
+        """
+        Gets a client from the pool, creating it from `session` if there isn't a matching one.
+        """
+        region_name = region_name or session.region_name
+        try:
+            key = (
+                service_name,
+                region_name,
+                self.get_credentials_key(session),
+                tuple(sorted(kwargs.items())),
+            )
+            hash(key)
+        except TypeError:
+            # unhashable client arguments can't be pooled, but should still work
+            return self._create_client(session, service_name, region_name, **kwargs)
+        with self._lock:
+            if key in self._clients:
+                # re-inserting marks the client as most recently used
+                client = self._clients.pop(key)
+                self._clients[key] = client
+                return client
+            # boto3 sessions aren't thread safe, so creation happens under the lock as well
+            client = self._create_client(session, service_name, region_name, **kwargs)
+            self._clients[key] = client
+            while len(self._clients) > self.maxsize:
+                self._clients.popitem(last=False)
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+class PooledSession(object):
+    """
+    Wraps a `boto3.Session` so that clients are taken from a `ClientPool`.
+
+    Everything other than `client` is passed through to the wrapped session.
+    """
+
+    def __init__(self, session, pool):
+        self._session = session
+        self._pool = pool
+
+    def client(self, service_name, region_name=None, **kwargs):
+        return self._pool.get_client(self._session, service_name, region_name=region_name, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+@lru_cache(1)
+def get_client_pool():
+    return ClientPool(rate_limiter=ratelimit.get_rate_limiter())
+
+@lru_cache(1)
+def get_session():
+    """
+    Gets the process-wide session handed to resource methods.
+    """
+    return PooledSession(boto3.Session(), get_client_pool())
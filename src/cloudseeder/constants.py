@@ -1 +1,13 @@
 LAMBDA_ARN_EXPORT = 'CloudSeederLambdaArn'
+CONTINUATION_QUEUE_URL_ENV = 'CLOUDSEEDER_CONTINUATION_QUEUE_URL'
+BATCH_WORKERS_ENV = 'CLOUDSEEDER_BATCH_WORKERS'
+TOPIC_ARN_EXPORT = 'CloudSeederTopicArn'
+RESULT_TABLE_ENV = 'CLOUDSEEDER_RESULT_TABLE'
+LEASE_TABLE_ENV = 'CLOUDSEEDER_LEASE_TABLE'
+INDEXED_TABLE_CREATION_SLOTS_ENV = 'CLOUDSEEDER_INDEXED_TABLE_CREATION_SLOTS'
+METRICS_NAMESPACE_ENV = 'CLOUDSEEDER_METRICS_NAMESPACE'
+PROFILE_RATE_ENV = 'CLOUDSEEDER_PROFILE_RATE'
+PROFILE_RESOURCE_TYPES_ENV = 'CLOUDSEEDER_PROFILE_RESOURCE_TYPES'
+PROFILE_DESTINATION_ENV = 'CLOUDSEEDER_PROFILE_DESTINATION'
+PROFILE_MODE_ENV = 'CLOUDSEEDER_PROFILE_MODE'
+CONTINUATION_KEY = 'CloudSeederContinuation'
@@ -0,0 +1,116 @@
+"""
+Implements continuations for resource operations that outlast a single Lambda invocation.
+
+When a resource method returns `cloudseeder.types.InProgress`, the original event is rescheduled
+with the resource's state attached, and the CloudFormation response is only sent once a later
+`poll` of the resource finishes. By default events are rescheduled through an SQS queue with a
+delivery delay, so no billed time is spent sleeping between polls.
+"""
+
+import json
+import os
+import time
+
+import attr
+from attr.validators import instance_of
+
+from .constants import CONTINUATION_KEY, CONTINUATION_QUEUE_URL_ENV
+from .exceptions import ContinuationException
+
+# CloudFormation gives up on a custom resource after an hour, leave time for the final response
+MAX_CONTINUATION_SECONDS = 55 * 60
+
+# longest delivery delay SQS supports
+MAX_SQS_DELAY_SECONDS = 15 * 60
+
+
+@attr.s(frozen=True)
+class Continuation(object):
+    state = attr.ib(
+        validator=instance_of(dict),
+    )
+    attempt = attr.ib(
+        validator=instance_of(int),
+    )
+    started_at = attr.ib(
+        validator=instance_of((int, float)),
+    )
+
+    @classmethod
+    def from_event(cls, event):
+        """
+        Gets the continuation attached to an event, or None for a fresh CloudFormation event.
+        """
+        obj = event.get(CONTINUATION_KEY)
+        if obj is None:
+            return None
+        return cls(state=obj['State'], attempt=obj['Attempt'], started_at=obj['StartedAt'])
+
+    def to_event(self, event):
+        event = dict(event)
+        event[CONTINUATION_KEY] = {
+            'State': self.state,
+            'Attempt': self.attempt,
+            'StartedAt': self.started_at,
+        }
+        return event
+
+
+class Scheduler(object):
+    def schedule(self, event, delay):
+        """
+        Arranges for `event` to be passed to the handler again after `delay` seconds.
+        """
+        raise NotImplementedError()
+
+
+class SQSScheduler(Scheduler):
+    """
+    Schedules continuations as delayed messages on the queue the function is subscribed to.
+    """
+
+    def __init__(self, queue_url, session):
+        self.queue_url = queue_url
+        self.session = session
+
+    def schedule(self, event, delay):
+        self.session.client('sqs').send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(event, sort_keys=True),
+            DelaySeconds=min(delay, MAX_SQS_DELAY_SECONDS),
+        )
+
+
+def get_scheduler(session):
+    queue_url = os.environ.get(CONTINUATION_QUEUE_URL_ENV)
+    if not queue_url:
+        return None
+    return SQSScheduler(queue_url, session)
+
+def schedule(event, in_progress, previous, session, now=None):
+    """
+    Reschedules `event` so the resource can be polled with the state from `in_progress`.
+
+    `previous` is the continuation the current invocation was handling, if any. The delay is cut
+    short if waiting for all of it would take the operation past `MAX_CONTINUATION_SECONDS`.
+    """
+    now = time.time() if now is None else now
+    started_at = now if previous is None else previous.started_at
+    remaining = int(MAX_CONTINUATION_SECONDS - (now - started_at))
+    if remaining <= 0:
+        raise ContinuationException(
+            'Operation did not finish within {} seconds'.format(MAX_CONTINUATION_SECONDS),
+        )
+    delay = min(in_progress.delay, MAX_SQS_DELAY_SECONDS, remaining)
+    scheduler = get_scheduler(session)
+    if scheduler is None:
+        raise ContinuationException(
+            'Resource returned InProgress, but {} is not set'.format(CONTINUATION_QUEUE_URL_ENV),
+        )
+    continuation = Continuation(
+        state=in_progress.state,
+        attempt=1 if previous is None else previous.attempt + 1,
+        started_at=started_at,
+    )
+    scheduler.schedule(continuation.to_event(event), delay)
+    return continuation
@@ -0,0 +1,170 @@
+"""
+Implements deadlines for resource operations, derived from the time left in the Lambda invocation.
+
+A resource method that runs until Lambda kills the function never gets a response sent, which
+leaves the stack waiting on CloudFormation's own hour-long timeout. Instead, the handler runs
+resource methods in a worker thread against a `Deadline` that ends a safety margin before the
+invocation does, and stops waiting once it passes. What happens next depends on the resource:
+
+- If it recorded its progress with `Deadline.checkpoint`, the operation continues from there
+  through its `poll` method, like after returning `cloudseeder.types.InProgress`.
+- Otherwise the request fails, with enough time left for the response to reach CloudFormation.
+
+The abandoned worker can't be stopped outright, but any AWS call it makes from then on raises
+`DeadlineExceededException`. Resources can find their deadline with `get_current_deadline`, to
+size waiters and timeouts or to check it between steps of their own.
+"""
+
+import contextlib
+import sys
+import threading
+import time
+
+import six
+
+from .exceptions import DeadlineExceededException
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+# time kept back from resources for sending the response or scheduling a continuation
+RESPONSE_MARGIN = 10
+
+_local = threading.local()
+
+
+class Deadline(object):
+    """
+    A point in time by which a resource operation must have finished.
+
+    `expires_at` is the `monotonic` time at which the invocation itself ends, or None if it
+    doesn't (such as outside of Lambda). Resources get `margin` seconds less than that.
+    """
+
+    def __init__(self, expires_at=None, margin=RESPONSE_MARGIN, clock=monotonic):
+        self.expires_at = expires_at
+        self.margin = margin
+        self.cancelled = False
+        self.checkpoint_state = None
+        self._clock = clock
+
+    @classmethod
+    def from_context(cls, context, margin=None, clock=monotonic):
+        """
+        Creates the deadline for an invocation from its Lambda context object, which may be None.
+        """
+        margin = RESPONSE_MARGIN if margin is None else margin
+        if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+            return cls(None, margin, clock)
+        return cls(clock() + context.get_remaining_time_in_millis() / 1000.0, margin, clock)
+
+    def get_invocation_remaining(self):
+        """
+        Gets the seconds left in the whole invocation, or None if it has no time limit.
+        """
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - self._clock(), 0.0)
+
+    def remaining(self):
+        """
+        Gets the seconds left for the resource operation, or None if it has no time limit.
+        """
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - self.margin - self._clock(), 0.0)
+
+    @property
+    def expired(self):
+        return self.cancelled or self.remaining() == 0.0
+
+    def check(self):
+        """
+        Raises `DeadlineExceededException` if the deadline has passed or the operation was abandoned.
+        """
+        if self.cancelled:
+            raise DeadlineExceededException('Operation was abandoned after its deadline passed')
+        if self.expired:
+            raise DeadlineExceededException('Operation deadline passed')
+
+    def cancel(self):
+        self.cancelled = True
+
+    def checkpoint(self, state):
+        """
+        Records the operation's progress, to be passed to `poll` if the deadline passes before it's done.
+        """
+        self.checkpoint_state = dict(state)
+
+    def cap(self, seconds):
+        """
+        Limits a timeout to the time left.
+        """
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+    def get_waiter_config(self, delay):
+        """
+        Gets a boto3 `WaiterConfig` that polls every `delay` seconds and gives up before the deadline.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return {'Delay': delay}
+        return {'Delay': delay, 'MaxAttempts': max(int(remaining // delay), 1)}
+
+    def run(self, func, *args, **kwargs):
+        """
+        Calls `func` in a worker thread, raising `DeadlineExceededException` if it's still running
+        when the deadline passes.
+        """
+        if self.expires_at is None:
+            with activate(self):
+                return func(*args, **kwargs)
+        outcome = {}
+
+        def target():
+            with activate(self):
+                try:
+                    outcome['result'] = func(*args, **kwargs)
+                except BaseException:
+                    outcome['exc_info'] = sys.exc_info()
+
+        worker = threading.Thread(target=target, name='cloudseeder-deadline')
+        # an abandoned worker mustn't keep the process alive outside of Lambda
+        worker.daemon = True
+        worker.start()
+        worker.join(self.remaining())
+        if worker.is_alive():
+            self.cancel()
+            raise DeadlineExceededException(
+                'Operation did not finish in time, {:.1f} seconds were left for the response'.format(
+                    self.get_invocation_remaining(),
+                ),
+            )
+        if 'exc_info' in outcome:
+            six.reraise(*outcome['exc_info'])
+        return outcome['result']
+
+
+@contextlib.contextmanager
+def activate(deadline):
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+def get_current_deadline():
+    """
+    Gets the deadline of the operation running in the current thread, or one without a time limit.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    return Deadline() if deadline is None else deadline
+
+def check_current_deadline(**kwargs):
+    """
+    Fails AWS calls made past the deadline. Registered on `before-call` of every pooled client.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is not None:
+        deadline.check()
@@ -1,24 +1,50 @@
+from __future__ import print_function
+
 import argparse
 import contextlib
+import hashlib
 import io
 import json
-import os.path
+import multiprocessing
+import os
+import platform
 import site
 import sys
 import sysconfig
-import zipfile
 
+import attr
 import six
-from troposphere import Template, GetAtt, Output, Export
-from troposphere.awslambda import Function
+from troposphere import Template, GetAtt, Output, Export, Ref
+from troposphere.awslambda import Environment, EventSourceMapping, Function, LayerVersion
+from troposphere.dynamodb import AttributeDefinition, KeySchema, Table, TimeToLiveSpecification
 from troposphere.iam import Role
+from troposphere.sns import SubscriptionResource, Topic
+from troposphere.sqs import Queue, QueuePolicy, RedrivePolicy
+
+from . import bundle, exceptions, loader, prune, tuning
+from .constants import (
+    CONTINUATION_QUEUE_URL_ENV, LAMBDA_ARN_EXPORT, LEASE_TABLE_ENV, RESULT_TABLE_ENV, TOPIC_ARN_EXPORT,
+)
+
+FUNCTION_TIMEOUT = 300
+DEFAULT_MEMORY_SIZE = 256
+QUEUE_BATCH_SIZE = 25
+QUEUE_BATCHING_WINDOW = 1
+QUEUE_MAX_RECEIVE_COUNT = 5
+
+CODE_DIGEST_METADATA_KEY = 'CloudSeederCodeDigest'
 
-from .constants import LAMBDA_ARN_EXPORT
+# where Lambda extracts layers to, relative to a directory on the Python path
+LAYER_PREFIX = 'python/'
 
 class FunctionLocalCode(Function):
     props = Function.props.copy()
     props['Code'] = (str, True)
 
+class LayerVersionLocalContent(LayerVersion):
+    props = LayerVersion.props.copy()
+    props['Content'] = (str, True)
+
 def is_virtualenv():
     if hasattr(sys, 'real_prefix'):
         # virtualenv
@@ -28,27 +54,290 @@ def is_virtualenv():
         return True
     return False
 
+def get_default_runtime():
+    return 'python2.7' if six.PY2 else 'python3.6'
+
+def get_interpreter_runtime():
+    """
+    Gets the Lambda runtime identifier matching the running interpreter.
+    """
+    return 'python{}.{}'.format(*sys.version_info[:2])
+
+def check_bytecode_runtime(runtime):
+    """
+    Makes sure bytecode compiled by the running interpreter can be loaded by the Lambda `runtime`.
+    """
+    if platform.python_implementation() != 'CPython' or runtime != get_interpreter_runtime():
+        raise exceptions.RuntimeMismatchException(
+            'Bytecode for the {} runtime must be compiled by CPython {}, not {} {}'.format(
+                runtime, runtime[len('python'):],
+                platform.python_implementation(), platform.python_version(),
+            ),
+        )
+
 def get_site_packages():
     # this is only accurate inside a virtualenv! outside, the world is far more complicated.
     return sysconfig.get_path('purelib')
 
 def get_files_recursive(path):
-    for root, _, files in os.walk(path, followlinks=True):
+    # symlinks are followed, but each directory and file is only visited once
+    seen = set([os.path.realpath(path)])
+    for root, dirs, files in os.walk(path, followlinks=True):
+        dirs[:] = [d for d in dirs if os.path.realpath(os.path.join(root, d)) not in seen]
+        seen.update(os.path.realpath(os.path.join(root, d)) for d in dirs)
         for file in files:
+            real_path = os.path.realpath(os.path.join(root, file))
+            if real_path in seen:
+                continue
+            seen.add(real_path)
             yield os.path.join(root, file)
 
-def create_environment_zip(f, site_packages_root):
-    with zipfile.ZipFile(f, mode='w', compression=zipfile.ZIP_DEFLATED) as zipf:
-        for file in get_files_recursive(site_packages_root):
-            if file.endswith('.pyc'):
-                continue
-            with open(file, 'rb') as f:
-                zipi = zipfile.ZipInfo(os.path.relpath(file, site_packages_root))
-                zipi.create_system = 3
-                zipi.external_attr = 0o755 << int(16) # Lambda is particular about permissions
-                zipf.writestr(zipi, f.read(), zipfile.ZIP_DEFLATED)
+def get_resource_index_path():
+    return '/'.join((loader.__package__, loader.RESOURCE_INDEX_NAME))
+
+def create_resource_index():
+    return json.dumps(loader.build_resource_index(), indent=4, sort_keys=True) + '\n'
+
+def get_bundle_entries(site_packages_root, plan=None, bytecode=False):
+    index_path = get_resource_index_path()
+    for file in get_files_recursive(site_packages_root):
+        if file.endswith('.pyc'):
+            continue
+        name = os.path.relpath(file, site_packages_root).replace(os.sep, '/')
+        if name == index_path:
+            # always regenerated below, a leftover copy could be stale
+            continue
+        if plan is not None and plan.is_excluded(name):
+            continue
+        yield bundle.FileEntry(name, file)
+        if bytecode and name.endswith('.py'):
+            yield bundle.BytecodeEntry(bundle.get_bytecode_name(name), file, name)
+    # lets the handler import only the module for the incoming resource type
+    yield bundle.DataEntry(index_path, create_resource_index().encode('utf-8'))
+
+def get_environment_entries(site_packages_root, plan=None, bytecode_runtime=None):
+    """
+    Gets the entries of a bundle of the environment, with bytecode for `bytecode_runtime` if set.
+    """
+    if bytecode_runtime is not None:
+        # checked up front rather than when the entries are first iterated
+        check_bytecode_runtime(bytecode_runtime)
+    return get_bundle_entries(site_packages_root, plan=plan, bytecode=bytecode_runtime is not None)
+
+def create_environment_zip(
+        f, site_packages_root, previous=None, jobs=1, plan=None, bytecode_runtime=None):
+    """
+    Writes the code bundle to `f`, returning its manifest.
+
+    `previous` is an optional `cloudseeder.bundle.PreviousBuild` to reuse compressed entries from,
+    `jobs` is the number of processes to compress entries on, and `plan` is an optional
+    `cloudseeder.prune.PrunePlan` of files to leave out. If `bytecode_runtime` is set, sources are
+    also shipped precompiled for that Lambda runtime, which must match the running interpreter.
+    """
+    entries = get_environment_entries(site_packages_root, plan=plan, bytecode_runtime=bytecode_runtime)
+    return bundle.write_zip(f, entries, previous=previous, jobs=jobs)
+
+def write_bundle(zip_path, entries, incremental=True, jobs=1):
+    """
+    Builds a bundle of `entries` at `zip_path`, incrementally on top of the last build there if
+    possible.
+
+    Next to it are written the build manifest and a digest manifest, which only depends on the
+    bundle's contents.
+    """
+    manifest_path = bundle.get_manifest_path(zip_path)
+    previous = bundle.PreviousBuild.load(zip_path, manifest_path) if incremental else None
+    temp_path = zip_path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            manifest = bundle.write_zip(f, entries, previous=previous, jobs=jobs)
+    finally:
+        if previous is not None:
+            previous.close()
+    getattr(os, 'replace', os.rename)(temp_path, zip_path)
+    bundle.write_manifest(manifest_path, manifest)
+    bundle.write_manifest(bundle.get_digest_manifest_path(zip_path), bundle.get_digest_manifest(manifest))
+    return manifest
+
+def write_environment_zip(
+        zip_path, site_packages_root, incremental=True, jobs=1, plan=None, bytecode_runtime=None):
+    """
+    Builds the code bundle holding the whole environment at `zip_path`.
+    """
+    entries = get_environment_entries(site_packages_root, plan=plan, bytecode_runtime=bytecode_runtime)
+    return write_bundle(zip_path, entries, incremental=incremental, jobs=jobs)
+
+def is_function_code(name):
+    """
+    Checks if a bundle entry belongs in the function itself rather than the dependency layer.
+    """
+    top_level = name.split('/', 1)[0]
+    if prune.is_metadata_directory(top_level):
+        return prune.get_distribution_name(top_level) == loader.__package__
+    return top_level == loader.__package__
+
+def split_layer_entries(entries):
+    """
+    Separates function code from dependencies, moving the latter to where layers are extracted to.
+
+    Returns a tuple of (function entries, layer entries).
+    """
+    function_entries = []
+    layer_entries = []
+    for entry in entries:
+        if is_function_code(entry.name):
+            function_entries.append(entry)
+        else:
+            layer_entries.append(attr.evolve(entry, name=LAYER_PREFIX + entry.name))
+    return function_entries, layer_entries
+
+def get_dependency_key(site_packages_root, plan=None, bytecode_runtime=None):
+    """
+    Hashes the set of installed distributions that go into the dependency layer.
+
+    Build options that change what the layer holds are hashed along with them.
+    """
+    dropped = plan.dropped_distributions if plan is not None else {}
+    distributions = sorted(
+        entry for entry in os.listdir(site_packages_root)
+        if prune.is_metadata_directory(entry)
+        and prune.get_distribution_name(entry) not in dropped
+        and prune.get_distribution_name(entry) != loader.__package__
+    )
+    key = {
+        'distributions': distributions,
+        'services': None if plan is None else sorted(plan.used_services),
+        'bytecode_runtime': bytecode_runtime,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_layer_path(zip_path, dependency_key):
+    return os.path.join(os.path.dirname(zip_path), 'cloudseeder-layer-{}.zip'.format(dependency_key[:16]))
+
+def write_layered_zips(
+        zip_path, site_packages_root, incremental=True, jobs=1, plan=None, bytecode_runtime=None):
+    """
+    Builds the function code at `zip_path` and its dependencies as a separate layer bundle.
+
+    The layer is named after the dependency set it holds, and only built if no intact bundle for
+    the same set exists yet. Returns a tuple of (function manifest, layer path).
+    """
+    entries = get_environment_entries(site_packages_root, plan=plan, bytecode_runtime=bytecode_runtime)
+    function_entries, layer_entries = split_layer_entries(entries)
+    layer_path = get_layer_path(
+        zip_path, get_dependency_key(site_packages_root, plan=plan, bytecode_runtime=bytecode_runtime),
+    )
+    if not (incremental and bundle.is_build_intact(layer_path, bundle.get_manifest_path(layer_path))):
+        write_bundle(layer_path, layer_entries, incremental=False, jobs=jobs)
+    manifest = write_bundle(zip_path, function_entries, incremental=incremental, jobs=jobs)
+    return manifest, layer_path
+
+def get_prune_report_path(zip_path):
+    return zip_path + '.prune.json'
+
+def write_prune_report(path, plan):
+    """
+    Writes what pruning left out of the bundle to `path`, and a summary to stderr.
+    """
+    report = plan.get_report()
+    with open(path, 'w') as f:
+        f.write(json.dumps(report, indent=4, sort_keys=True) + '\n')
+    for name, reason in sorted(report['distributions'].items()):
+        print('Dropped distribution {}: {}'.format(name, reason), file=sys.stderr)
+    print('Dropped service models: {}'.format(
+        ', '.join(report['services']['dropped']) or 'none',
+    ), file=sys.stderr)
+    print('Dropped {} files in total, see {}'.format(sum(report['files'].values()), path), file=sys.stderr)
+    return report
+
+def get_tuning_report_path(template_path):
+    return template_path + '.tuning.json'
 
-def create_template(zip_path):
+def tune_memory_size(recordings_path, report_path, strategy='balanced'):
+    """
+    Replays recorded events to pick the function's memory size, writing the full report to
+    `report_path` and a summary to stderr.
+    """
+    report = tuning.tune(tuning.load_recordings(recordings_path), strategy=strategy)
+    with open(report_path, 'w') as f:
+        f.write(json.dumps(report.to_dict(), indent=4, sort_keys=True) + '\n')
+    print('Peak RSS {:.1f} MB over {} events'.format(
+        report.result.peak_rss_mb, len(report.result.invocations),
+    ), file=sys.stderr)
+    print(report.format_table(), file=sys.stderr)
+    return report.recommended.memory_size
+
+def add_event_queue(template):
+    """
+    Adds the queue the function consumes events and continuations from, and the topic feeding it.
+
+    Returns the queue and the topic.
+    """
+    dead_letter_queue = template.add_resource(Queue(
+        'CloudSeederDeadLetterQueue',
+        MessageRetentionPeriod=14 * 24 * 60 * 60,
+    ))
+    # carries both events delivered through the topic and rescheduled continuations
+    event_queue = template.add_resource(Queue(
+        'CloudSeederEventQueue',
+        # messages must stay hidden for longer than the function can run
+        VisibilityTimeout=FUNCTION_TIMEOUT * 6,
+        RedrivePolicy=RedrivePolicy(
+            deadLetterTargetArn=GetAtt(dead_letter_queue, 'Arn'),
+            maxReceiveCount=QUEUE_MAX_RECEIVE_COUNT,
+        ),
+    ))
+    topic = template.add_resource(Topic('CloudSeederTopic'))
+    template.add_resource(SubscriptionResource(
+        'CloudSeederTopicSubscription',
+        TopicArn=Ref(topic),
+        Protocol='sqs',
+        Endpoint=GetAtt(event_queue, 'Arn'),
+        RawMessageDelivery=True,
+    ))
+    template.add_resource(QueuePolicy(
+        'CloudSeederEventQueuePolicy',
+        Queues=[Ref(event_queue)],
+        PolicyDocument={
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Effect': 'Allow',
+                'Principal': {
+                    'Service': ['sns.amazonaws.com'],
+                },
+                'Action': ['sqs:SendMessage'],
+                'Resource': GetAtt(event_queue, 'Arn'),
+                'Condition': {
+                    'ArnEquals': {'aws:SourceArn': Ref(topic)},
+                },
+            }],
+        },
+    ))
+    return event_queue, topic
+
+def add_expiring_table(template, title):
+    """
+    Adds an on-demand table keyed by `Key`, whose items expire at their `ExpiresAt`.
+    """
+    return template.add_resource(Table(
+        title,
+        AttributeDefinitions=[AttributeDefinition(AttributeName='Key', AttributeType='S')],
+        KeySchema=[KeySchema(AttributeName='Key', KeyType='HASH')],
+        BillingMode='PAY_PER_REQUEST',
+        TimeToLiveSpecification=TimeToLiveSpecification(AttributeName='ExpiresAt', Enabled=True),
+    ))
+
+def create_template(
+        zip_path, runtime=None, code_digest=None, layer_path=None, memory_size=None,
+        event_queue=False, result_table=False, lease_table=False):
+    """
+    Creates the template for the function, as JSON.
+
+    The infrastructure for optional features is only included when asked for: `event_queue` for
+    the event queue and topic (needed for continuations and events delivered through SNS),
+    `result_table` for recording results, and `lease_table` for leases shared between invocations.
+    """
+    runtime = runtime or get_default_runtime()
     template = Template(
         Description='CloudFormation custom resource creator, part of cloudseeder',
     )
@@ -70,34 +359,164 @@ def create_template(zip_path):
             }],
         },
     ))
+    variables = {}
+    queue = topic = None
+    if event_queue:
+        queue, topic = add_event_queue(template)
+        variables[CONTINUATION_QUEUE_URL_ENV] = Ref(queue)
+    if result_table:
+        variables[RESULT_TABLE_ENV] = Ref(add_expiring_table(template, 'CloudSeederResultTable'))
+    if lease_table:
+        # shared by every invocation to limit how many run certain operations at once
+        variables[LEASE_TABLE_ENV] = Ref(add_expiring_table(template, 'CloudSeederLeaseTable'))
+    function_kwargs = {}
+    if variables:
+        function_kwargs['Environment'] = Environment(Variables=variables)
+    if code_digest is not None:
+        # identical code always yields an identical template, so the function isn't updated
+        function_kwargs['Metadata'] = {CODE_DIGEST_METADATA_KEY: code_digest}
+    if layer_path is not None:
+        layer = template.add_resource(LayerVersionLocalContent(
+            'CloudSeederDependencies',
+            Content=os.path.abspath(layer_path),
+            CompatibleRuntimes=[runtime],
+        ))
+        function_kwargs['Layers'] = [Ref(layer)]
     function = template.add_resource(FunctionLocalCode(
         'CloudSeederLambda',
         Code=os.path.abspath(zip_path),
         Handler='cloudseeder.lambda_handler',
-        MemorySize=256,
+        MemorySize=memory_size or DEFAULT_MEMORY_SIZE,
         Role=GetAtt(role, 'Arn'),
-        Timeout=300,
-        Runtime='python2.7' if six.PY2 else 'python3.6',
+        Timeout=FUNCTION_TIMEOUT,
+        Runtime=runtime,
+        **function_kwargs
     ))
     template.add_output(Output(
         LAMBDA_ARN_EXPORT,
         Value=GetAtt(function, 'Arn'),
         Export=Export(LAMBDA_ARN_EXPORT),
     ))
+    if event_queue:
+        template.add_resource(EventSourceMapping(
+            'CloudSeederEventQueueMapping',
+            EventSourceArn=GetAtt(queue, 'Arn'),
+            FunctionName=Ref(function),
+            BatchSize=QUEUE_BATCH_SIZE,
+            MaximumBatchingWindowInSeconds=QUEUE_BATCHING_WINDOW,
+            FunctionResponseTypes=['ReportBatchItemFailures'],
+        ))
+        template.add_output(Output(
+            TOPIC_ARN_EXPORT,
+            Value=Ref(topic),
+            Export=Export(TOPIC_ARN_EXPORT),
+        ))
     return json.dumps(template.to_dict(), indent=4, sort_keys=True) + '\n'
 
 def get_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--code-output', default='cloudseeder-code.zip')
     parser.add_argument('--template-output', default='cloudseeder-template.json')
-    return parser.parse_args()
+    parser.add_argument(
+        '--no-incremental', dest='incremental', action='store_false',
+        help='recompress every file instead of reusing entries from the previous build',
+    )
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help='number of processes to compress the bundle with, 0 for one per CPU',
+    )
+    parser.add_argument(
+        '--runtime', default=get_default_runtime(),
+        help='Lambda runtime to deploy the function with (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--compile', action='store_true',
+        help='ship precompiled bytecode, which requires building with the interpreter matching --runtime',
+    )
+    parser.add_argument(
+        '--layer', action='store_true',
+        help='ship dependencies as a separate Lambda layer, only rebuilt when they change',
+    )
+    parser.add_argument(
+        '--tune-events', metavar='PATH',
+        help='replay the recorded events in PATH to pick the memory size of the function',
+    )
+    parser.add_argument(
+        '--tune-strategy', choices=tuning.STRATEGIES, default='balanced',
+        help='whether to size the function for cost, speed, or a balance of both (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--event-queue', action='store_true',
+        help='create the SQS queue and SNS topic that continuations and queued events go through',
+    )
+    parser.add_argument(
+        '--result-table', action='store_true',
+        help='create a DynamoDB table recording results, so re-delivered events aren\'t run again',
+    )
+    parser.add_argument(
+        '--lease-table', action='store_true',
+        help='create a DynamoDB table for leases shared between invocations, such as for indexed tables',
+    )
+    parser.add_argument(
+        '--no-prune', dest='prune', action='store_false',
+        help='bundle every installed distribution and service model, reachable or not',
+    )
+    parser.add_argument(
+        '--include-distribution', action='append', default=[], metavar='NAME',
+        help='bundle a distribution even if nothing imports it (can be repeated)',
+    )
+    parser.add_argument(
+        '--include-service', action='append', default=[], metavar='NAME',
+        help='bundle the botocore model of a service even if nothing creates a client for it '
+        '(can be repeated)',
+    )
+    args = parser.parse_args(argv)
+    if args.compile:
+        # fail before spending any time on the build
+        try:
+            check_bytecode_runtime(args.runtime)
+        except exceptions.RuntimeMismatchException as ex:
+            parser.error(str(ex))
+    return args
 
 def main(argv=None):
     args = get_args(argv)
-    with open(args.code_output, 'wb') as f:
-        create_environment_zip(f, get_site_packages())
+    jobs = args.jobs or multiprocessing.cpu_count()
+    site_packages_root = get_site_packages()
+    plan = None
+    prune_report_path = get_prune_report_path(args.code_output)
+    if args.prune:
+        plan = prune.create_plan(
+            site_packages_root,
+            include_distributions=args.include_distribution,
+            include_services=args.include_service,
+        )
+        write_prune_report(prune_report_path, plan)
+    elif os.path.exists(prune_report_path):
+        # left by an earlier pruned build, it would describe exclusions this bundle doesn't have
+        os.remove(prune_report_path)
+    build_kwargs = {
+        'incremental': args.incremental,
+        'jobs': jobs,
+        'plan': plan,
+        'bytecode_runtime': args.runtime if args.compile else None,
+    }
+    layer_path = None
+    if args.layer:
+        manifest, layer_path = write_layered_zips(args.code_output, site_packages_root, **build_kwargs)
+    else:
+        manifest = write_environment_zip(args.code_output, site_packages_root, **build_kwargs)
+    memory_size = None
+    if args.tune_events:
+        memory_size = tune_memory_size(
+            args.tune_events, get_tuning_report_path(args.template_output), strategy=args.tune_strategy,
+        )
     with open(args.template_output, 'w', encoding='utf-8') as f:
-        f.write(create_template(args.code_output))
+        f.write(create_template(
+            args.code_output, runtime=args.runtime, code_digest=manifest['digest'], layer_path=layer_path,
+            memory_size=memory_size, event_queue=args.event_queue, result_table=args.result_table,
+            lease_table=args.lease_table,
+        ))
 
 if __name__ == '__main__':
     sys.exit(main())
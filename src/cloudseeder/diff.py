@@ -0,0 +1,93 @@
+"""
+Computes structural differences between the old and new properties of an updated resource.
+
+CloudFormation sends every update of a custom resource, including ones where nothing the resource
+cares about changed (such as when only something it depends on was updated). The diff lets the
+handler skip those updates entirely, lets it replace resources whose changed properties can't be
+updated in place, and lets resources that are updated apply only what changed.
+"""
+
+import attr
+
+# properties that belong to CloudFormation rather than to the resource
+IGNORED_PROPERTIES = frozenset(['ServiceToken'])
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+_MISSING = object()
+
+
+@attr.s(frozen=True)
+class Change(object):
+    """
+    A single difference, at `path` (a tuple of dict keys and list indexes) from the properties.
+
+    `old` is None for added values and `new` is None for removed ones.
+    """
+    kind = attr.ib()
+    path = attr.ib()
+    old = attr.ib(default=None)
+    new = attr.ib(default=None)
+
+    @property
+    def property_name(self):
+        return self.path[0]
+
+
+@attr.s(frozen=True)
+class PropertyDiff(object):
+    changes = attr.ib()
+
+    @property
+    def is_empty(self):
+        return not self.changes
+
+    @property
+    def changed_properties(self):
+        """
+        The names of the top-level properties with any change below them.
+        """
+        return frozenset(change.property_name for change in self.changes)
+
+    def has_changed(self, name):
+        return name in self.changed_properties
+
+    def requires_replacement(self, replacement_properties):
+        return not self.changed_properties.isdisjoint(replacement_properties)
+
+    def get_changes(self, name):
+        return [change for change in self.changes if change.property_name == name]
+
+
+def _diff_values(old, new, path, changes):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old).union(new), key=str):
+            _diff_values(old.get(key, _MISSING), new.get(key, _MISSING), path + (key,), changes)
+    elif isinstance(old, list) and isinstance(new, list):
+        for index in range(max(len(old), len(new))):
+            _diff_values(
+                old[index] if index < len(old) else _MISSING,
+                new[index] if index < len(new) else _MISSING,
+                path + (index,),
+                changes,
+            )
+    elif old is _MISSING:
+        changes.append(Change(ADDED, path, new=new))
+    elif new is _MISSING:
+        changes.append(Change(REMOVED, path, old=old))
+    elif old != new:
+        changes.append(Change(MODIFIED, path, old=old, new=new))
+
+def diff_properties(old, new):
+    """
+    Diffs two resource property dicts, as sent in `OldResourceProperties` and `ResourceProperties`.
+
+    Lists are compared by position, so inserting an element shows up as changes to every element
+    after it.
+    """
+    changes = []
+    for name in sorted(set(old).union(new) - IGNORED_PROPERTIES):
+        _diff_values(old.get(name, _MISSING), new.get(name, _MISSING), (name,), changes)
+    return PropertyDiff(tuple(changes))
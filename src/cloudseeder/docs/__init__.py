@@ -1,10 +1,25 @@
+"""
+Builds the static documentation site for the custom resources, one page per resource plus an index.
+
+Every build leaves a manifest in the output directory recording a hash of each resource's class
+source and docstring, including the classes it inherits props from. On the next build, pages whose
+hash (and the templates and this module) haven't changed are left as they are, and only new or
+changed resources are rendered, spread over a process pool.
+"""
+
+from __future__ import print_function
+
+import argparse
 import collections
-import importlib
+import hashlib
+import inspect
 import json
+import multiprocessing
+import os
 import pkgutil
+import re
 import sys
 import textwrap
-import types
 import uuid
 
 import jinja2
@@ -15,6 +30,15 @@ from pygments.formatters import HtmlFormatter
 import troposphere
 
 from .. import loader
+from ..util import lru_cache
+
+MANIFEST_NAME = '.manifest.json'
+MANIFEST_VERSION = 1
+INDEX_NAME = 'index.html'
+TEMPLATE_NAMES = ('index.html', 'resource.html')
+
+# matches the JSON encoding of a `uuid.uuid4` placeholder
+PLACEHOLDER_PATTERN = re.compile(r'"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"')
 
 def type_to_name(obj):
     typemap = {
@@ -41,9 +65,12 @@ class PlaceholderEncoder(json.JSONEncoder):
 
     def encode(self, obj):
         result = super(PlaceholderEncoder, self).encode(obj)
-        for placeholder, replacement in self._placeholder_cache.items():
-            result = result.replace(placeholder, replacement)
-        return result
+        if not self._placeholder_cache:
+            return result
+        # a single pass over the document, rather than one per placeholder
+        return PLACEHOLDER_PATTERN.sub(
+            lambda match: self._placeholder_cache.get(match.group(0), match.group(0)), result,
+        )
 
     def default(self, obj):
         placeholder = str(uuid.uuid4())
@@ -57,38 +84,197 @@ def to_highlighted_json(obj):
     return highlighted
 
 
-def main(argv=None):
-
-    env = jinja2.Environment(
+@lru_cache(1)
+def get_environment():
+    return jinja2.Environment(
         loader=jinja2.PackageLoader(__name__),
         autoescape=jinja2.select_autoescape(['html']),
     )
-    template = env.get_template('resource.html')
-
-    for resource in loader.load_custom_resources():
-        print(template.render({
-            'title': resource.resource_type,
-            'summary': markdown.markdown(textwrap.dedent(resource.__doc__ or '')),
-            'json_syntax': to_highlighted_json(collections.OrderedDict([
-                ('Type', resource.resource_type),
-                ('Properties', collections.OrderedDict([
-                    (prop_name, prop_type)
-                    for prop_name, (prop_type, required)
-                    in sorted(resource.props.items(), key=lambda x: x[0])
-                ])),
+
+def render_resource_page(resource):
+    """
+    Renders the page for a resource class. Runs in the worker processes of a parallel build.
+    """
+    sorted_props = sorted(resource.props.items(), key=lambda x: x[0])
+    return get_environment().get_template('resource.html').render({
+        'title': resource.resource_type,
+        'summary': markdown.markdown(textwrap.dedent(resource.__doc__ or '')),
+        'json_syntax': to_highlighted_json(collections.OrderedDict([
+            ('Type', resource.resource_type),
+            ('Properties', collections.OrderedDict([
+                (prop_name, prop_type) for prop_name, (prop_type, required) in sorted_props
             ])),
-            'properties': [
-                {
-                    'name': prop_name,
-                    'type': type_to_name(prop_type),
-                    'required': required,
-                }
-                for prop_name, (prop_type, required)
-                in sorted(resource.props.items(), key=lambda x: x[0])
-            ],
-        }))
+        ])),
+        'properties': [
+            {
+                'name': prop_name,
+                'type': type_to_name(prop_type),
+                'required': required,
+            }
+            for prop_name, (prop_type, required) in sorted_props
+        ],
+    })
+
+def render_index(pages):
+    """
+    Renders the index page, given the manifest records of every resource page.
+    """
+    return get_environment().get_template('index.html').render({
+        'resources': [
+            {'title': resource_type, 'path': pages[resource_type]['path']}
+            for resource_type in sorted(pages)
+        ],
+    })
+
+
+def get_page_name(resource_type):
+    return resource_type.replace('::', '-') + '.html'
+
+def get_class_sources(resource):
+    """
+    Gets the sources of a resource class, the classes it inherits from and its metaclass, all of
+    which can add to its props.
+    """
+    classes = [cls for cls in inspect.getmro(resource) if cls is not object]
+    if type(resource) is not type:
+        classes.append(type(resource))
+    return [inspect.getsource(cls) for cls in classes]
+
+def get_resource_fingerprint(resource):
+    """
+    Hashes the sources and docstring of a resource class, or returns None if a source isn't available.
+    """
+    try:
+        sources = get_class_sources(resource)
+    except (IOError, OSError, TypeError):
+        return None
+    digest = hashlib.sha256()
+    parts = [resource.__module__, resource.__name__, resource.resource_type, resource.__doc__ or '']
+    for part in parts + sources:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
 
+def get_templates_fingerprint():
+    """
+    Hashes the page templates and this module's source, since a change to either affects every page.
+    """
+    digest = hashlib.sha256()
+    for name in TEMPLATE_NAMES:
+        digest.update(name.encode('utf-8') + b'\0')
+        digest.update(pkgutil.get_data(__name__, 'templates/' + name))
+    digest.update(b'\0' + inspect.getsource(sys.modules[__name__]).encode('utf-8'))
+    return digest.hexdigest()
 
+def load_manifest(path):
+    """
+    Reads the manifest of the previous build, or returns None if it's missing or unusable.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
 
+def write_manifest(path, manifest):
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.write('\n')
 
+def write_page(path, html):
+    with open(path, 'wb') as f:
+        f.write(html.encode('utf-8'))
 
+def render_pages(resources, jobs):
+    """
+    Yields the rendered page for each resource, in order, rendering on `jobs` processes.
+    """
+    if jobs <= 1 or len(resources) <= 1:
+        for resource in resources:
+            yield render_resource_page(resource)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(resources))) as executor:
+        for html in executor.map(render_resource_page, resources):
+            yield html
+
+def build(output_dir, resources=None, incremental=True, jobs=1):
+    """
+    Writes a page for each resource class and an index to `output_dir`, defaulting to every
+    resource in `cloudseeder.resources`.
+
+    With `incremental`, pages of resources that haven't changed since the last build are kept.
+    Returns the resource types whose pages were rendered.
+    """
+    if resources is None:
+        resources = loader.load_custom_resources()
+    resources = sorted(resources, key=lambda resource: resource.resource_type)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    templates = get_templates_fingerprint()
+    previous = load_manifest(manifest_path) if incremental else None
+    if previous is None or previous.get('templates') != templates:
+        previous = {'pages': {}}
+
+    pages = {}
+    pending = []
+    for resource in resources:
+        record = {
+            'path': get_page_name(resource.resource_type),
+            'fingerprint': get_resource_fingerprint(resource),
+        }
+        pages[resource.resource_type] = record
+        if (
+            record['fingerprint'] is not None
+            and previous['pages'].get(resource.resource_type) == record
+            and os.path.exists(os.path.join(output_dir, record['path']))
+        ):
+            continue
+        pending.append(resource)
+    for resource, html in zip(pending, render_pages(pending, jobs)):
+        write_page(os.path.join(output_dir, pages[resource.resource_type]['path']), html)
+
+    current_paths = set(record['path'] for record in pages.values())
+    for resource_type, record in previous['pages'].items():
+        path = os.path.join(output_dir, record['path'])
+        if record['path'] not in current_paths and os.path.exists(path):
+            os.remove(path)
+    write_page(os.path.join(output_dir, INDEX_NAME), render_index(pages))
+    write_manifest(manifest_path, {
+        'version': MANIFEST_VERSION,
+        'templates': templates,
+        'pages': pages,
+    })
+    return [resource.resource_type for resource in pending]
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output-dir', default='cloudseeder-docs')
+    parser.add_argument(
+        '--no-incremental', dest='incremental', action='store_false',
+        help='render every page instead of keeping the unchanged ones from the previous build',
+    )
+    parser.add_argument(
+        '--jobs', type=int, default=0,
+        help='number of processes to render pages with, 0 for one per CPU (default: %(default)s)',
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = get_args(argv)
+    resources = list(loader.load_custom_resources())
+    rendered = build(
+        args.output_dir,
+        resources,
+        incremental=args.incremental,
+        jobs=args.jobs or multiprocessing.cpu_count(),
+    )
+    print('Rendered {} of {} resource pages to {}'.format(
+        len(rendered), len(resources), args.output_dir,
+    ), file=sys.stderr)
@@ -4,6 +4,9 @@ class CloudSeederException(Exception):
 class EventSerializationException(CloudSeederException):
     pass
 
+class ResponseTooLargeException(EventSerializationException):
+    pass
+
 class InvalidReturnTypeException(CloudSeederException):
     pass
 
@@ -12,3 +15,27 @@ class CloudFormationReportingException(CloudSeederException):
 
 class UnknownResourceTypeException(CloudSeederException):
     pass
+
+class ContinuationException(CloudSeederException):
+    pass
+
+class BatchProcessingException(CloudSeederException):
+    pass
+
+class RuntimeMismatchException(CloudSeederException):
+    pass
+
+class TuningException(CloudSeederException):
+    pass
+
+class ResourceOperationException(CloudSeederException):
+    """
+    Raised when a resource operation fails; `physical_resource_id` is set if the resource was
+    created regardless, so the stack knows what to delete.
+    """
+    def __init__(self, message, physical_resource_id=None):
+        super(ResourceOperationException, self).__init__(message)
+        self.physical_resource_id = physical_resource_id
+
+class DeadlineExceededException(CloudSeederException):
+    pass
@@ -1,17 +1,21 @@
 """
 Implements the CloudFormation custom resource handler as an AWS Lambda function.
+
+Importing this module only loads what parsing an event needs. boto3, requests and troposphere,
+along with the modules built on them, are imported by the code paths that use them.
 """
 
 import functools
 import hashlib
 import json
 import logging
-import requests
+import os
 
-import boto3
+import attr
 
-from . import exceptions, loader, types
-from .util import get_reason_from_exception, lru_cache
+from . import deadline, exceptions, metrics, types
+from .constants import CONTINUATION_KEY, PROFILE_RATE_ENV, RESULT_TABLE_ENV
+from .util import get_reason_from_exception, is_coroutine_function, lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,19 +24,77 @@ def get_custom_resources_mapping():
     """
     Gets all custom resources and maps them into a dict by their resource type.
     """
+    from . import loader
     return {cls.resource_type: cls for cls in loader.load_custom_resources()}
 
-def send_response_data(response_url, response):
+@lru_cache(1)
+def get_resource_index():
+    """
+    Gets the precomputed resource type index shipped in the bundle, if any.
+    """
+    from . import loader
+    return loader.load_resource_index() or {}
+
+def get_indexed_resource_class(resource_type):
+    """
+    Imports only the module that the resource index names for `resource_type`.
+
+    Returns None when the type isn't indexed or the index entry no longer resolves to a matching
+    custom resource class, in which case the caller should fall back to a full scan.
+    """
+    reference = get_resource_index().get(resource_type)
+    if reference is None:
+        return None
+    from . import loader
+    try:
+        cls = loader.import_resource_class(reference)
+    except (ImportError, AttributeError):
+        logger.warning('Resource index entry %s for %s is stale', reference, resource_type)
+        return None
+    if not loader.is_custom_resource(cls) or cls.resource_type != resource_type:
+        logger.warning('Resource index entry %s for %s is stale', reference, resource_type)
+        return None
+    return cls
+
+# leaves room for the other response fields within CloudFormation's size limit
+MAX_FAILURE_REASON_LENGTH = 1024
+
+def encode_response(response):
+    """
+    Encodes a response, replacing it with a failure if it can't be sent as is.
+
+    Returns the response that will actually be sent along with its encoded body.
+    """
+    try:
+        return response, response.encode()
+    except (exceptions.EventSerializationException, TypeError, ValueError) as ex:
+        logger.exception('Could not encode response, failing request')
+        failed_response = attr.evolve(
+            response,
+            status=False,
+            reason=get_reason_from_exception(ex)[:MAX_FAILURE_REASON_LENGTH],
+            data={},
+            no_echo=False,
+        )
+        return failed_response, failed_response.encode()
+
+def send_response_data(response_url, response, retry_policy=None):
+    import requests
+    from . import transport
+    response, body = encode_response(response)
     try:
-        cfn_response = response.to_dict()
-        http_response = requests.put(response_url, json=cfn_response)
-        http_response.raise_for_status()
+        transport.put(
+            response_url,
+            body,
+            headers={'Content-Type': 'application/json'},
+            retry_policy=retry_policy,
+        )
     except requests.exceptions.RequestException as ex:
         raise exceptions.CloudFormationReportingException(
             'Could not send response to Cloudformation. '
             '(Caused by: {})'.format(get_reason_from_exception(ex))
         )
-    return cfn_response
+    return response.to_dict()
 
 def create_canonical_request_id(request):
     if hasattr(request, 'physical_resource_id'):
@@ -71,6 +133,9 @@ def unpack_response(request, return_value):
     return response
 
 def get_resource_class(resource_type):
+    indexed_cls = get_indexed_resource_class(resource_type)
+    if indexed_cls is not None:
+        return indexed_cls
     resources = get_custom_resources_mapping()
     if resource_type not in resources:
         raise exceptions.UnknownResourceTypeException(
@@ -78,19 +143,240 @@ def get_resource_class(resource_type):
         )
     return resources[resource_type]
 
-def handler(event, _context=None):
-    request = types.Request.from_dict(event)
+def configure_rate_limits(resource_cls):
+    from . import ratelimit
+    ratelimit.get_rate_limiter().configure_resource(resource_cls)
+
+def construct_resource(resource_cls, request):
+    from . import schema
+    return schema.construct_resource(resource_cls, request.logical_resource_id, request.resource_properties)
+
+def get_lifecycle_method(resource, request):
+    """
+    Picks the resource method for a fresh request, replacing the resource if an update needs it.
+    """
+    if isinstance(request, types.Update) and \
+            request.property_diff.requires_replacement(resource.replacement_properties):
+        return resource.create
+    return getattr(resource, request.request_type.lower())
+
+def invoke_resource(resource, request, session, pending):
+    if pending is None:
+        method, args = get_lifecycle_method(resource, request), ()
+    else:
+        method, args = resource.poll, (pending.state,)
+    if is_coroutine_function(method):
+        # only imported for resources using it, as it doesn't even compile before Python 3.5
+        from . import aio
+        return aio.run(method(request, aio.AsyncSession(session), *args))
+    return method(request, session, *args)
+
+def get_session():
+    from . import clients
+    return clients.get_session()
+
+def get_continuation(event):
+    """
+    Gets the continuation attached to an event, only importing continuations for events that have one.
+    """
+    if CONTINUATION_KEY not in event:
+        return None
+    from . import continuation
+    return continuation.Continuation.from_event(event)
+
+def schedule_continuation(event, in_progress, pending, session):
+    from . import continuation
+    return continuation.schedule(event, in_progress, pending, session)
+
+def get_result_store(session):
+    """
+    Gets the result store, or None if none is configured, only importing it when it is.
+    """
+    if not os.environ.get(RESULT_TABLE_ENV):
+        return None
+    from . import store
+    return store.get_result_store(session)
+
+def get_result_key(request, result_store):
+    if result_store is None:
+        return None
+    from . import store
+    return store.get_result_key(request)
+
+def get_unchanged_response(request, result_store):
+    """
+    Answers an update that changes no properties without calling the resource.
+
+    The data of the last response recorded for the resource is sent again if there's a result
+    store holding one; otherwise the response has no data. Returns None if the update changes
+    something.
+    """
+    if not isinstance(request, types.Update) or not request.property_diff.is_empty:
+        return None
+    if result_store is not None:
+        from . import store
+        resource_key = store.get_resource_key(request, request.physical_resource_id)
+        record = call_result_store(result_store, 'get', resource_key)
+        if record is not None and record.is_replayable:
+            recorded = types.Response.from_dict(record.response)
+            return types.Response.from_request(request, status=True, data=recorded.data, no_echo=recorded.no_echo)
+    return types.Response.from_request(request, status=True)
+
+def record_resource_response(result_store, request, response):
+    if result_store is None or response.status != 'SUCCESS' or isinstance(request, types.Delete):
+        return
+    from . import store
+    resource_key = store.get_resource_key(request, response.physical_resource_id)
+    call_result_store(
+        result_store, 'complete', resource_key, store.to_stored_response(response), ttl=store.RESOURCE_TTL,
+    )
+
+def record_request_response(result_store, result_key, response):
+    if result_store is None:
+        return
+    from . import store
+    call_result_store(result_store, 'complete', result_key, store.to_stored_response(response))
+
+def call_result_store(result_store, method, *args, **kwargs):
+    """
+    Calls a result store method, carrying on without it if the store is unavailable.
+    """
+    if result_store is None:
+        return None
     try:
-        resource_cls = get_resource_class(request.resource_type)
-        resource = resource_cls.from_dict(request.logical_resource_id, request.resource_properties)
-        resource_method = getattr(resource, request.request_type.lower())
-        response = unpack_response(request, resource_method(request, boto3.Session()))
+        return getattr(result_store, method)(*args, **kwargs)
+    except Exception:
+        logger.exception('Result store %s failed, continuing without it', method)
+        return None
+
+def get_response_retry_policy(event_deadline):
+    """
+    Limits retries of the response to the time left in the invocation.
+    """
+    from . import transport
+    remaining = event_deadline.get_invocation_remaining()
+    if remaining is None:
+        return transport.DEFAULT_RETRY_POLICY
+    return attr.evolve(
+        transport.DEFAULT_RETRY_POLICY,
+        total_timeout=min(transport.DEFAULT_RETRY_POLICY.total_timeout, remaining),
+    )
+
+def run_resource(resource, request, session, pending, event_deadline):
+    """
+    Invokes the resource under the deadline, continuing from its checkpoint if it runs out of time.
+
+    The resource is profiled if profiling is enabled and this operation is sampled, unless setting
+    up the profile fails, in which case it runs without.
+    """
+    capture = None
+    if os.environ.get(PROFILE_RATE_ENV):
+        try:
+            from . import profiling
+            capture = profiling.start_capture(request, session)
+        except Exception:
+            logger.exception('Could not set up profiling, running %s without it', request.logical_resource_id)
+    func = invoke_resource if capture is None else functools.partial(capture.run, invoke_resource)
+    try:
+        return event_deadline.run(func, resource, request, session, pending)
+    except exceptions.DeadlineExceededException:
+        if event_deadline.checkpoint_state is None:
+            raise
+        logger.warning('Deadline passed, continuing %s from its checkpoint', request.logical_resource_id)
+        return types.InProgress(state=event_deadline.checkpoint_state, delay=0)
+    finally:
+        if capture is not None:
+            capture.export()
+
+def handle_event(event, context=None):
+    """
+    Handles a single CloudFormation event, or a continuation of one.
+
+    `context` is the Lambda context object, which gives the time left for the invocation.
+
+    Returns the response sent to CloudFormation, or None if the operation was rescheduled or is
+    already being handled by another invocation. Emits the event's metrics either way.
+    """
+    recorder = metrics.Recorder()
+    try:
+        return _handle_event(event, context, recorder)
+    except Exception:
+        recorder.outcome = metrics.ERROR
+        raise
+    finally:
+        recorder.emit()
+
+def _handle_event(event, context, recorder):
+    with recorder.time(metrics.PARSE):
+        request = types.Request.from_dict(event)
+        pending = get_continuation(event)
+    recorder.set_request(request.resource_type, request.request_type)
+    event_deadline = deadline.Deadline.from_context(context)
+    retry_policy = get_response_retry_policy(event_deadline)
+    session = get_session()
+    result_store = get_result_store(session)
+    result_key = get_result_key(request, result_store)
+    if pending is None:
+        # continuations already hold the claim made by the invocation that started them
+        record = call_result_store(result_store, 'begin', result_key)
+        if record is not None and record.is_complete and not record.is_replayable:
+            logger.info('Recorded response for %s left out NoEcho data, running the resource again', result_key)
+            record = None
+        if record is not None and record.is_complete:
+            logger.info('Re-sending recorded response for %s', result_key)
+            recorder.outcome = metrics.REPLAYED
+            with recorder.time(metrics.RESPOND):
+                return send_response_data(
+                    request.response_url, types.Response.from_dict(record.response), retry_policy=retry_policy,
+                )
+        if record is not None:
+            logger.info('%s is already in progress, ignoring re-delivery', result_key)
+            recorder.outcome = metrics.DUPLICATE
+            return None
+    try:
+        response = None if pending is not None else get_unchanged_response(request, result_store)
+        if response is not None:
+            logger.info('No properties of %s changed, skipping update', request.logical_resource_id)
+            recorder.outcome = metrics.UNCHANGED
+        else:
+            with recorder.time(metrics.LOOKUP):
+                resource_cls = get_resource_class(request.resource_type)
+                configure_rate_limits(resource_cls)
+            with recorder.time(metrics.CONSTRUCT):
+                resource = construct_resource(resource_cls, request)
+            with recorder.time(metrics.INVOKE):
+                result = run_resource(resource, request, session, pending, event_deadline)
+            if isinstance(result, types.InProgress):
+                scheduled = schedule_continuation(event, result, pending, session)
+                logger.info('Operation still in progress, scheduled attempt %d', scheduled.attempt)
+                if result_store is not None:
+                    from . import store
+                    call_result_store(result_store, 'keep_alive', result_key, result.delay + store.IN_PROGRESS_TTL)
+                recorder.outcome = metrics.IN_PROGRESS
+                return None
+            response = unpack_response(request, result)
+            record_resource_response(result_store, request, response)
+            recorder.outcome = metrics.SUCCESS if response.status == 'SUCCESS' else metrics.FAILED
     except Exception as ex:
         logger.exception('Caught exception, failing request')
+        recorder.outcome = metrics.FAILED
         response = types.Response.from_request(
             request,
             status=False,
             reason=get_reason_from_exception(ex),
-            physical_resource_id=create_canonical_request_id(request),
+            physical_resource_id=getattr(ex, 'physical_resource_id', None) or create_canonical_request_id(request),
+        )
+    # recorded before sending, so a re-delivery after a failed PUT re-sends the same response
+    record_request_response(result_store, result_key, response)
+    with recorder.time(metrics.RESPOND):
+        return send_response_data(
+            request.response_url, response, retry_policy=get_response_retry_policy(event_deadline),
         )
-    return send_response_data(request.response_url, response)
+
+def handler(event, context=None):
+    # CloudFormation events never have records, so batch handling is only imported for envelopes
+    if 'Records' in event:
+        from . import batch
+        if batch.is_batch_event(event):
+            return batch.process_batch(event, functools.partial(handle_event, context=context))
+    return handle_event(event, context)
@@ -0,0 +1,154 @@
+"""
+Implements leases shared between invocations, for limiting how many run an operation at once.
+
+A lease name has a fixed number of slots, each of which can be held by one owner until it's
+released or its TTL runs out, so a lease held by a crashed invocation frees itself eventually.
+Owners holding a slot across continuations renew it on every attempt.
+"""
+
+import os
+import threading
+import time
+
+import attr
+
+from .constants import LEASE_TABLE_ENV
+from .util import lru_cache
+
+# how long a slot is held without being renewed
+DEFAULT_LEASE_TTL = 5 * 60
+
+
+@attr.s(frozen=True)
+class Lease(object):
+    name = attr.ib()
+    slot = attr.ib()
+    owner = attr.ib()
+
+    @property
+    def key(self):
+        return 'lease#{}#{}'.format(self.name, self.slot)
+
+    def to_dict(self):
+        return attr.asdict(self)
+
+    @classmethod
+    def from_dict(cls, obj):
+        return cls(**obj)
+
+
+class LeaseManager(object):
+    def acquire(self, name, owner, slots=1, ttl=DEFAULT_LEASE_TTL, now=None):
+        """
+        Takes one of the `slots` of lease `name` for `owner`.
+
+        Returns the `Lease`, or None if every slot is held by someone else.
+        """
+        now = time.time() if now is None else now
+        for slot in range(slots):
+            lease = Lease(name, slot, owner)
+            if self.renew(lease, ttl=ttl, now=now):
+                return lease
+        return None
+
+    def renew(self, lease, ttl=DEFAULT_LEASE_TTL, now=None):
+        """
+        Holds the slot of `lease` for another `ttl` seconds, taking it again if it has expired.
+
+        Returns False if the slot has been taken by another owner in the meantime.
+        """
+        raise NotImplementedError()
+
+    def release(self, lease):
+        """
+        Frees the slot of `lease`, unless it has been taken by another owner in the meantime.
+        """
+        raise NotImplementedError()
+
+
+class DynamoDBLeaseManager(LeaseManager):
+    """
+    Keeps leases in a DynamoDB table with a string hash key named `Key`, using conditional writes.
+
+    `ExpiresAt` should be configured as the table's TTL attribute. Since DynamoDB deletes expired
+    items lazily, expiry is also checked when taking a slot.
+    """
+
+    def __init__(self, table_name, session):
+        self.table_name = table_name
+        self.session = session
+
+    @property
+    def client(self):
+        return self.session.client('dynamodb')
+
+    def renew(self, lease, ttl=DEFAULT_LEASE_TTL, now=None):
+        now = time.time() if now is None else now
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'Key': {'S': lease.key},
+                    'Owner': {'S': lease.owner},
+                    'ExpiresAt': {'N': str(int(now + ttl))},
+                },
+                ConditionExpression='attribute_not_exists(#key) OR #expires_at < :now OR #owner = :owner',
+                ExpressionAttributeNames={'#key': 'Key', '#expires_at': 'ExpiresAt', '#owner': 'Owner'},
+                ExpressionAttributeValues={
+                    ':now': {'N': str(int(now))},
+                    ':owner': {'S': lease.owner},
+                },
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def release(self, lease):
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={'Key': {'S': lease.key}},
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'Owner'},
+                ExpressionAttributeValues={':owner': {'S': lease.owner}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+class MemoryLeaseManager(LeaseManager):
+    """
+    Keeps leases in memory, as a stand-in for DynamoDB in tests and when no lease table is set up.
+
+    Only invocations sharing a process are coordinated.
+    """
+
+    def __init__(self):
+        self._holders = {}
+        self._lock = threading.Lock()
+
+    def renew(self, lease, ttl=DEFAULT_LEASE_TTL, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            holder = self._holders.get(lease.key)
+            if holder is not None and holder[0] != lease.owner and holder[1] >= now:
+                return False
+            self._holders[lease.key] = (lease.owner, now + ttl)
+        return True
+
+    def release(self, lease):
+        with self._lock:
+            holder = self._holders.get(lease.key)
+            if holder is not None and holder[0] == lease.owner:
+                del self._holders[lease.key]
+
+
+@lru_cache(1)
+def get_memory_lease_manager():
+    return MemoryLeaseManager()
+
+def get_lease_manager(session):
+    table_name = os.environ.get(LEASE_TABLE_ENV)
+    if not table_name:
+        return get_memory_lease_manager()
+    return DynamoDBLeaseManager(table_name, session)
@@ -4,10 +4,13 @@ Implements logic for loading custom resource classes from `cloudseeder.resources
 
 import importlib
 import inspect
+import json
 import pkgutil
 
 from . import resources
 
+RESOURCE_INDEX_NAME = 'resource_index.json'
+
 
 def get_classes_from_module(module):
     """
@@ -21,6 +24,12 @@ def get_classes_from_module(module):
             continue
         yield value
 
+def is_custom_resource(obj):
+    """
+    Checks if an object is a concrete subclass of `cloudseeder.resources.Resource`.
+    """
+    return inspect.isclass(obj) and issubclass(obj, resources.Resource) and obj != resources.Resource
+
 def load_custom_resources(parent_module=None):
     """
     Yields all subclasses of `cloudseeder.resources.Resource` found under the `parent_module`.
@@ -30,5 +39,37 @@ def load_custom_resources(parent_module=None):
     for _, name, _ in pkgutil.walk_packages(parent_module.__path__, parent_module.__name__ + '.'):
         module = importlib.import_module(name)
         for obj in get_classes_from_module(module):
-            if issubclass(obj, resources.Resource) and obj != resources.Resource:
+            if is_custom_resource(obj):
                 yield obj
+
+def build_resource_index(parent_module=None):
+    """
+    Maps every custom resource type under `parent_module` to a `module:Class` reference.
+    """
+    return {
+        cls.resource_type: '{}:{}'.format(cls.__module__, cls.__name__)
+        for cls in load_custom_resources(parent_module)
+    }
+
+def load_resource_index():
+    """
+    Reads the resource index generated by `cloudseeder.deploy`, or None if the bundle has none.
+    """
+    try:
+        data = pkgutil.get_data(__package__, RESOURCE_INDEX_NAME)
+    except (IOError, OSError):
+        return None
+    if data is None:
+        return None
+    try:
+        index = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+    return index if isinstance(index, dict) else None
+
+def import_resource_class(reference):
+    """
+    Imports a class from a `module:Class` reference, as found in the resource index.
+    """
+    module_name, _, class_name = reference.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
@@ -0,0 +1,170 @@
+"""
+Implements per-phase latency metrics for handled events, in CloudWatch Embedded Metric Format.
+
+The handler times each phase of an event with a `Recorder` and emits one EMF document per event
+when it's done. Lambda sends whatever the function writes to stdout to CloudWatch Logs, which
+turns EMF documents into metrics without any API calls, dimensioned by resource type, request type
+and outcome. Phases that didn't run, such as when an unchanged update skips the resource, are left
+out of the document.
+
+Where documents go is up to the sink set with `set_sink`, such as a `ListSink` for tests.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from .constants import METRICS_NAMESPACE_ENV
+
+logger = logging.getLogger(__name__)
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+DEFAULT_NAMESPACE = 'CloudSeeder'
+
+# phases of handling an event, in the order they run
+PARSE = 'Parse'
+LOOKUP = 'Lookup'
+CONSTRUCT = 'Construct'
+INVOKE = 'Invoke'
+RESPOND = 'Respond'
+PHASES = (PARSE, LOOKUP, CONSTRUCT, INVOKE, RESPOND)
+
+# outcomes of handling an event
+SUCCESS = 'Success'
+FAILED = 'Failed'
+IN_PROGRESS = 'InProgress'
+UNCHANGED = 'Unchanged'
+REPLAYED = 'Replayed'
+DUPLICATE = 'Duplicate'
+ERROR = 'Error'
+
+UNKNOWN = 'Unknown'
+
+DIMENSIONS = [
+    ['ResourceType', 'RequestType', 'Outcome'],
+    ['ResourceType'],
+]
+
+_cold_start = True
+_cold_start_lock = threading.Lock()
+
+
+class StdoutSink(object):
+    """
+    Writes documents to stdout, one per line, for CloudWatch Logs to extract the metrics from.
+    """
+
+    def emit(self, document):
+        sys.stdout.write(json.dumps(document, sort_keys=True) + '\n')
+        sys.stdout.flush()
+
+
+class ListSink(object):
+    """
+    Keeps documents in `documents`.
+    """
+
+    def __init__(self):
+        self.documents = []
+
+    def emit(self, document):
+        self.documents.append(document)
+
+
+_sink = StdoutSink()
+
+def get_sink():
+    return _sink
+
+def set_sink(sink):
+    """
+    Sends the documents of every event from now on to `sink`, returning the previous sink.
+    """
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+def get_namespace():
+    return os.environ.get(METRICS_NAMESPACE_ENV) or DEFAULT_NAMESPACE
+
+def consume_cold_start():
+    """
+    Returns True for the first event this process handles, and False from then on.
+    """
+    global _cold_start
+    with _cold_start_lock:
+        cold_start, _cold_start = _cold_start, False
+        return cold_start
+
+
+class Recorder(object):
+    """
+    Collects the phase timings, dimensions and outcome of handling one event.
+    """
+
+    def __init__(self, clock=monotonic):
+        self.resource_type = UNKNOWN
+        self.request_type = UNKNOWN
+        self.outcome = None
+        self.timings = {}
+        self.cold_start = consume_cold_start()
+        self._clock = clock
+        self._started_at = clock()
+
+    def set_request(self, resource_type, request_type):
+        self.resource_type = resource_type or UNKNOWN
+        self.request_type = request_type or UNKNOWN
+
+    @contextlib.contextmanager
+    def time(self, phase):
+        """
+        Adds the time spent in the block to `phase`, whether or not it raises.
+        """
+        started_at = self._clock()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + (self._clock() - started_at)
+
+    def to_document(self, namespace=None, timestamp=None):
+        """
+        Builds the EMF document for the event, with timings in milliseconds.
+        """
+        values = {
+            '{}Time'.format(phase): round(self.timings[phase] * 1000.0, 3)
+            for phase in PHASES if phase in self.timings
+        }
+        values['Duration'] = round((self._clock() - self._started_at) * 1000.0, 3)
+        metrics = [{'Name': name, 'Unit': 'Milliseconds'} for name in sorted(values)]
+        values['ColdStart'] = int(self.cold_start)
+        values['WarmStart'] = int(not self.cold_start)
+        metrics.extend([{'Name': 'ColdStart', 'Unit': 'Count'}, {'Name': 'WarmStart', 'Unit': 'Count'}])
+        document = {
+            '_aws': {
+                'Timestamp': int((time.time() if timestamp is None else timestamp) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace or get_namespace(),
+                    'Dimensions': DIMENSIONS,
+                    'Metrics': metrics,
+                }],
+            },
+            'ResourceType': self.resource_type,
+            'RequestType': self.request_type,
+            'Outcome': self.outcome or UNKNOWN,
+        }
+        document.update(values)
+        return document
+
+    def emit(self, sink=None):
+        """
+        Sends the document to `sink`, or the current sink. Failures are logged rather than raised.
+        """
+        try:
+            (sink or get_sink()).emit(self.to_document())
+        except Exception:
+            logger.exception('Could not emit metrics')
@@ -0,0 +1,335 @@
+"""
+Implements opt-in CPU profiling of resource methods, for finding out why a resource is slow in production.
+
+Profiling is configured through the function's environment:
+
+- `CLOUDSEEDER_PROFILE_RATE`, the fraction of operations to profile, from 0 (the default) to 1.
+- `CLOUDSEEDER_PROFILE_RESOURCE_TYPES`, a comma separated list of resource type patterns such as
+  `Custom::AWS.DynamoDB.*`, limiting profiling to matching resources.
+- `CLOUDSEEDER_PROFILE_DESTINATION`, where profiles go: an `s3://bucket/prefix` URL, or a local
+  directory.
+- `CLOUDSEEDER_PROFILE_MODE`, either `cprofile` (the default) for deterministic profiles in
+  `pstats` format, or `sample` for stacks sampled every few milliseconds, in the collapsed format
+  that flame graph tools take.
+
+Each profile is written next to a `metadata.json` identifying the request it was taken for. If
+the deadline passes while the resource is still running, whatever was captured up to then is
+written instead.
+
+Only one operation at a time is profiled with `cprofile`, since the interpreter only allows one
+active profiler; operations that start while another is profiled run without one. Profiling
+never fails an operation: if the profiler can't be started, the operation runs without it.
+"""
+
+import collections
+import fnmatch
+import json
+import logging
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+import attr
+
+from .constants import (
+    PROFILE_DESTINATION_ENV, PROFILE_MODE_ENV, PROFILE_RATE_ENV, PROFILE_RESOURCE_TYPES_ENV,
+)
+
+logger = logging.getLogger(__name__)
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+MODES = (CPROFILE, SAMPLE)
+
+# seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# stacks deeper than this are cut off at the root end
+MAX_STACK_DEPTH = 256
+
+PROFILE_NAMES = {
+    CPROFILE: 'profile.pstats',
+    SAMPLE: 'stacks.txt',
+}
+
+# held by the capture whose `cProfile.Profile` is enabled
+_cprofile_lock = threading.Lock()
+
+
+@attr.s(frozen=True)
+class ProfilingConfig(object):
+    rate = attr.ib()
+    destination = attr.ib()
+    resource_types = attr.ib(default=())
+    mode = attr.ib(default=CPROFILE)
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """
+        Reads the configuration from the environment, or returns None if profiling is disabled.
+        """
+        environ = os.environ if environ is None else environ
+        try:
+            rate = float(environ.get(PROFILE_RATE_ENV) or 0)
+        except ValueError:
+            logger.warning('Invalid %s, not profiling', PROFILE_RATE_ENV)
+            return None
+        if rate <= 0:
+            return None
+        destination = environ.get(PROFILE_DESTINATION_ENV)
+        if not destination:
+            logger.warning('%s is set without %s, not profiling', PROFILE_RATE_ENV, PROFILE_DESTINATION_ENV)
+            return None
+        mode = (environ.get(PROFILE_MODE_ENV) or CPROFILE).lower()
+        if mode not in MODES:
+            logger.warning('Unknown profiling mode %s, not profiling', mode)
+            return None
+        resource_types = tuple(
+            pattern.strip() for pattern in (environ.get(PROFILE_RESOURCE_TYPES_ENV) or '').split(',')
+            if pattern.strip()
+        )
+        return cls(rate=min(rate, 1.0), destination=destination, resource_types=resource_types, mode=mode)
+
+    def matches(self, resource_type):
+        if not self.resource_types:
+            return True
+        return any(fnmatch.fnmatchcase(resource_type, pattern) for pattern in self.resource_types)
+
+    def should_profile(self, resource_type, sample=random.random):
+        return self.matches(resource_type) and sample() < self.rate
+
+
+class FileSink(object):
+    """
+    Writes profiles to files under a local directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, key, data):
+        path = os.path.join(self.directory, *key.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+class S3Sink(object):
+    """
+    Uploads profiles to an S3 bucket, under `prefix`.
+    """
+
+    def __init__(self, client, bucket, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def write(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+
+def get_sink(session, destination):
+    if destination.startswith('s3://'):
+        bucket, _, prefix = destination[len('s3://'):].partition('/')
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        return S3Sink(session.client('s3'), bucket, prefix)
+    return FileSink(destination)
+
+
+def format_frame(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(code.co_name, code.co_filename, code.co_firstlineno)
+
+def collapse_stack(frame):
+    """
+    Formats the stack ending at `frame` as a line of collapsed stack format, root first.
+    """
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(format_frame(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(object):
+    """
+    Counts the stacks of one thread, sampled from a background thread every `interval` seconds.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='cloudseeder-profile-sampler')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is not None:
+            self.stacks[collapse_stack(frame)] += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def get_data(self):
+        return ''.join(
+            '{} {}\n'.format(stack, count) for stack, count in sorted(self.stacks.items())
+        ).encode('utf-8')
+
+
+def to_key_part(value):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', value)
+
+def get_artifact_prefix(request, started_at):
+    """
+    Gets the key prefix for the artifacts of one profile, grouped by resource type.
+    """
+    return '{}/{}-{}/'.format(
+        to_key_part(request.resource_type),
+        time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(started_at)),
+        to_key_part(request.request_id),
+    )
+
+
+class Capture(object):
+    """
+    The profile of a single resource operation.
+
+    `run` calls the resource method under the profiler, in whatever thread it runs in, and
+    `export` writes out what was captured from the thread handling the event. The profiler is
+    only ever stopped by the thread that started it.
+    """
+
+    def __init__(self, request, mode, sink, clock=monotonic):
+        self.request = request
+        self.mode = mode
+        self.sink = sink
+        self.started_at = None
+        self.duration = None
+        self.completed = False
+        self._clock = clock
+        self._started = None
+        self._profiler = None
+        self._lock = threading.Lock()
+
+    def _create_profiler(self):
+        if self.mode == CPROFILE:
+            import cProfile
+            if not _cprofile_lock.acquire(False):
+                logger.info('Another operation is being profiled, not profiling this one')
+                return None
+            try:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            except Exception:
+                _cprofile_lock.release()
+                raise
+            return profiler
+        profiler = StackSampler(threading.current_thread().ident)
+        profiler.start()
+        return profiler
+
+    def run(self, func, *args, **kwargs):
+        with self._lock:
+            try:
+                self._profiler = self._create_profiler()
+            except Exception:
+                logger.exception('Could not start profiling, running without it')
+            if self._profiler is not None:
+                self.started_at = time.time()
+                self._started = self._clock()
+        if self._profiler is None:
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.completed = self.duration is None
+                if self.completed:
+                    self.duration = self._clock() - self._started
+                try:
+                    self._stop_profiler()
+                except Exception:
+                    logger.exception('Could not stop profiling')
+
+    def _stop_profiler(self):
+        if self.mode == CPROFILE:
+            try:
+                self._profiler.disable()
+            finally:
+                _cprofile_lock.release()
+        else:
+            self._profiler.stop()
+
+    def get_profile_data(self):
+        if self.mode == CPROFILE:
+            # works on a profiler that's still enabled, unlike `pstats.Stats`, which disables it
+            self._profiler.snapshot_stats()
+            # the same format as `pstats.Stats.dump_stats`
+            return marshal.dumps(self._profiler.stats)
+        return self._profiler.get_data()
+
+    def get_metadata(self):
+        return {
+            'RequestId': self.request.request_id,
+            'StackId': self.request.stack_id,
+            'LogicalResourceId': self.request.logical_resource_id,
+            'PhysicalResourceId': getattr(self.request, 'physical_resource_id', None),
+            'ResourceType': self.request.resource_type,
+            'RequestType': self.request.request_type,
+            'Mode': self.mode,
+            'StartedAt': self.started_at,
+            'Duration': self.duration,
+            # False if the deadline passed while the resource was still running
+            'Completed': self.completed,
+        }
+
+    def export(self):
+        """
+        Writes the profile and its metadata to the sink. Failures are logged rather than raised.
+        """
+        try:
+            with self._lock:
+                if self._profiler is None:
+                    return
+                if self.duration is None:
+                    # the deadline passed with the resource still running in another thread
+                    self.duration = self._clock() - self._started
+                    if self.mode == SAMPLE:
+                        # unlike a `cProfile.Profile`, the sampler can be stopped from any thread
+                        self._profiler.stop()
+                data = self.get_profile_data()
+                metadata = self.get_metadata()
+            prefix = get_artifact_prefix(self.request, self.started_at)
+            self.sink.write(prefix + PROFILE_NAMES[self.mode], data)
+            self.sink.write(prefix + 'metadata.json', json.dumps(metadata, indent=1, sort_keys=True).encode('utf-8'))
+            logger.info('Wrote profile of %s to %s', self.request.logical_resource_id, prefix)
+        except Exception:
+            logger.exception('Could not write profile')
+
+
+def start_capture(request, session, config=None):
+    """
+    Decides whether to profile the resource operation for `request`, returning a `Capture` if so.
+    """
+    config = ProfilingConfig.from_environ() if config is None else config
+    if config is None or not config.should_profile(request.resource_type):
+        return None
+    return Capture(request, config.mode, get_sink(session, config.destination))
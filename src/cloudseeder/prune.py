@@ -0,0 +1,226 @@
+"""
+Works out which parts of an installed environment the Lambda function can actually use.
+
+The import closure of the handler and the registered resources is computed with `modulefinder`,
+and installed files are attributed to distributions through their `RECORD` metadata. Distributions
+with no reachable module are left out of the bundle, as are test suites and the botocore and boto3
+service models of services no bundled code creates a client for.
+"""
+
+import csv
+import io
+import modulefinder
+import os
+import re
+import sys
+
+import attr
+
+from . import loader
+
+HANDLER_MODULE = 'cloudseeder.handler'
+
+# always bundled: the handler module lives in it, even when it's installed in develop mode
+REQUIRED_DISTRIBUTIONS = frozenset(['cloudseeder'])
+
+SERVICE_DATA_PREFIXES = ('botocore/data/', 'boto3/data/')
+
+TEST_DIRECTORY_NAMES = frozenset(['test', 'tests'])
+
+SERVICE_CALL = re.compile(
+    r'''\.(?:client|resource)\(\s*(?:service_name\s*=\s*)?['"]([a-z0-9-]+)['"]''',
+)
+
+DISTRIBUTION_NAME_SEPARATORS = re.compile(r'[-_.]+')
+
+UNREACHABLE_REASON = 'no module reachable from the handler or the registered resources'
+UNUSED_SERVICE_REASON = 'no bundled code creates a client for the service'
+TEST_SUITE_REASON = 'test suite not reachable from the handler'
+
+
+def normalize_distribution_name(name):
+    return DISTRIBUTION_NAME_SEPARATORS.sub('-', name).lower()
+
+def get_distribution_name(metadata_directory):
+    """
+    Gets the normalized distribution name from a `.dist-info` or `.egg-info` directory name.
+    """
+    return normalize_distribution_name(metadata_directory.rsplit('.', 1)[0].split('-', 1)[0])
+
+def is_metadata_directory(name):
+    return name.endswith(('.dist-info', '.egg-info'))
+
+
+@attr.s(frozen=True)
+class Distribution(object):
+    """
+    An installed distribution and the archive names of the files it installed.
+    """
+    name = attr.ib()
+    files = attr.ib()
+
+
+def to_archive_name(path, site_packages_root):
+    """
+    Converts a path to a name relative to `site_packages_root`, or None if it's outside of it.
+    """
+    name = os.path.relpath(os.path.abspath(path), os.path.abspath(site_packages_root))
+    if name == os.curdir or name.split(os.sep)[0] == os.pardir:
+        return None
+    return name.replace(os.sep, '/')
+
+def read_record(path):
+    with io.open(path, encoding='utf-8', newline='') as f:
+        return [row[0] for row in csv.reader(f) if row]
+
+def read_distributions(site_packages_root):
+    """
+    Yields the distributions installed in `site_packages_root` that recorded their files.
+    """
+    for entry in sorted(os.listdir(site_packages_root)):
+        metadata_root = os.path.join(site_packages_root, entry)
+        if entry.endswith('.dist-info'):
+            record_path = os.path.join(metadata_root, 'RECORD')
+            base = site_packages_root
+        elif entry.endswith('.egg-info'):
+            record_path = os.path.join(metadata_root, 'installed-files.txt')
+            base = metadata_root
+        else:
+            continue
+        if not os.path.isfile(record_path):
+            continue
+        files = set()
+        for path in read_record(record_path):
+            name = to_archive_name(os.path.join(base, path), site_packages_root)
+            if name is not None:
+                files.add(name)
+        files.add(to_archive_name(record_path, site_packages_root))
+        yield Distribution(get_distribution_name(entry), frozenset(files))
+
+def get_root_modules():
+    """
+    Lists the modules the Lambda function can import directly: the handler and every resource module.
+    """
+    resource_modules = set(
+        reference.partition(':')[0] for reference in loader.build_resource_index().values()
+    )
+    return [HANDLER_MODULE] + sorted(resource_modules)
+
+def find_reachable_modules(roots, path=None):
+    """
+    Maps every module importable from `roots` to its file (None for built-in and namespace modules).
+    """
+    finder = modulefinder.ModuleFinder(path=list(sys.path if path is None else path))
+    for root in roots:
+        finder.import_hook(root)
+    return {name: module.__file__ for name, module in finder.modules.items()}
+
+def find_used_services(paths):
+    """
+    Collects the AWS services that the source files in `paths` create clients or resources for.
+    """
+    services = set()
+    for path in paths:
+        with io.open(path, encoding='utf-8', errors='replace') as f:
+            services.update(SERVICE_CALL.findall(f.read()))
+    return services
+
+def get_service_name(name):
+    for prefix in SERVICE_DATA_PREFIXES:
+        if name.startswith(prefix):
+            parts = name[len(prefix):].split('/')
+            if len(parts) > 1:
+                return parts[0]
+    return None
+
+def is_test_suite(name):
+    return any(part in TEST_DIRECTORY_NAMES for part in name.split('/')[:-1])
+
+
+@attr.s(frozen=True)
+class PrunePlan(object):
+    """
+    The archive names to leave out of the bundle, each with the reason why.
+    """
+    excluded = attr.ib()
+    dropped_distributions = attr.ib()
+    used_services = attr.ib()
+
+    def is_excluded(self, name):
+        return name in self.excluded
+
+    def get_report(self):
+        """
+        Summarizes the plan as a JSON-serializable dict.
+        """
+        files_by_reason = {}
+        for reason in self.excluded.values():
+            files_by_reason[reason] = files_by_reason.get(reason, 0) + 1
+        dropped_services = set()
+        for name in self.excluded:
+            service = get_service_name(name)
+            if service is not None:
+                dropped_services.add(service)
+        return {
+            'distributions': dict(self.dropped_distributions),
+            'services': {
+                'kept': sorted(self.used_services),
+                'dropped': sorted(dropped_services),
+            },
+            'files': files_by_reason,
+        }
+
+
+def create_plan(
+        site_packages_root, roots=None, include_distributions=(), include_services=(), path=None):
+    """
+    Decides what in `site_packages_root` the Lambda function can do without.
+
+    `roots` are the modules the function imports directly (by default the handler and every
+    registered resource module), and `path` is the module search path used to follow their
+    imports (by default `site_packages_root` followed by `sys.path`). Distributions and services
+    named in `include_distributions` and `include_services` are kept regardless.
+    """
+    if roots is None:
+        roots = get_root_modules()
+    if path is None:
+        path = [site_packages_root] + sys.path
+    modules = find_reachable_modules(roots, path=path)
+
+    reachable = set()
+    for file in modules.values():
+        name = None if file is None else to_archive_name(file, site_packages_root)
+        if name is not None:
+            reachable.add(name)
+
+    root_packages = set(root.split('.')[0] for root in roots)
+    services = find_used_services(
+        file for name, file in modules.items()
+        if file is not None and name.split('.')[0] in root_packages and file.endswith('.py')
+    )
+    services.update(include_services)
+
+    keep_distributions = REQUIRED_DISTRIBUTIONS.union(
+        normalize_distribution_name(name) for name in include_distributions
+    )
+    excluded = {}
+    dropped_distributions = {}
+    for distribution in read_distributions(site_packages_root):
+        if distribution.name in keep_distributions or reachable.intersection(distribution.files):
+            continue
+        dropped_distributions[distribution.name] = UNREACHABLE_REASON
+        for name in distribution.files:
+            excluded[name] = UNREACHABLE_REASON
+
+    for root, _, files in os.walk(site_packages_root):
+        for file in files:
+            name = to_archive_name(os.path.join(root, file), site_packages_root)
+            if name in excluded or name in reachable:
+                continue
+            service = get_service_name(name)
+            if service is not None and service not in services:
+                excluded[name] = UNUSED_SERVICE_REASON
+            elif is_test_suite(name):
+                excluded[name] = TEST_SUITE_REASON
+
+    return PrunePlan(excluded, dropped_distributions, frozenset(services))
@@ -0,0 +1,212 @@
+"""
+Implements client-side rate limiting of the AWS calls made by resources.
+
+Every pooled client calls into a process-wide `RateLimiter` before each API call, which takes a
+token from the bucket for that service and operation, sleeping until one is available. Throttling
+errors (and calls that botocore only got through by retrying) halve the bucket's rate, and every
+successful call adds back a fraction of the configured rate, so concurrent resources settle just
+below what the service allows instead of all exhausting their retries at once.
+
+Resource modules can set their own limits in a `RATE_LIMITS` dict next to `RESOURCE_TYPE_PREFIX`,
+keyed by service name or by a tuple of service and operation name.
+
+A call that would have to wait for a token past the deadline of the operation making it (see
+`cloudseeder.deadline`) fails with `DeadlineExceededException` straight away instead.
+"""
+
+import importlib
+import sys
+import threading
+import time
+
+import attr
+
+from . import deadline
+from .exceptions import DeadlineExceededException
+from .util import lru_cache
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+# error codes AWS services use for throttling
+THROTTLING_ERROR_CODES = frozenset([
+    'BandwidthLimitExceeded',
+    'EC2ThrottledException',
+    'PriorRequestNotComplete',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'SlowDown',
+    'Throttled',
+    'ThrottledException',
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+])
+
+# how much a bucket's rate is multiplied by on throttling, and how much of its configured rate
+# is added back on every success
+DECREASE_FACTOR = 0.5
+INCREASE_FRACTION = 0.1
+
+
+@attr.s(frozen=True)
+class RateLimit(object):
+    """
+    Allows `rate` calls per second on average, in bursts of up to `burst` calls.
+
+    Throttling never takes the rate below `min_rate`.
+    """
+    rate = attr.ib()
+    burst = attr.ib()
+    min_rate = attr.ib(default=0.1)
+
+
+# applies to operations without a configured limit, which mostly leaves them to the adaptive part
+DEFAULT_RATE_LIMIT = RateLimit(rate=25.0, burst=50)
+
+
+class TokenBucket(object):
+    def __init__(self, limit, clock=monotonic, sleep=time.sleep):
+        self.limit = limit
+        self.rate = float(limit.rate)
+        self.tokens = float(limit.burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(float(self.limit.burst), self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, timeout=None):
+        """
+        Takes a token, sleeping until it's available. Returns how long that was in seconds.
+
+        Raises `DeadlineExceededException` without taking a token if that would be more than
+        `timeout` seconds.
+        """
+        with self._lock:
+            self._refill()
+            # tokens can go negative, which queues callers up behind each other without
+            # anyone sleeping under the lock
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if timeout is not None and delay > timeout:
+                self.tokens += 1
+                raise DeadlineExceededException(
+                    'Call would be rate limited for {:.1f} seconds, past the operation deadline'.format(delay),
+                )
+        if delay > 0:
+            self._sleep(delay)
+        return delay
+
+    def on_throttle(self):
+        with self._lock:
+            self._refill()
+            self.rate = max(self.limit.min_rate, self.rate * DECREASE_FACTOR)
+            # whatever burst was saved up is what got throttled
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            self._refill()
+            self.rate = min(float(self.limit.rate), self.rate + self.limit.rate * INCREASE_FRACTION)
+
+    def set_limit(self, limit):
+        with self._lock:
+            self._refill()
+            self.limit = limit
+            self.rate = min(self.rate, float(limit.rate))
+            self.tokens = min(self.tokens, float(limit.burst))
+
+
+def is_throttled(parsed):
+    error = parsed.get('Error', {})
+    return error.get('Code') in THROTTLING_ERROR_CODES
+
+def get_module_rate_limits(module_name):
+    module = sys.modules.get(module_name) or importlib.import_module(module_name)
+    return getattr(module, 'RATE_LIMITS', {})
+
+
+class RateLimiter(object):
+    """
+    Keeps a token bucket for every service and operation called through the clients it's attached to.
+    """
+
+    def __init__(self, limits=None, default=DEFAULT_RATE_LIMIT, clock=monotonic, sleep=time.sleep):
+        self.limits = dict(limits or {})
+        self.default = default
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._configured_modules = set()
+        self._lock = threading.Lock()
+        # held while a module's limits are applied, separately from the lock `configure` takes
+        self._modules_lock = threading.Lock()
+
+    def get_limit(self, service_name, operation_name):
+        limit = self.limits.get((service_name, operation_name))
+        if limit is None:
+            limit = self.limits.get(service_name, self.default)
+        return limit
+
+    def get_bucket(self, service_name, operation_name):
+        key = (service_name, operation_name)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.get_limit(*key), clock=self._clock, sleep=self._sleep)
+                self._buckets[key] = bucket
+            return bucket
+
+    def configure(self, limits):
+        """
+        Adds or replaces limits, applying them to the buckets that already exist.
+        """
+        with self._lock:
+            self.limits.update(limits)
+            buckets = list(self._buckets.items())
+        for key, bucket in buckets:
+            bucket.set_limit(self.get_limit(*key))
+
+    def configure_resource(self, resource_cls):
+        """
+        Applies the `RATE_LIMITS` of the module a resource class is defined in, once per module.
+        """
+        module_name = resource_cls.__module__
+        with self._modules_lock:
+            if module_name in self._configured_modules:
+                return
+            self.configure(get_module_rate_limits(module_name))
+            self._configured_modules.add(module_name)
+
+    def attach(self, client):
+        events = client.meta.events
+        # registered for every operation explicitly, since handlers for more specific event names
+        # run first, and first among those so that stubbed responses are limited as well
+        events.register_first('before-call.*.*', self._before_call, unique_id='cloudseeder-rate-limit-before')
+        events.register('after-call.*.*', self._after_call, unique_id='cloudseeder-rate-limit-after')
+
+    def _before_call(self, model, **kwargs):
+        bucket = self.get_bucket(model.service_model.service_name, model.name)
+        bucket.acquire(timeout=deadline.get_current_deadline().remaining())
+
+    def _after_call(self, model, parsed, **kwargs):
+        bucket = self.get_bucket(model.service_model.service_name, model.name)
+        retry_attempts = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if is_throttled(parsed) or retry_attempts:
+            bucket.on_throttle()
+        elif 'Error' not in parsed:
+            bucket.on_success()
+
+
+@lru_cache(1)
+def get_rate_limiter():
+    """
+    Gets the process-wide rate limiter attached to the clients handed to resources.
+    """
+    return RateLimiter()
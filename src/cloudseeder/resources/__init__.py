@@ -1,5 +1,7 @@
 """
 Base classes for custom resources.
+
+Lifecycle methods and `poll` can also be defined with `async def`, see `cloudseeder.aio`.
 """
 
 import importlib
@@ -25,19 +27,40 @@ class _ResourceMeta(type):
 
 
 class Resource(six.with_metaclass(_ResourceMeta, troposphere.AWSObject)):
+    # properties that can't be updated in place; an update changing any of them calls `create`
+    # instead, and CloudFormation deletes the old resource once the new physical ID is returned
+    replacement_properties = ()
+
     def __init__(self, *args, **kwargs):
-        kwargs['ServiceToken'] = troposphere.ImportValue(LAMBDA_ARN_EXPORT)
+        # can be pointed at the SNS topic export instead, to go through the event queue
+        kwargs.setdefault('ServiceToken', troposphere.ImportValue(LAMBDA_ARN_EXPORT))
         super(Resource, self).__init__(*args, **kwargs)
 
     def create(self, request, session):
         pass
 
     def update(self, request, session):
+        """
+        Updates the resource in place.
+
+        `request.property_diff` has what changed. It's only empty when the handler had no recorded
+        result of the last operation to answer with instead.
+        """
         pass
 
     def delete(self, request, session):
         pass
 
+    def poll(self, request, session, state):
+        """
+        Continues an operation after a lifecycle method returned `cloudseeder.types.InProgress`.
+
+        `state` is the state from the last `InProgress`, or from the last
+        `cloudseeder.deadline.Deadline.checkpoint` if the method ran out of time. Returns the same kinds of values as the
+        lifecycle methods, including another `InProgress` if the work still isn't done.
+        """
+        raise NotImplementedError('{} does not support continuations'.format(self.resource_type))
+
 
 class Property(troposphere.AWSProperty):
     pass
@@ -1,12 +1,19 @@
 from . import Resource
+from ..ratelimit import RateLimit
 
 RESOURCE_TYPE_PREFIX = 'AWS.CloudFront'
 
+# the CloudFront API allows only a few calls per second per account
+RATE_LIMITS = {
+    'cloudfront': RateLimit(rate=2.0, burst=4),
+}
+
 class OriginAccessIdentity(Resource):
     props = {
         'CallerReference': (str, True),
         'Comment': (str, False),
     }
+    replacement_properties = ('CallerReference',)
 
     @staticmethod
     def _get_return_values(response):
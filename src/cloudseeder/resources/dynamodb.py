@@ -1,12 +1,114 @@
+import hashlib
+import os
+
+from troposphere.validators import integer
+
 from . import Resource, Property
+from .. import exceptions, lease, util
+from ..constants import INDEXED_TABLE_CREATION_SLOTS_ENV
+from ..types import InProgress
 
 RESOURCE_TYPE_PREFIX = 'AWS.DynamoDB'
 
+# limits how many tables with secondary indexes are created at once, see `Table`
+INDEXED_TABLE_LEASE = 'dynamodb-indexed-table-creation'
+DEFAULT_INDEXED_TABLE_CREATION_SLOTS = 10
+
+# seconds between checks on a table operation, and between attempts to take the lease
+POLL_DELAY = 15
+LEASE_RETRY_DELAY = 30
+
+MAX_TABLE_NAME_LENGTH = 255
+
+WAITING_FOR_LEASE = 'waiting_for_lease'
+CREATING = 'creating'
+UPDATING = 'updating'
+DELETING = 'deleting'
+
+class AttributeDefinition(Property):
+    props = {
+        'AttributeName': (str, True),
+        'AttributeType': (str, True),
+    }
+
+class KeySchema(Property):
+    props = {
+        'AttributeName': (str, True),
+        'KeyType': (str, True),
+    }
+
+class Projection(Property):
+    props = {
+        'NonKeyAttributes': ([str], False),
+        'ProjectionType': (str, False),
+    }
+
+class ProvisionedThroughput(Property):
+    props = {
+        'ReadCapacityUnits': (integer, True),
+        'WriteCapacityUnits': (integer, True),
+    }
+
 class GlobalSecondaryIndex(Property):
     props = {
-        'Name': (str, True),
+        'IndexName': (str, True),
+        'KeySchema': ([KeySchema], True),
+        'Projection': (Projection, True),
+        'ProvisionedThroughput': (ProvisionedThroughput, False),
+    }
+
+class LocalSecondaryIndex(Property):
+    props = {
+        'IndexName': (str, True),
+        'KeySchema': ([KeySchema], True),
+        'Projection': (Projection, True),
+    }
+
+class StreamSpecification(Property):
+    props = {
+        'StreamViewType': (str, True),
     }
 
+def get_indexed_table_creation_slots():
+    return int(os.environ.get(INDEXED_TABLE_CREATION_SLOTS_ENV, DEFAULT_INDEXED_TABLE_CREATION_SLOTS))
+
+def acquire_creation_lease(manager, table_name):
+    return manager.acquire(INDEXED_TABLE_LEASE, table_name, slots=get_indexed_table_creation_slots())
+
+def to_api_value(value):
+    """
+    Converts property values to the shapes the DynamoDB API takes.
+    """
+    if isinstance(value, ProvisionedThroughput):
+        # CloudFormation passes numbers to custom resources as strings
+        return {name: int(number) for name, number in value.properties.items()}
+    if isinstance(value, Property):
+        return {name: to_api_value(item) for name, item in value.properties.items()}
+    if isinstance(value, list):
+        return [to_api_value(item) for item in value]
+    return value
+
+def normalize_projection(projection):
+    return projection.get('ProjectionType', 'ALL'), sorted(projection.get('NonKeyAttributes', []))
+
+def is_table_settled(table):
+    """
+    Checks if a table and all of its indexes are active, raising if the table can't get there.
+    """
+    status = table['TableStatus']
+    if status not in ('ACTIVE', 'CREATING', 'UPDATING'):
+        raise exceptions.ResourceOperationException(
+            'Table {} is {}'.format(table['TableName'], status),
+        )
+    indexes = table.get('GlobalSecondaryIndexes', [])
+    return status == 'ACTIVE' and all(index['IndexStatus'] == 'ACTIVE' for index in indexes)
+
+def get_table_attributes(table):
+    attributes = {'Arn': table['TableArn']}
+    if 'LatestStreamArn' in table:
+        attributes['StreamArn'] = table['LatestStreamArn']
+    return attributes
+
 class Table(Resource):
     """
     The `AWS::DynamoDB::Table` resource creates a DynamoDB table. For more information, see
@@ -15,14 +117,10 @@ class Table(Resource):
 
     You should be aware of the following behaviors when working with DynamoDB tables:
 
-    * AWS CloudFormation typically creates DynamoDB tables in parallel.
-      However, if your template includes multiple DynamoDB tables with indexes,
-      you must declare dependencies so that the tables are created sequentially.
-      Amazon DynamoDB limits the number of tables with secondary indexes that are
-      in the creating state. If you create multiple tables with indexes at the same
-      time, DynamoDB returns an error and the stack operation fails.
-      For an example, see
-      [DynamoDB Table with a DependsOn Attribute](https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-dynamodb-table.html#cfn-dynamodb-table-examples-dependson).
+    * Amazon DynamoDB limits the number of tables with secondary indexes that are in the
+      creating state. Tables with indexes don't need dependencies on each other to stay under
+      that limit: their creation waits for a slot of a lease shared by every invocation, as
+      described below.
 
     * Updates to `AWS::DynamoDB::Table` resources that are associated with
       `AWS::ApplicationAutoScaling::ScalableTarget` resources will always result in an
@@ -35,13 +133,210 @@ class Table(Resource):
 
         As a workaround, please deregister scalable targets before performing updates
         to `AWS::DynamoDB::Table` resources.
+
+    The lease coordinating the creation of tables with indexes has 10 slots, unless the function's
+    `CLOUDSEEDER_INDEXED_TABLE_CREATION_SLOTS` environment variable sets another number. Changing
+    `TableName`, `KeySchema` or `LocalSecondaryIndexes` replaces the table; other changes are
+    applied in place, one `UpdateTable` call at a time.
     """
     props = {
-        'GlobalSecondaryIndexes': ([GlobalSecondaryIndex], True),
+        'AttributeDefinitions': ([AttributeDefinition], True),
+        'BillingMode': (str, False),
+        'GlobalSecondaryIndexes': ([GlobalSecondaryIndex], False),
+        'KeySchema': ([KeySchema], True),
+        'LocalSecondaryIndexes': ([LocalSecondaryIndex], False),
+        'ProvisionedThroughput': (ProvisionedThroughput, False),
+        'StreamSpecification': (StreamSpecification, False),
         'TableName': (str, False),
     }
+    replacement_properties = ('TableName', 'KeySchema', 'LocalSecondaryIndexes')
+
+    def get_property(self, name, default=None):
+        return to_api_value(self.properties.get(name, default))
+
+    def get_table_name(self, request):
+        """
+        Gets the table name, generating one from the stack, logical ID and request if none is set.
+        """
+        if 'TableName' in self.properties:
+            return self.properties['TableName']
+        stack_name = request.stack_id.split('/')[1] if '/' in request.stack_id else 'stack'
+        suffix = hashlib.sha256(request.request_id.encode('utf-8')).hexdigest()[:12].upper()
+        prefix = '{}-{}'.format(stack_name, request.logical_resource_id)
+        return '{}-{}'.format(prefix[:MAX_TABLE_NAME_LENGTH - len(suffix) - 1], suffix)
+
+    def has_secondary_indexes(self):
+        return bool(self.properties.get('GlobalSecondaryIndexes') or self.properties.get('LocalSecondaryIndexes'))
+
+    def get_create_table_kwargs(self, table_name):
+        kwargs = {
+            'TableName': table_name,
+            'AttributeDefinitions': self.get_property('AttributeDefinitions'),
+            'KeySchema': self.get_property('KeySchema'),
+            'BillingMode': self.get_property('BillingMode', 'PROVISIONED'),
+        }
+        for name in ('ProvisionedThroughput', 'GlobalSecondaryIndexes', 'LocalSecondaryIndexes'):
+            if name in self.properties:
+                kwargs[name] = self.get_property(name)
+        if 'StreamSpecification' in self.properties:
+            kwargs['StreamSpecification'] = dict(self.get_property('StreamSpecification'), StreamEnabled=True)
+        return kwargs
+
+    def get_next_update(self, table):
+        """
+        Gets the arguments of the next `UpdateTable` call to bring `table` in line with the
+        properties, or None if it already is.
+
+        DynamoDB only takes one kind of change per call, so this is called again once the table
+        has settled after each one.
+        """
+        current_indexes = {index['IndexName']: index for index in table.get('GlobalSecondaryIndexes', [])}
+        desired_indexes = {index['IndexName']: index for index in self.get_property('GlobalSecondaryIndexes', [])}
+        for name in sorted(current_indexes):
+            desired = desired_indexes.get(name)
+            current = current_indexes[name]
+            if desired is None or desired['KeySchema'] != current['KeySchema'] or \
+                    normalize_projection(desired['Projection']) != normalize_projection(current['Projection']):
+                # indexes can't be changed in place, so changed ones are deleted and created again
+                return {'GlobalSecondaryIndexUpdates': [{'Delete': {'IndexName': name}}]}
+
+        billing_mode = self.get_property('BillingMode', 'PROVISIONED')
+        current_billing_mode = table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED')
+        throughput = self.get_property('ProvisionedThroughput')
+        current_throughput = table.get('ProvisionedThroughput', {})
+        if billing_mode != current_billing_mode or (billing_mode == 'PROVISIONED' and throughput and any(
+                current_throughput.get(name) != value for name, value in throughput.items())):
+            kwargs = {'BillingMode': billing_mode}
+            if billing_mode == 'PROVISIONED' and throughput:
+                kwargs['ProvisionedThroughput'] = throughput
+            return kwargs
+
+        stream = self.get_property('StreamSpecification')
+        current_stream = table.get('StreamSpecification', {})
+        if current_stream.get('StreamEnabled') and (stream is None or stream != {
+                'StreamViewType': current_stream.get('StreamViewType')}):
+            # the view type can't be changed while the stream is enabled
+            return {'StreamSpecification': {'StreamEnabled': False}}
+        if stream is not None and not current_stream.get('StreamEnabled'):
+            return {'StreamSpecification': dict(stream, StreamEnabled=True)}
+
+        for name in sorted(desired_indexes):
+            if name not in current_indexes:
+                return {
+                    'AttributeDefinitions': self.get_property('AttributeDefinitions'),
+                    'GlobalSecondaryIndexUpdates': [{'Create': desired_indexes[name]}],
+                }
+            index_throughput = desired_indexes[name].get('ProvisionedThroughput')
+            current_index_throughput = current_indexes[name].get('ProvisionedThroughput', {})
+            if billing_mode == 'PROVISIONED' and index_throughput and any(
+                    current_index_throughput.get(key) != value for key, value in index_throughput.items()):
+                return {'GlobalSecondaryIndexUpdates': [
+                    {'Update': {'IndexName': name, 'ProvisionedThroughput': index_throughput}},
+                ]}
+        return None
+
+    def _start_create(self, request, session, table_name):
+        manager = lease.get_lease_manager(session)
+        held = None
+        if self.has_secondary_indexes():
+            held = acquire_creation_lease(manager, table_name)
+            if held is None:
+                return InProgress(
+                    state={'phase': WAITING_FOR_LEASE, 'table_name': table_name},
+                    delay=LEASE_RETRY_DELAY,
+                )
+        client = session.client('dynamodb')
+        try:
+            client.create_table(**self.get_create_table_kwargs(table_name))
+        except client.exceptions.ResourceInUseException:
+            if 'TableName' in self.properties:
+                if held is not None:
+                    manager.release(held)
+                raise
+            # generated names are unique to the request, so an earlier attempt already created it
+        except client.exceptions.LimitExceededException:
+            # tables are also being created by something that doesn't take the lease
+            if held is not None:
+                manager.release(held)
+            return InProgress(
+                state={'phase': WAITING_FOR_LEASE, 'table_name': table_name},
+                delay=LEASE_RETRY_DELAY,
+            )
+        except Exception:
+            if held is not None:
+                manager.release(held)
+            raise
+        return InProgress(
+            state={
+                'phase': CREATING,
+                'table_name': table_name,
+                'lease': None if held is None else held.to_dict(),
+            },
+            delay=POLL_DELAY,
+        )
 
     def create(self, request, session):
-        pass
+        return self._start_create(request, session, self.get_table_name(request))
+
+    def update(self, request, session):
+        return self.poll(request, session, {'phase': UPDATING, 'table_name': request.physical_resource_id})
 
+    def delete(self, request, session):
+        client = session.client('dynamodb')
+        try:
+            client.delete_table(TableName=request.physical_resource_id)
+        except client.exceptions.ResourceNotFoundException:
+            return None
+        except client.exceptions.ResourceInUseException:
+            # still being created or updated, so try again once that's done
+            return InProgress(
+                state={'phase': DELETING, 'table_name': request.physical_resource_id, 'requested': False},
+                delay=POLL_DELAY,
+            )
+        return InProgress(
+            state={'phase': DELETING, 'table_name': request.physical_resource_id, 'requested': True},
+            delay=POLL_DELAY,
+        )
 
+    def poll(self, request, session, state):
+        phase = state['phase']
+        if phase == WAITING_FOR_LEASE:
+            return self._start_create(request, session, state['table_name'])
+        if phase == DELETING and not state['requested']:
+            return self.delete(request, session)
+        client = session.client('dynamodb')
+        if phase == DELETING:
+            try:
+                client.describe_table(TableName=state['table_name'])
+            except client.exceptions.ResourceNotFoundException:
+                return None
+            return InProgress(state=state, delay=POLL_DELAY)
+        held = lease.Lease.from_dict(state['lease']) if state.get('lease') else None
+        manager = lease.get_lease_manager(session)
+        try:
+            table = client.describe_table(TableName=state['table_name'])['Table']
+            settled = is_table_settled(table)
+        except Exception as ex:
+            if held is not None:
+                manager.release(held)
+            if phase != CREATING:
+                raise
+            # the table was created, so it's reported as the resource for the stack to delete it
+            raise exceptions.ResourceOperationException(
+                util.get_reason_from_exception(ex), physical_resource_id=state['table_name'],
+            )
+        if not settled:
+            if held is not None and not manager.renew(held):
+                # the slot expired and was taken by another table, so count this one again as soon
+                # as a slot is free; the table is being created either way
+                held = acquire_creation_lease(manager, state['table_name'])
+                state = dict(state, lease=None if held is None else held.to_dict())
+            return InProgress(state=state, delay=POLL_DELAY)
+        if held is not None:
+            manager.release(held)
+        if phase == UPDATING:
+            update = self.get_next_update(table)
+            if update is not None:
+                client.update_table(TableName=table['TableName'], **update)
+                return InProgress(state=state, delay=POLL_DELAY)
+        return table['TableName'], get_table_attributes(table)
@@ -0,0 +1,162 @@
+"""
+Compiles the `props` of resource and property classes into specialized constructors.
+
+`troposphere.AWSObject.from_dict` works out what to do with every value from `props` again on each
+call, and then validates it a second time through `__setattr__` as the object is built. On the
+Lambda side the handler instead uses `construct_resource`, which compiles a class's `props` once
+into one converter and one type check per property. Each object, nested properties included, is
+still an ordinary troposphere object: it's created through its class's constructor with just a
+title, which validates the title and sets the class's defaults, and its `properties` are then
+filled with the checked values. Resources without a title or a `ServiceToken` are left to
+`from_dict`.
+
+This doesn't take troposphere off the Lambda's import path, as every resource and property class
+subclasses it; the handler only defers importing it until it looks up a resource class.
+
+Validation follows `from_dict` exactly: the same properties are rejected, in the same order, with
+the same exception types and messages.
+"""
+
+import collections
+import sys
+import types
+
+import troposphere
+
+from .util import lru_cache
+
+if sys.version_info >= (3, 3):
+    from collections.abc import Mapping
+else:
+    Mapping = collections.Mapping
+
+
+def is_aws_object_class(expected_type):
+    return isinstance(expected_type, type) and issubclass(expected_type, troposphere.BaseAWSObject)
+
+def raise_type(cls, title, name, value, expected_type):
+    # same message as `BaseAWSObject._raise_type`
+    raise TypeError('%s: %s.%s is %s, expected %s' % (cls, title, name, type(value), expected_type))
+
+
+def compile_structure(name, expected_type):
+    """
+    Compiles the part of `_from_dict` that turns nested mappings into objects, for one property.
+    """
+    if is_aws_object_class(expected_type):
+        def convert(value):
+            if not isinstance(value, Mapping):
+                raise ValueError('Property definition for %s must be a Mapping type' % name)
+            return construct_property(expected_type, value)
+        return convert
+    if isinstance(expected_type, list):
+        element_type = expected_type[0] if expected_type else None
+        nested = is_aws_object_class(element_type)
+
+        def convert(value):
+            if not isinstance(value, list):
+                raise TypeError('Attribute %s must be a list.' % name)
+            if not nested:
+                return list(value)
+            converted = []
+            for item in value:
+                if not isinstance(item, Mapping):
+                    raise ValueError('Property definition for %s must be a list of Mapping types' % name)
+                converted.append(construct_property(element_type, item))
+            return converted
+        return convert
+    return None
+
+def compile_check(cls, name, expected_type):
+    """
+    Compiles the type check that `BaseAWSObject.__setattr__` does for one property.
+
+    The returned function takes the object's title as well, for error messages.
+    """
+    if isinstance(expected_type, types.FunctionType):
+        def check(title, value):
+            try:
+                return expected_type(value)
+            except Exception:
+                # reported like `BaseAWSObject.__setattr__` does
+                sys.stderr.write("%s: %s.%s function validator '%s' threw exception:\n" % (
+                    cls, title, name, expected_type.__name__,
+                ))
+                raise
+        return check
+    if isinstance(expected_type, list):
+        if len(expected_type) == 1 and isinstance(expected_type[0], types.FunctionType):
+            validator = expected_type[0]
+            return lambda title, value: list(map(validator, value))
+        accepted = tuple(expected_type) + (troposphere.AWSHelperFn,)
+
+        def check(title, value):
+            if not isinstance(value, list):
+                raise_type(cls, title, name, value, expected_type)
+            for item in value:
+                if not isinstance(item, accepted):
+                    raise_type(cls, title, name, item, expected_type)
+            return value
+        return check
+
+    def check(title, value):
+        if not isinstance(value, expected_type):
+            raise_type(cls, title, name, value, expected_type)
+        return value
+    return check
+
+
+class Schema(object):
+    """
+    The compiled `props` of one class.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.structures = {}
+        self.checks = {}
+        for name, (expected_type, _) in cls.props.items():
+            self.structures[name] = compile_structure(name, expected_type)
+            self.checks[name] = compile_check(cls, name, expected_type)
+
+    def construct(self, title, values):
+        """
+        Builds an instance of the class from a dict of property values.
+        """
+        converted = []
+        for name, value in values.items():
+            structure = self.structures.get(name, False)
+            if structure is False:
+                raise AttributeError(
+                    'Object type %s does not have a %s property.' % (self.cls.__name__, name),
+                )
+            converted.append((name, value if structure is None else structure(value)))
+        # validates the title and sets the defaults the class has for its properties
+        obj = self.cls(title)
+        properties = obj.properties
+        for name, value in converted:
+            if isinstance(value, troposphere.AWSHelperFn) and not isinstance(value, troposphere.Tags):
+                properties[name] = value
+            else:
+                properties[name] = self.checks[name](title, value)
+        return obj
+
+
+@lru_cache(None)
+def get_schema(cls):
+    return Schema(cls)
+
+def construct_property(property_cls, values):
+    """
+    Builds the equivalent of `property_cls.from_dict(None, values)`.
+    """
+    return get_schema(property_cls).construct(None, values)
+
+def construct_resource(resource_cls, title, values):
+    """
+    Builds the equivalent of `resource_cls.from_dict(title, values)`.
+    """
+    if 'ServiceToken' not in values or not title:
+        # leaves these to `Resource.__init__`, as CloudFormation always sends both
+        return resource_cls.from_dict(title, values)
+    return get_schema(resource_cls).construct(title, values)
@@ -0,0 +1,257 @@
+"""
+Implements a durable store of request results, so re-delivered events aren't executed twice.
+
+Results are keyed by the request ID and logical resource ID of the event. The first delivery
+claims its key as in progress, and once it finishes, the response sent to CloudFormation is
+recorded so that any re-delivery re-sends that response instead of calling the resource again.
+Every record expires after a TTL, after which the key can be claimed again.
+
+The last successful response for each physical resource is recorded as well, so that updates
+which don't change any properties can be answered without calling the resource.
+
+The `Data` of responses marked `NoEcho` is never stored, as it's usually secret. Their records
+can't be re-sent, so requests with such a record run the resource again instead.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+import attr
+from attr.validators import in_, instance_of, optional
+
+from .constants import RESULT_TABLE_ENV
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETE = 'COMPLETE'
+
+# how long a claim holds while its invocation runs, unless kept alive by a continuation
+IN_PROGRESS_TTL = 6 * 60
+
+# how long a finished result is re-sent to re-deliveries
+COMPLETE_TTL = 24 * 60 * 60
+
+# how long the last response for a resource is kept, updates after that call the resource again
+RESOURCE_TTL = 90 * 24 * 60 * 60
+
+# marks a stored response whose NoEcho data was left out
+DATA_OMITTED_KEY = 'NoEchoDataOmitted'
+
+
+@attr.s(frozen=True)
+class Record(object):
+    status = attr.ib(
+        validator=in_((IN_PROGRESS, COMPLETE)),
+    )
+    expires_at = attr.ib(
+        validator=instance_of((int, float)),
+    )
+    response = attr.ib(
+        validator=optional(instance_of(dict)),
+        default=None,
+    )
+
+    @property
+    def is_complete(self):
+        return self.status == COMPLETE
+
+    @property
+    def is_replayable(self):
+        """
+        Whether the recorded response can be sent again as is.
+        """
+        return self.is_complete and not (self.response or {}).get(DATA_OMITTED_KEY, False)
+
+
+def to_stored_response(response):
+    """
+    Gets the dict to record for a response, leaving out its data if it's marked NoEcho.
+    """
+    response_dict = response.to_dict()
+    if response.no_echo and response.data:
+        response_dict = dict(response_dict, Data={})
+        response_dict[DATA_OMITTED_KEY] = True
+    return response_dict
+
+def get_result_key(request):
+    return '{}#{}'.format(request.request_id, request.logical_resource_id)
+
+def get_resource_key(request, physical_resource_id):
+    return 'resource#{}#{}#{}'.format(request.stack_id, request.logical_resource_id, physical_resource_id)
+
+
+class ResultStore(object):
+    def begin(self, key, ttl=IN_PROGRESS_TTL, now=None):
+        """
+        Claims `key` as in progress, unless it already has an unexpired record.
+
+        Returns the existing record if there is one, or None if the caller now owns the key.
+        """
+        raise NotImplementedError()
+
+    def get(self, key, now=None):
+        """
+        Gets the unexpired record for `key`, or None if there isn't one.
+        """
+        raise NotImplementedError()
+
+    def keep_alive(self, key, ttl, now=None):
+        """
+        Extends the claim on `key`, such as while a continuation is pending.
+        """
+        raise NotImplementedError()
+
+    def complete(self, key, response, ttl=COMPLETE_TTL, now=None):
+        """
+        Records the response dict that was sent to CloudFormation for `key`.
+        """
+        raise NotImplementedError()
+
+
+class DynamoDBResultStore(ResultStore):
+    """
+    Keeps results in a DynamoDB table with a string hash key named `Key`.
+
+    `ExpiresAt` should be configured as the table's TTL attribute. Since DynamoDB deletes expired
+    items lazily, expiry is also checked when claiming a key.
+    """
+
+    def __init__(self, table_name, session):
+        self.table_name = table_name
+        self.session = session
+
+    @property
+    def client(self):
+        return self.session.client('dynamodb')
+
+    def _put(self, key, status, expires_at, response=None, **kwargs):
+        item = {
+            'Key': {'S': key},
+            'Status': {'S': status},
+            'ExpiresAt': {'N': str(int(expires_at))},
+        }
+        if response is not None:
+            item['Response'] = {'S': json.dumps(response, sort_keys=True)}
+        self.client.put_item(TableName=self.table_name, Item=item, **kwargs)
+
+    def _get(self, key):
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={'Key': {'S': key}},
+            ConsistentRead=True,
+        ).get('Item')
+        if item is None:
+            return None
+        return Record(
+            status=item['Status']['S'],
+            expires_at=int(item['ExpiresAt']['N']),
+            response=json.loads(item['Response']['S']) if 'Response' in item else None,
+        )
+
+    def begin(self, key, ttl=IN_PROGRESS_TTL, now=None):
+        now = time.time() if now is None else now
+        try:
+            self._put(
+                key, IN_PROGRESS, now + ttl,
+                ConditionExpression='attribute_not_exists(#key) OR #expires_at < :now',
+                ExpressionAttributeNames={'#key': 'Key', '#expires_at': 'ExpiresAt'},
+                ExpressionAttributeValues={':now': {'N': str(int(now))}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return self._get(key)
+        return None
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        record = self._get(key)
+        if record is None or record.expires_at < now:
+            return None
+        return record
+
+    def keep_alive(self, key, ttl, now=None):
+        now = time.time() if now is None else now
+        self._put(key, IN_PROGRESS, now + ttl)
+
+    def complete(self, key, response, ttl=COMPLETE_TTL, now=None):
+        now = time.time() if now is None else now
+        self._put(key, COMPLETE, now + ttl, response=response)
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    Keeps results in a local SQLite database, as a stand-in for DynamoDB in tests and tooling.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, status TEXT NOT NULL, expires_at REAL NOT NULL, response TEXT'
+                ')'
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        import sqlite3
+        # a connection per operation keeps the store usable from the batch worker threads
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level='IMMEDIATE')
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _put(connection, key, status, expires_at, response=None):
+        connection.execute(
+            'INSERT OR REPLACE INTO results (key, status, expires_at, response) VALUES (?, ?, ?, ?)',
+            (key, status, expires_at, None if response is None else json.dumps(response, sort_keys=True)),
+        )
+
+    @staticmethod
+    def _get(connection, key, now):
+        row = connection.execute(
+            'SELECT status, expires_at, response FROM results WHERE key = ? AND expires_at >= ?',
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        status, expires_at, response = row
+        return Record(
+            status=status,
+            expires_at=expires_at,
+            response=None if response is None else json.loads(response),
+        )
+
+    def begin(self, key, ttl=IN_PROGRESS_TTL, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as connection:
+            record = self._get(connection, key, now)
+            if record is not None:
+                return record
+            self._put(connection, key, IN_PROGRESS, now + ttl)
+        return None
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as connection:
+            return self._get(connection, key, now)
+
+    def keep_alive(self, key, ttl, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as connection:
+            self._put(connection, key, IN_PROGRESS, now + ttl)
+
+    def complete(self, key, response, ttl=COMPLETE_TTL, now=None):
+        now = time.time() if now is None else now
+        with self._transaction() as connection:
+            self._put(connection, key, COMPLETE, now + ttl, response=response)
+
+
+def get_result_store(session):
+    table_name = os.environ.get(RESULT_TABLE_ENV)
+    if not table_name:
+        return None
+    return DynamoDBResultStore(table_name, session)
@@ -0,0 +1,86 @@
+"""
+Implements delivery of custom resource responses to CloudFormation's presigned response URL.
+
+Responses go through a module-level `requests.Session`, so warm invocations keep their TCP and TLS
+connections alive, and transient failures are retried with exponential backoff and full jitter
+until either the attempt limit or the total time budget of the `RetryPolicy` runs out.
+"""
+
+import random
+import time
+
+import attr
+import requests
+from requests.adapters import HTTPAdapter
+
+from .util import lru_cache
+
+RETRYABLE_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+@attr.s(frozen=True)
+class RetryPolicy(object):
+    max_attempts = attr.ib(default=5)
+    base_delay = attr.ib(default=0.5)
+    max_delay = attr.ib(default=8.0)
+    total_timeout = attr.ib(default=60.0)
+    connect_timeout = attr.ib(default=5.0)
+    read_timeout = attr.ib(default=15.0)
+
+    def get_delay(self, attempt):
+        """
+        Gets a randomized delay before retry number `attempt` (starting at 1).
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+@lru_cache(1)
+def get_http_session():
+    """
+    Gets the process-wide HTTP session used for responses.
+    """
+    session = requests.Session()
+    # retries are handled by `put`, which knows about the overall time budget
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def is_retryable(ex):
+    if isinstance(ex, requests.exceptions.HTTPError):
+        return ex.response is not None and ex.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(ex, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def put(url, data, headers=None, retry_policy=None):
+    """
+    Sends a PUT request, retrying transient failures according to `retry_policy`.
+
+    Raises the last `requests.exceptions.RequestException` once retries are exhausted.
+    """
+    policy = retry_policy or DEFAULT_RETRY_POLICY
+    deadline = monotonic() + policy.total_timeout
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = max(deadline - monotonic(), 0.001)
+        try:
+            response = get_http_session().put(
+                url,
+                data=data,
+                headers=headers,
+                timeout=(min(policy.connect_timeout, remaining), min(policy.read_timeout, remaining)),
+            )
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as ex:
+            if not is_retryable(ex) or attempt >= policy.max_attempts:
+                raise
+            delay = policy.get_delay(attempt)
+            if monotonic() + delay >= deadline:
+                raise
+        time.sleep(delay)
@@ -0,0 +1,291 @@
+"""
+Sizes the Lambda function's memory from recorded events.
+
+The events are replayed through `cloudseeder.handler.handler` in a fresh process. AWS clients get
+canned responses instead of making requests, and responses to CloudFormation are captured rather
+than sent. The CPU time, wall time and peak RSS of the replay are measured there. Lambda allocates
+CPU in proportion to memory, so the CPU-bound part of each duration is then scaled to every
+candidate memory size to estimate its latency and cost.
+"""
+
+import contextlib
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+import attr
+
+# the handler and what it depends on are only imported by the replaying process, where that
+# import is measured
+from . import exceptions
+from .constants import CONTINUATION_QUEUE_URL_ENV, RESULT_TABLE_ENV
+
+# memory sizes considered, in MB
+MEMORY_SIZES = (128, 256, 384, 512, 768, 1024, 1536, 1769, 2048, 3008)
+
+# Lambda allocates a full vCPU at this much memory, and a proportional share below it
+FULL_CPU_MEMORY_SIZE = 1769
+
+PRICE_PER_GB_SECOND = 0.0000166667
+PRICE_PER_REQUEST = 0.0000002
+
+# room left for the runtime itself and for events bigger than the recorded ones
+MEMORY_HEADROOM = 1.25
+
+STRATEGIES = ('cost', 'speed', 'balanced')
+
+STUB_REGION = 'us-east-1'
+
+
+@attr.s(frozen=True)
+class Recording(object):
+    """
+    A recorded event, along with the responses AWS gave to the calls handling it made.
+
+    `responses` maps service names to operation names (such as `CreateTable`) to responses.
+    Calls without a recorded response get an empty one.
+    """
+    event = attr.ib()
+    responses = attr.ib(default=attr.Factory(dict))
+
+    @classmethod
+    def from_dict(cls, obj):
+        if 'event' in obj:
+            return cls(obj['event'], obj.get('responses', {}))
+        return cls(obj)
+
+
+def load_recordings(path):
+    """
+    Reads recordings from a JSON list or a JSON lines file, of either bare events or objects with
+    `event` and `responses` keys.
+    """
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        objs = json.loads(text)
+    else:
+        objs = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [Recording.from_dict(obj) for obj in objs]
+
+
+@attr.s(frozen=True)
+class Measurement(object):
+    cpu_seconds = attr.ib()
+    wall_seconds = attr.ib()
+
+    @classmethod
+    def of(cls, func, *args, **kwargs):
+        """
+        Calls `func`, returning a tuple of its measurement and its result.
+        """
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        result = func(*args, **kwargs)
+        return cls(time.process_time() - cpu_start, time.perf_counter() - wall_start), result
+
+
+@attr.s(frozen=True)
+class ReplayResult(object):
+    """
+    What replaying a set of recordings measured: the import of the handler (`init`), each
+    invocation (`invocations`), and the peak RSS of the process in MB.
+    """
+    init = attr.ib()
+    invocations = attr.ib()
+    peak_rss_mb = attr.ib()
+    statuses = attr.ib()
+
+
+class CannedResponder(object):
+    """
+    Answers every AWS API call from the current recording's responses instead of sending it.
+    """
+
+    def __init__(self):
+        self.responses = {}
+
+    def __call__(self, model, **kwargs):
+        from botocore.awsrequest import AWSResponse
+
+        operations = self.responses.get(model.service_model.service_name, {})
+        parsed = dict(operations.get(model.name, {}))
+        parsed.setdefault('ResponseMetadata', {'HTTPStatusCode': 200, 'RetryAttempts': 0})
+        return AWSResponse('https://stub.invalid/', 200, {}, None), parsed
+
+
+def create_stub_session(responder):
+    import boto3
+
+    from . import clients
+
+    session = boto3.session.Session(
+        aws_access_key_id='stub', aws_secret_access_key='stub', region_name=STUB_REGION,
+    )
+    # registered before any client exists, so every client copies it
+    session.events.register_first('before-call', responder)
+    return clients.PooledSession(session, clients.ClientPool())
+
+@contextlib.contextmanager
+def stubbed_endpoints(responder, statuses):
+    """
+    Points the handler at stubbed AWS clients, and records response statuses instead of sending them.
+    """
+    from . import clients, transport
+
+    session = create_stub_session(responder)
+
+    def put(url, data, headers=None, retry_policy=None):
+        statuses.append(json.loads(data.decode('utf-8'))['Status'])
+
+    original_get_session, original_put = clients.get_session, transport.put
+    clients.get_session, transport.put = lambda: session, put
+    try:
+        yield
+    finally:
+        clients.get_session, transport.put = original_get_session, original_put
+
+def get_peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+def replay(recordings):
+    """
+    Replays recordings through the handler in the current process, which should be a fresh one.
+    """
+    for name in (CONTINUATION_QUEUE_URL_ENV, RESULT_TABLE_ENV):
+        # the result store and continuations would otherwise talk to the stubs
+        os.environ.pop(name, None)
+    init, handler_module = Measurement.of(importlib.import_module, 'cloudseeder.handler')
+    responder = CannedResponder()
+    statuses = []
+    invocations = []
+    with stubbed_endpoints(responder, statuses):
+        for recording in recordings:
+            responder.responses = recording.responses
+            measurement, _ = Measurement.of(handler_module.handler, recording.event)
+            invocations.append(measurement)
+    return ReplayResult(init, tuple(invocations), get_peak_rss_mb(), tuple(statuses))
+
+def replay_in_subprocess(recordings):
+    """
+    Replays recordings in a freshly started interpreter, so imports and memory are measured cold.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(replay, recordings).result()
+
+
+def get_cpu_share(memory_size):
+    return min(1.0, float(memory_size) / FULL_CPU_MEMORY_SIZE)
+
+def estimate_duration(measurement, memory_size):
+    """
+    Scales the CPU-bound part of a measured duration to the CPU share of `memory_size`.
+
+    The rest of the duration, spent waiting on I/O, is assumed not to depend on memory.
+    """
+    waiting = max(measurement.wall_seconds - measurement.cpu_seconds, 0.0)
+    return measurement.cpu_seconds / get_cpu_share(memory_size) + waiting
+
+def get_invocation_cost(duration, memory_size):
+    billed_seconds = math.ceil(duration * 1000) / 1000.0
+    return billed_seconds * memory_size / 1024.0 * PRICE_PER_GB_SECOND + PRICE_PER_REQUEST
+
+
+@attr.s(frozen=True)
+class Estimate(object):
+    """
+    The estimated latency and cost of replaying the recordings with `memory_size` MB of memory.
+    """
+    memory_size = attr.ib()
+    init_seconds = attr.ib()
+    mean_seconds = attr.ib()
+    cost = attr.ib()
+    fits = attr.ib()
+
+    def to_dict(self):
+        return attr.asdict(self)
+
+
+def estimate(result, memory_size):
+    durations = [estimate_duration(invocation, memory_size) for invocation in result.invocations]
+    return Estimate(
+        memory_size=memory_size,
+        init_seconds=estimate_duration(result.init, memory_size),
+        mean_seconds=sum(durations) / max(len(durations), 1),
+        cost=sum(get_invocation_cost(duration, memory_size) for duration in durations),
+        fits=memory_size >= result.peak_rss_mb * MEMORY_HEADROOM,
+    )
+
+def recommend(estimates, strategy='balanced'):
+    """
+    Picks the best estimate whose memory size fits the replay.
+
+    `cost` picks the cheapest, `speed` the fastest, and `balanced` the lowest sum of cost and
+    latency, each relative to the best seen.
+    """
+    candidates = [candidate for candidate in estimates if candidate.fits]
+    if not candidates:
+        raise exceptions.TuningException(
+            'None of the memory sizes {} fit the replay'.format(
+                ', '.join(str(candidate.memory_size) for candidate in estimates),
+            ),
+        )
+    if strategy == 'cost':
+        key = lambda candidate: (candidate.cost, candidate.mean_seconds)
+    elif strategy == 'speed':
+        key = lambda candidate: (candidate.mean_seconds, candidate.cost)
+    elif strategy == 'balanced':
+        min_cost = min(candidate.cost for candidate in candidates) or 1.0
+        min_seconds = min(candidate.mean_seconds for candidate in candidates) or 1.0
+        key = lambda candidate: candidate.cost / min_cost + candidate.mean_seconds / min_seconds
+    else:
+        raise ValueError('Unknown tuning strategy {!r}'.format(strategy))
+    return min(candidates, key=key)
+
+
+@attr.s(frozen=True)
+class TuningReport(object):
+    result = attr.ib()
+    estimates = attr.ib()
+    recommended = attr.ib()
+    strategy = attr.ib()
+
+    def to_dict(self):
+        return {
+            'strategy': self.strategy,
+            'recommended_memory_size': self.recommended.memory_size,
+            'peak_rss_mb': self.result.peak_rss_mb,
+            'statuses': list(self.result.statuses),
+            'estimates': [row.to_dict() for row in self.estimates],
+        }
+
+    def format_table(self):
+        lines = ['{:>8} {:>10} {:>10} {:>14}'.format('memory', 'init ms', 'mean ms', 'cost $')]
+        for row in self.estimates:
+            lines.append('{:>8} {:>10.1f} {:>10.1f} {:>14.10f}{}{}'.format(
+                row.memory_size, row.init_seconds * 1000, row.mean_seconds * 1000, row.cost,
+                '' if row.fits else '  (too small)',
+                '  <- recommended' if row is self.recommended else '',
+            ))
+        return '\n'.join(lines)
+
+
+def tune(recordings, memory_sizes=MEMORY_SIZES, strategy='balanced', result=None):
+    """
+    Replays `recordings` and recommends one of `memory_sizes` for the function.
+
+    A `result` from an earlier replay can be passed in to skip replaying.
+    """
+    if result is None:
+        result = replay_in_subprocess(recordings)
+    estimates = [estimate(result, memory_size) for memory_size in memory_sizes]
+    return TuningReport(result, estimates, recommend(estimates, strategy), strategy)
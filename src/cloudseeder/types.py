@@ -3,12 +3,100 @@ import re
 
 import attr
 from attr.validators import instance_of, in_
-import troposphere
 
-from .exceptions import EventSerializationException
+from .diff import diff_properties
+from .exceptions import EventSerializationException, ResponseTooLargeException
 from .util import get_reason_from_exception
 
-@attr.s(frozen=True)
+CAMEL_CASE_BOUNDARY = re.compile('(?!^)([A-Z]+)')
+
+# keys of the events CloudFormation sends, so their attribute names are known up front
+EVENT_KEYS = (
+    'RequestType', 'RequestId', 'ResponseURL', 'ResourceType', 'LogicalResourceId', 'StackId',
+    'PhysicalResourceId', 'ResourceProperties', 'OldResourceProperties', 'ServiceToken',
+)
+
+# CloudFormation rejects response bodies larger than this
+MAX_RESPONSE_BYTES = 4096
+
+# caps the per-class key map, in case events come with arbitrary extra keys
+MAX_CACHED_KEYS = 256
+
+_MISSING = object()
+
+
+def to_attribute_name(key):
+    """
+    Converts a CamelCase event key (such as `ResponseURL`) to an attribute name (`response_url`).
+    """
+    return CAMEL_CASE_BOUNDARY.sub(r'_\1', key).lower()
+
+
+class _RequestSchema(object):
+    """
+    Parsing information compiled once per request class.
+
+    `key_map` maps event keys to attribute names (None for keys the class doesn't have), and
+    `checks` holds one (name, is_type_check, expected) tuple per attribute, mirroring its attrs
+    validator. `checks` is None if any attribute can't be checked this way, which disables the
+    fast path for the class. `defaults` holds the (name, value) pairs of attributes that aren't
+    taken by `__init__`.
+    """
+    __slots__ = ('key_map', 'checks', 'defaults', 'attribute_names')
+
+    def __init__(self, request_cls):
+        fields = [field for field in attr.fields(request_cls) if field.init]
+        self.attribute_names = frozenset(field.name for field in fields)
+        self.key_map = {}
+        for key in EVENT_KEYS:
+            self.get_attribute_name(key)
+        checks = tuple(self._get_check(field) for field in fields)
+        self.defaults = tuple(
+            (field.name, field.default) for field in attr.fields(request_cls) if not field.init
+        )
+        has_factories = any(isinstance(value, attr.Factory) for _, value in self.defaults)
+        self.checks = None if None in checks or has_factories else checks
+
+    @staticmethod
+    def _get_check(field):
+        if field.converter is not None or field.default is not attr.NOTHING:
+            return None
+        validator = field.validator
+        if isinstance(getattr(validator, 'type', None), (type, tuple)):
+            return field.name, True, validator.type
+        if isinstance(getattr(validator, 'options', None), (tuple, frozenset)):
+            return field.name, False, validator.options
+        return None
+
+    def get_attribute_name(self, key):
+        name = self.key_map.get(key, _MISSING)
+        if name is _MISSING:
+            name = to_attribute_name(key)
+            if name not in self.attribute_names:
+                name = None
+            if len(self.key_map) < MAX_CACHED_KEYS:
+                self.key_map[key] = name
+        return name
+
+    def construct(self, request_cls, values):
+        """
+        Builds a request without going through attrs, or returns None if any value is missing or
+        invalid, so the caller can construct it normally and get the usual error.
+        """
+        if self.checks is None or len(values) != len(self.checks):
+            return None
+        instance = object.__new__(request_cls)
+        for name, is_type_check, expected in self.checks:
+            value = values[name]
+            if not (isinstance(value, expected) if is_type_check else value in expected):
+                return None
+            object.__setattr__(instance, name, value)
+        for name, value in self.defaults:
+            object.__setattr__(instance, name, value)
+        return instance
+
+
+@attr.s(frozen=True, slots=True)
 class Request(object):
     request_type = attr.ib(
         validator=in_(('Create', 'Update', 'Delete')),
@@ -34,12 +122,18 @@ class Request(object):
 
     @classmethod
     def from_dict(cls, obj):
-        request_cls = globals().get(obj.get('RequestType', cls.__name__), cls)
-        request_cls_attrs = set(field.name for field in attr.fields(request_cls))
-        kwargs = {re.sub('(?!^)([A-Z]+)', r'_\1', k).lower(): v for k, v in obj.items()}
-        request_cls_kwargs = {k: v for k, v in kwargs.items() if k in request_cls_attrs}
+        request_cls = REQUEST_CLASSES.get(obj.get('RequestType', cls.__name__), cls)
+        schema = get_request_schema(request_cls)
+        kwargs = {}
+        for key, value in obj.items():
+            name = schema.get_attribute_name(key)
+            if name is not None:
+                kwargs[name] = value
+        request = schema.construct(request_cls, kwargs)
+        if request is not None:
+            return request
         try:
-            return request_cls(**request_cls_kwargs)
+            return request_cls(**kwargs)
         except ValueError as ex:
             raise EventSerializationException(
                 "Couldn't instantiate request object: {}; ".format(get_reason_from_exception(ex)) +
@@ -47,12 +141,12 @@ class Request(object):
             )
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class Create(Request):
     pass
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class Update(Request):
     physical_resource_id = attr.ib(
          validator=instance_of(str),
@@ -60,15 +154,44 @@ class Update(Request):
     old_resource_properties = attr.ib(
          validator=instance_of(dict),
     )
+    _property_diff = attr.ib(
+        init=False,
+        default=None,
+        repr=False,
+        eq=False,
+    )
 
+    @property
+    def property_diff(self):
+        """
+        The `cloudseeder.diff.PropertyDiff` from the old resource properties to the new ones.
 
-@attr.s(frozen=True)
+        It's computed on first use and kept for the lifetime of the request.
+        """
+        if self._property_diff is None:
+            property_diff = diff_properties(self.old_resource_properties, self.resource_properties)
+            object.__setattr__(self, '_property_diff', property_diff)
+        return self._property_diff
+
+
+@attr.s(frozen=True, slots=True)
 class Delete(Request):
     physical_resource_id = attr.ib(
         validator=instance_of(str),
     )
 
 
+REQUEST_CLASSES = {request_cls.__name__: request_cls for request_cls in (Request, Create, Update, Delete)}
+
+_REQUEST_SCHEMAS = {}
+
+def get_request_schema(request_cls):
+    schema = _REQUEST_SCHEMAS.get(request_cls)
+    if schema is None:
+        schema = _REQUEST_SCHEMAS[request_cls] = _RequestSchema(request_cls)
+    return schema
+
+
 @attr.s(frozen=True)
 class Response(object):
     physical_resource_id = attr.ib(
@@ -111,10 +234,61 @@ class Response(object):
             kwargs['physical_resource_id'] = request.physical_resource_id
         return cls(**kwargs)
 
+    @classmethod
+    def from_dict(cls, obj):
+        """
+        Rebuilds a response from the dict produced by `to_dict`.
+        """
+        return cls(**{name: obj[key] for name, key in RESPONSE_KEYS if key in obj})
+
     def to_dict(self):
-        return {k.title().replace('_', ''): v for k, v in attr.asdict(self).items()}
+        # `data` is passed through as is rather than deep copied
+        return {key: getattr(self, name) for name, key in RESPONSE_KEYS}
+
+    def encode(self):
+        """
+        Serializes the response into the request body sent to CloudFormation.
+
+        Raises `ResponseTooLargeException` if CloudFormation would reject the body for its size.
+        """
+        body = json.dumps(self.to_dict(), separators=(',', ':')).encode('utf-8')
+        if len(body) > MAX_RESPONSE_BYTES:
+            raise ResponseTooLargeException(
+                'Response is {} bytes, CloudFormation accepts at most {} bytes; '.format(
+                    len(body), MAX_RESPONSE_BYTES,
+                ) + 'reduce the size of the returned data',
+            )
+        return body
 
     @physical_resource_id.validator
     def _physical_resource_id_validator(self, attribute, value):
         if len(value) > 1024:
             raise EventSerializationException('Physical resource ID can be up to 1KB in size')
+
+
+RESPONSE_KEYS = tuple(
+    (field.name, field.name.title().replace('_', ''))
+    for field in attr.fields(Response)
+)
+
+
+@attr.s(frozen=True)
+class InProgress(object):
+    """
+    Returned by a resource method whose work continues past the current invocation.
+
+    `state` is handed back to the resource's `poll` method after roughly `delay` seconds.
+    """
+    state = attr.ib(
+        validator=instance_of(dict),
+        default=attr.Factory(dict),
+    )
+    delay = attr.ib(
+        validator=instance_of(int),
+        default=30,
+    )
+
+    @delay.validator
+    def _delay_validator(self, attribute, value):
+        if value < 0:
+            raise ValueError('Continuation delay must not be negative')
@@ -8,3 +8,11 @@ def get_reason_from_exception(ex):
     Turns an exception into a string similar to the last line of a traceback.
     """
     return '{}: {}'.format(ex.__class__.__name__, str(ex))
+
+def is_coroutine_function(func):
+    """
+    Checks if `func` was defined with `async def`, which is never the case before Python 3.5.
+    """
+    import inspect
+    check = getattr(inspect, 'iscoroutinefunction', None)
+    return check is not None and check(func)
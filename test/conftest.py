@@ -1,8 +1,26 @@
+import mock
 import troposphere
 import pytest
 
 from cloudseeder import types
 
+@pytest.fixture
+def patch_send_response_data():
+    """
+    Stops the handler from sending responses, making it return what it would have sent instead.
+    """
+    with mock.patch('cloudseeder.handler.send_response_data') as m:
+        m.side_effect = lambda url, response, retry_policy=None: response.to_dict()
+        yield m
+
+@pytest.fixture
+def patch_get_resource_class():
+    """
+    Makes the handler look up the resource class set as the mock's `return_value`.
+    """
+    with mock.patch('cloudseeder.handler.get_resource_class') as m:
+        yield m
+
 @pytest.fixture
 def template():
     template = troposphere.Template()
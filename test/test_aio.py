@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import boto3
+import mock
+import pytest
+from botocore.stub import Stubber
+
+from cloudseeder import aio, deadline, handler, resources
+
+
+class AsyncResource(resources.Resource):
+    resource_type = 'Custom::AsyncResource'
+    props = {
+        'Names': ([str], True),
+    }
+
+    async def create(self, request, session):
+        dynamodb = session.client('dynamodb')
+        results = await aio.gather_limited(
+            [dynamodb.describe_table(TableName=name) for name in self.Names], limit=2,
+        )
+        return 'async', {'Tables': ','.join(result['Table']['TableName'] for result in results)}
+
+
+@pytest.fixture
+def async_event(create_event):
+    create_event['ResourceType'] = AsyncResource.resource_type
+    create_event['ResourceProperties'] = {'Names': ['a']}
+    return create_event
+
+@pytest.fixture
+def stubbed_session():
+    session = boto3.Session(
+        aws_access_key_id='AKIDEXAMPLE',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+    client = session.client('dynamodb')
+    session = mock.Mock()
+    session.client.return_value = client
+    with Stubber(client) as stubber:
+        yield session, stubber
+        stubber.assert_no_pending_responses()
+
+def test_async_client(stubbed_session):
+    session, stubber = stubbed_session
+    stubber.add_response('describe_table', {'Table': {'TableName': 'abc'}}, {'TableName': 'abc'})
+    client = aio.AsyncSession(session).client('dynamodb')
+    assert client.exceptions is session.client().exceptions
+    result = aio.run(client.describe_table(TableName='abc'))
+    assert result['Table']['TableName'] == 'abc'
+
+def test_async_client_errors(stubbed_session):
+    session, stubber = stubbed_session
+    stubber.add_client_error('describe_table', 'ResourceNotFoundException')
+    client = aio.AsyncSession(session).client('dynamodb')
+    with pytest.raises(client.exceptions.ResourceNotFoundException):
+        aio.run(client.describe_table(TableName='abc'))
+
+def test_async_client_timeout():
+    client = mock.Mock()
+    client.meta.method_to_api_mapping = {'slow_call': 'SlowCall'}
+    client.slow_call.side_effect = lambda: time.sleep(0.5)
+    async_client = aio.AsyncClient(client, timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        aio.run(async_client.slow_call())
+
+def test_async_client_keeps_deadline():
+    client = mock.Mock()
+    client.meta.method_to_api_mapping = {'call': 'Call'}
+    client.call.side_effect = lambda: deadline.get_current_deadline()
+    event_deadline = deadline.Deadline()
+    with deadline.activate(event_deadline):
+        assert aio.run(aio.AsyncClient(client).call()) is event_deadline
+
+def test_gather_limited():
+    running = []
+    peak = []
+
+    async def work(value):
+        running.append(value)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(value)
+        return value
+
+    assert aio.run(aio.gather_limited([work(value) for value in range(6)], limit=2)) == list(range(6))
+    assert max(peak) == 2
+
+def test_gather_limited_exceptions():
+    async def fail():
+        raise KeyError('boom')
+
+    async def succeed():
+        return 'ok'
+
+    results = aio.run(aio.gather_limited([fail(), succeed()], limit=1, return_exceptions=True))
+    assert isinstance(results[0], KeyError)
+    assert results[1] == 'ok'
+
+def test_with_timeout_capped_by_deadline():
+    event_deadline = deadline.Deadline(deadline.monotonic() + 0.05, margin=0)
+    with deadline.activate(event_deadline):
+        with pytest.raises(asyncio.TimeoutError):
+            aio.run(aio.with_timeout(asyncio.sleep(1), 30))
+
+def test_run_in_thread():
+    results = []
+    thread = threading.Thread(target=lambda: results.append(aio.run(asyncio.sleep(0, 'done'))))
+    thread.start()
+    thread.join()
+    assert results == ['done']
+
+def test_handler_runs_async_resource(
+        async_event, stubbed_session, patch_get_resource_class, patch_send_response_data):
+    session, stubber = stubbed_session
+    patch_get_resource_class.return_value = AsyncResource
+    async_event['ResourceProperties']['Names'] = ['a', 'b']
+    # the calls run concurrently, so the order they reach the stub in isn't known
+    for _ in range(2):
+        stubber.add_response('describe_table', {'Table': {'TableName': 'described'}})
+    with mock.patch('cloudseeder.clients.get_session', return_value=session):
+        result = handler.handler(async_event)
+    assert result['Status'] == 'SUCCESS'
+    assert result['Data']['Tables'] == 'described,described'
@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+
+import mock
+import pytest
+
+from cloudseeder import batch, exceptions, handler, resources
+
+
+class BatchedResource(resources.Resource):
+    resource_type = 'Custom::MyCustomResourceType'
+    props = {
+        'key1': (str, True),
+        'key2': ([str], True),
+        'key3': (dict, True),
+    }
+
+    def create(self, request, session):
+        return request.request_id
+
+
+def sqs_record(message_id, event):
+    return {'eventSource': 'aws:sqs', 'messageId': message_id, 'body': json.dumps(event)}
+
+def sns_record(message_id, event):
+    return {'EventSource': 'aws:sns', 'Sns': {'MessageId': message_id, 'Message': json.dumps(event)}}
+
+def sns_via_sqs_record(message_id, event):
+    notification = {'Type': 'Notification', 'MessageId': 'sns-id', 'Message': json.dumps(event)}
+    return {'eventSource': 'aws:sqs', 'messageId': message_id, 'body': json.dumps(notification)}
+
+def test_is_batch_event(create_event):
+    assert not batch.is_batch_event(create_event)
+    assert not batch.is_batch_event({'Records': []})
+    assert batch.is_batch_event({'Records': [sqs_record('1', create_event)]})
+    assert batch.is_batch_event({'Records': [sns_record('1', create_event)]})
+    assert not batch.is_batch_event({'Records': [{'eventSource': 'aws:kinesis'}]})
+
+@pytest.mark.parametrize('wrap', (sqs_record, sns_record, sns_via_sqs_record))
+def test_unwrap_record(wrap, create_event):
+    assert batch.unwrap_record(wrap('abc', create_event)) == ('abc', create_event)
+
+def test_process_batch_partial_failure(create_event):
+    records = [sqs_record(str(i), dict(create_event, RequestId=str(i))) for i in range(5)]
+    records.append({'eventSource': 'aws:sqs', 'messageId': 'garbage', 'body': '{nope'})
+    def handle_event(event):
+        if event['RequestId'] == '3':
+            raise exceptions.CloudFormationReportingException()
+    result = batch.process_batch({'Records': records}, handle_event)
+    assert result == {'batchItemFailures': [{'itemIdentifier': '3'}, {'itemIdentifier': 'garbage'}]}
+
+def test_process_batch_sns_failure(create_event):
+    with pytest.raises(exceptions.BatchProcessingException):
+        batch.process_batch({'Records': [sns_record('1', create_event)]}, mock.Mock(side_effect=ValueError()))
+
+def test_process_batch_bounded_concurrency(create_event):
+    lock = threading.Lock()
+    running = []
+    peak = []
+    def handle_event(event):
+        with lock:
+            running.append(event)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(event)
+    records = [sqs_record(str(i), dict(create_event, RequestId=str(i))) for i in range(12)]
+    assert batch.process_batch({'Records': records}, handle_event, max_workers=3) == {'batchItemFailures': []}
+    assert len(peak) == 12
+    assert 1 < max(peak) <= 3
+
+def test_get_max_workers():
+    with mock.patch.dict('os.environ', {'CLOUDSEEDER_BATCH_WORKERS': '2'}):
+        assert batch.get_max_workers() == 2
+    with mock.patch.dict('os.environ', clear=True):
+        assert batch.get_max_workers() == batch.DEFAULT_BATCH_WORKERS
+
+def test_handler_batch(create_event, patch_get_resource_class, patch_send_response_data):
+    patch_get_resource_class.return_value = BatchedResource
+    records = [sqs_record(str(i), dict(create_event, RequestId=str(i))) for i in range(4)]
+    records.append(sqs_record('bad', dict(create_event, RequestType='Handstand')))
+    result = handler.handler({'Records': records})
+    assert result == {'batchItemFailures': [{'itemIdentifier': 'bad'}]}
+    assert patch_send_response_data.call_count == 4
+    physical_ids = set(call[0][1].physical_resource_id for call in patch_send_response_data.call_args_list)
+    assert physical_ids == {'0', '1', '2', '3'}
@@ -0,0 +1,246 @@
+import importlib
+import io
+import os
+import sys
+import zipfile
+
+import mock
+import pytest
+
+from cloudseeder import bundle
+
+
+@pytest.fixture
+def source(tmpdir):
+    tmpdir.join('a.py').write('A = 1\n' * 100)
+    tmpdir.join('pkg', 'b.py').write('B = 2\n' * 100, ensure=True)
+    tmpdir.join('pkg', 'empty.txt').write('')
+    return tmpdir
+
+def get_entries(source):
+    entries = [
+        bundle.FileEntry(name, str(source.join(*name.split('/'))))
+        for name in ('a.py', 'pkg/b.py', 'pkg/empty.txt')
+    ]
+    entries.append(bundle.DataEntry('generated.json', b'{}'))
+    return entries
+
+def build(tmpdir, source, incremental=True):
+    zip_path = str(tmpdir.join('out.zip'))
+    manifest_path = bundle.get_manifest_path(zip_path)
+    previous = bundle.PreviousBuild.load(zip_path, manifest_path) if incremental else None
+    f = io.BytesIO()
+    try:
+        manifest = bundle.write_zip(f, get_entries(source), previous=previous)
+    finally:
+        if previous is not None:
+            previous.close()
+    with open(zip_path, 'wb') as out:
+        out.write(f.getvalue())
+    bundle.write_manifest(manifest_path, manifest)
+    return zipfile.ZipFile(zip_path), manifest
+
+def assert_contents(zipf, source):
+    assert zipf.testzip() is None
+    assert zipf.read('a.py') == source.join('a.py').read_binary()
+    assert zipf.read('pkg/b.py') == source.join('pkg', 'b.py').read_binary()
+    assert zipf.read('pkg/empty.txt') == b''
+    assert zipf.read('generated.json') == b'{}'
+    for zipi in zipf.infolist():
+        assert zipi.external_attr == bundle.EXTERNAL_ATTR
+        assert zipi.compress_type == zipfile.ZIP_DEFLATED
+
+def test_write_zip(tmpdir, source):
+    zipf, manifest = build(tmpdir, source)
+    assert_contents(zipf, source)
+    assert sorted(manifest['entries']) == ['a.py', 'generated.json', 'pkg/b.py', 'pkg/empty.txt']
+
+def test_compress_matches_zipfile():
+    data = b'hello world ' * 1000
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr('x', data)
+    with zipfile.ZipFile(f) as zipf:
+        raw = bundle.read_raw_member(f, zipf.getinfo('x'))
+    assert bundle.compress('x', data).compressed == raw
+
+def test_zip_writer_names():
+    f = io.BytesIO()
+    f.write(b'prefix')
+    writer = bundle.ZipWriter(f)
+    writer.write(bundle.compress('caf\u00e9.txt', b'coffee'))
+    writer.write(bundle.compress('dir/plain.txt', b''))
+    writer.close()
+    with zipfile.ZipFile(io.BytesIO(f.getvalue()[len('prefix'):])) as zipf:
+        assert zipf.testzip() is None
+        assert zipf.namelist() == ['caf\u00e9.txt', 'dir/plain.txt']
+        assert zipf.read('caf\u00e9.txt') == b'coffee'
+        assert zipf.getinfo('dir/plain.txt').date_time == bundle.ZIP_DATE_TIME
+
+def test_incremental_reuses_unchanged(tmpdir, source):
+    build(tmpdir, source)
+    with mock.patch('cloudseeder.bundle.compress', wraps=bundle.compress) as m:
+        zipf, _ = build(tmpdir, source)
+    assert m.call_count == 0
+    assert_contents(zipf, source)
+
+def test_incremental_recompresses_changed(tmpdir, source):
+    build(tmpdir, source)
+    source.join('a.py').write('A = 3\n' * 50)
+    with mock.patch('cloudseeder.bundle.compress', wraps=bundle.compress) as m:
+        zipf, _ = build(tmpdir, source)
+    assert [call[0][0] for call in m.call_args_list] == ['a.py']
+    assert_contents(zipf, source)
+
+def test_incremental_touched_but_unchanged(tmpdir, source):
+    build(tmpdir, source)
+    path = str(source.join('a.py'))
+    os.utime(path, (0, 0))
+    with mock.patch('cloudseeder.bundle.compress', wraps=bundle.compress) as m:
+        zipf, manifest = build(tmpdir, source)
+    assert m.call_count == 0
+    assert manifest['entries']['a.py']['mtime_ns'] == 0
+    assert_contents(zipf, source)
+
+def test_incremental_corrupt_previous(tmpdir, source):
+    build(tmpdir, source)
+    tmpdir.join('out.zip').write('garbage')
+    zipf, _ = build(tmpdir, source)
+    assert_contents(zipf, source)
+
+def test_incremental_missing_manifest(tmpdir, source):
+    build(tmpdir, source)
+    tmpdir.join('out.zip.manifest.json').remove()
+    assert bundle.PreviousBuild.load(str(tmpdir.join('out.zip')), str(tmpdir.join('out.zip.manifest.json'))) is None
+
+def test_is_build_intact(tmpdir, source):
+    zip_path = str(tmpdir.join('out.zip'))
+    manifest_path = bundle.get_manifest_path(zip_path)
+    zipf, _ = build(tmpdir, source)
+    zipf.close()
+    assert bundle.is_build_intact(zip_path, manifest_path)
+    data = tmpdir.join('out.zip').read_binary()
+    tmpdir.join('out.zip').write_binary(data[:len(data) // 2])
+    assert not bundle.is_build_intact(zip_path, manifest_path)
+    tmpdir.join('out.zip').remove()
+    assert not bundle.is_build_intact(zip_path, manifest_path)
+
+def test_is_build_intact_other_contents(tmpdir, source):
+    zip_path = str(tmpdir.join('out.zip'))
+    manifest_path = bundle.get_manifest_path(zip_path)
+    zipf, _ = build(tmpdir, source)
+    zipf.close()
+    with zipfile.ZipFile(zip_path, 'a') as zipf:
+        zipf.writestr('extra.py', 'X = 1\n')
+    assert not bundle.is_build_intact(zip_path, manifest_path)
+    tmpdir.join('out.zip.manifest.json').remove()
+    assert not bundle.is_build_intact(zip_path, manifest_path)
+
+def test_incremental_mismatched_crc(tmpdir, source):
+    _, manifest = build(tmpdir, source)
+    previous = bundle.PreviousBuild.load(
+        str(tmpdir.join('out.zip')), str(tmpdir.join('out.zip.manifest.json')),
+    )
+    previous.manifest['a.py']['crc'] += 1
+    entry = get_entries(source)[0]
+    assert previous.get_unchanged_member(entry, stat=entry.stat()) is None
+    previous.close()
+
+def write_bytes(entries, previous=None, jobs=1):
+    f = io.BytesIO()
+    manifest = bundle.write_zip(f, entries, previous=previous, jobs=jobs)
+    return f.getvalue(), manifest
+
+def test_write_zip_sorted(source):
+    data, _ = write_bytes(reversed(get_entries(source)))
+    assert zipfile.ZipFile(io.BytesIO(data)).namelist() == sorted(entry.name for entry in get_entries(source))
+
+def test_parallel_identical_to_serial(source):
+    serial, serial_manifest = write_bytes(get_entries(source))
+    parallel, parallel_manifest = write_bytes(get_entries(source), jobs=2)
+    assert serial == parallel
+    assert serial_manifest == parallel_manifest
+
+def test_parallel_incremental_identical_to_serial(tmpdir, source):
+    build(tmpdir, source)
+    source.join('a.py').write('A = 3\n' * 50)
+    previous = bundle.PreviousBuild.load(
+        str(tmpdir.join('out.zip')), str(tmpdir.join('out.zip.manifest.json')),
+    )
+    try:
+        serial, _ = write_bytes(get_entries(source), previous=previous)
+        parallel, _ = write_bytes(get_entries(source), previous=previous, jobs=2)
+    finally:
+        previous.close()
+    assert serial == parallel
+
+def test_get_bytecode_name():
+    name = bundle.get_bytecode_name('pkg/mod.py')
+    if sys.version_info >= (3,):
+        assert name == 'pkg/__pycache__/mod.{}.pyc'.format(sys.implementation.cache_tag)
+    else:
+        assert name == 'pkg/mod.pyc'
+
+def test_bytecode_entry_skips_invalid_source(tmpdir):
+    tmpdir.join('bad.py').write('def broken(:\n')
+    entry = bundle.BytecodeEntry('bad.pyc', str(tmpdir.join('bad.py')), 'bad.py')
+    data, manifest = write_bytes([entry, bundle.DataEntry('x', b'')])
+    assert zipfile.ZipFile(io.BytesIO(data)).namelist() == ['x']
+    assert sorted(manifest['entries']) == ['x']
+
+def test_bytecode_entry_parallel_skips_invalid_source(tmpdir, source):
+    tmpdir.join('bad.py').write('def broken(:\n')
+    entries = get_entries(source) + [bundle.BytecodeEntry('bad.pyc', str(tmpdir.join('bad.py')), 'bad.py')]
+    assert write_bytes(entries, jobs=2) == write_bytes(get_entries(source))
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='unchecked bytecode needs PEP 552')
+def test_bytecode_entry_used_without_checking_source(tmpdir):
+    source = tmpdir.join('src', 'precompiled_module.py')
+    source.write('VALUE = 1\n', ensure=True)
+    name = bundle.get_bytecode_name('precompiled_module.py')
+    data, _ = write_bytes([
+        bundle.FileEntry('precompiled_module.py', str(source)),
+        bundle.BytecodeEntry(name, str(source), 'precompiled_module.py'),
+    ])
+    extracted = tmpdir.join('extracted')
+    zipfile.ZipFile(io.BytesIO(data)).extractall(str(extracted))
+    # a stale source proves the bytecode is loaded as is
+    extracted.join('precompiled_module.py').write('VALUE = 2\n')
+    sys.path.insert(0, str(extracted))
+    try:
+        module = importlib.import_module('precompiled_module')
+        assert module.VALUE == 1
+        assert module.__cached__.endswith(name.split('/')[-1])
+    finally:
+        sys.path.remove(str(extracted))
+        sys.modules.pop('precompiled_module', None)
+
+def test_write_zip_reproducible(tmpdir_factory):
+    outputs = []
+    for index, mtime in enumerate((1000000000, 1500000000)):
+        source = tmpdir_factory.mktemp('source{}'.format(index))
+        source.join('a.py').write('A = 1\n')
+        source.join('a.py').setmtime(mtime)
+        source.join('b.txt').write('b')
+        outputs.append(write_bytes([
+            bundle.FileEntry('b.txt', str(source.join('b.txt'))),
+            bundle.FileEntry('a.py', str(source.join('a.py'))),
+        ]))
+    (first, first_manifest), (second, second_manifest) = outputs
+    assert first == second
+    assert first_manifest['digest'] == second_manifest['digest']
+    for zipi in zipfile.ZipFile(io.BytesIO(first)).infolist():
+        assert zipi.date_time == bundle.ZIP_DATE_TIME
+
+def test_content_digest_changes_with_content():
+    _, manifest = write_bytes([bundle.DataEntry('x', b'1')])
+    _, changed = write_bytes([bundle.DataEntry('x', b'2')])
+    _, renamed = write_bytes([bundle.DataEntry('y', b'1')])
+    assert len({manifest['digest'], changed['digest'], renamed['digest']}) == 3
+
+def test_get_digest_manifest():
+    _, manifest = write_bytes([bundle.DataEntry('x', b'1')])
+    assert bundle.get_digest_manifest(manifest) == {
+        'digest': manifest['digest'],
+        'entries': {'x': manifest['entries']['x']['sha256']},
+    }
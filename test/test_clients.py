@@ -0,0 +1,75 @@
+import boto3
+import mock
+import pytest
+
+from cloudseeder import clients
+
+
+@pytest.fixture
+def session():
+    return boto3.Session(
+        aws_access_key_id='AKIDEXAMPLE',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+
+@pytest.fixture
+def pool():
+    return clients.ClientPool(maxsize=2)
+
+def test_client_reused(pool, session):
+    client = pool.get_client(session, 'cloudfront')
+    assert pool.get_client(session, 'cloudfront') is client
+    assert len(pool) == 1
+
+def test_client_keyed_by_service(pool, session):
+    assert pool.get_client(session, 'cloudfront') is not pool.get_client(session, 'dynamodb')
+
+def test_client_keyed_by_region(pool, session):
+    client = pool.get_client(session, 'dynamodb')
+    other = pool.get_client(session, 'dynamodb', region_name='eu-west-1')
+    assert client is not other
+    assert other.meta.region_name == 'eu-west-1'
+    assert pool.get_client(session, 'dynamodb', region_name='us-east-1') is client
+
+def test_client_keyed_by_credentials(pool, session):
+    other_session = boto3.Session(
+        aws_access_key_id='AKIDOTHER',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+    assert pool.get_client(session, 'dynamodb') is not pool.get_client(other_session, 'dynamodb')
+
+def test_client_keyed_by_kwargs(pool, session):
+    client = pool.get_client(session, 'dynamodb')
+    assert pool.get_client(session, 'dynamodb', endpoint_url='http://localhost:8000') is not client
+
+def test_client_eviction(pool, session):
+    client = pool.get_client(session, 'cloudfront')
+    pool.get_client(session, 'dynamodb')
+    # touching the first client makes dynamodb the least recently used one
+    pool.get_client(session, 'cloudfront')
+    pool.get_client(session, 'sqs')
+    assert len(pool) == 2
+    assert pool.get_client(session, 'cloudfront') is client
+
+def test_client_unhashable_kwargs(pool, session):
+    with mock.patch.object(session, 'client') as m:
+        pool.get_client(session, 'dynamodb', unhashable=[])
+        pool.get_client(session, 'dynamodb', unhashable=[])
+    assert m.call_count == 2
+    assert len(pool) == 0
+
+def test_pool_clear(pool, session):
+    pool.get_client(session, 'cloudfront')
+    pool.clear()
+    assert len(pool) == 0
+
+def test_pooled_session(pool, session):
+    pooled = clients.PooledSession(session, pool)
+    assert pooled.client('cloudfront') is pooled.client('cloudfront')
+    assert pooled.region_name == 'us-east-1'
+
+def test_get_session():
+    assert clients.get_session() is clients.get_session()
+    assert isinstance(clients.get_session(), clients.PooledSession)
@@ -0,0 +1,147 @@
+import json
+
+import mock
+import pytest
+
+from cloudseeder import continuation, exceptions, handler, resources, types
+
+
+class SlowResource(resources.Resource):
+    resource_type = 'Custom::SlowResource'
+    props = {
+        'Polls': (int, True),
+    }
+
+    def create(self, request, session):
+        return types.InProgress(state={'polls': 0}, delay=10)
+
+    def poll(self, request, session, state):
+        polls = state['polls'] + 1
+        if polls < self.Polls:
+            return types.InProgress(state={'polls': polls}, delay=10)
+        return 'slow-{}'.format(polls), {'Polls': str(polls)}
+
+
+class LocalScheduler(continuation.Scheduler):
+    """
+    Stand-in for the SQS scheduler that keeps scheduled events in memory.
+    """
+
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule(self, event, delay):
+        # round trip through JSON, like the message body would
+        self.scheduled.append((json.loads(json.dumps(event)), delay))
+
+    def deliver(self):
+        """
+        Delivers all scheduled events to the handler as one SQS batch.
+        """
+        records = [
+            {'eventSource': 'aws:sqs', 'messageId': str(i), 'body': json.dumps(event)}
+            for i, (event, _) in enumerate(self.scheduled)
+        ]
+        self.scheduled = []
+        return handler.handler({'Records': records})
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = LocalScheduler()
+    with mock.patch('cloudseeder.continuation.get_scheduler', return_value=scheduler):
+        yield scheduler
+
+@pytest.fixture
+def slow_event(create_event, patch_get_resource_class):
+    patch_get_resource_class.return_value = SlowResource
+    create_event['ResourceType'] = SlowResource.resource_type
+    create_event['ResourceProperties'] = {'Polls': 3}
+    return create_event
+
+def test_continuation(slow_event, scheduler, patch_get_resource_class, patch_send_response_data):
+    assert handler.handler(slow_event) is None
+    assert patch_send_response_data.call_count == 0
+    for attempt in (1, 2):
+        (event, delay), = scheduler.scheduled
+        assert delay == 10
+        assert event[continuation.CONTINUATION_KEY]['Attempt'] == attempt
+        assert scheduler.deliver() == {'batchItemFailures': []}
+        assert patch_send_response_data.call_count == 0
+    (event, _), = scheduler.scheduled
+    assert scheduler.deliver() == {'batchItemFailures': []}
+    _, response = patch_send_response_data.call_args[0]
+    result = response.to_dict()
+    assert result['Status'] == 'SUCCESS'
+    assert result['PhysicalResourceId'] == 'slow-3'
+    assert result['Data'] == {'Polls': '3'}
+    assert patch_send_response_data.call_count == 1
+    assert not scheduler.scheduled
+
+def test_continuation_timeout(slow_event, scheduler, patch_get_resource_class, patch_send_response_data):
+    handler.handler(slow_event)
+    (event, _), = scheduler.scheduled
+    event[continuation.CONTINUATION_KEY]['StartedAt'] -= continuation.MAX_CONTINUATION_SECONDS + 1
+    scheduler.scheduled = [(event, 10)]
+    scheduler.deliver()
+    _, response = patch_send_response_data.call_args[0]
+    result = response.to_dict()
+    assert result['Status'] == 'FAILED'
+    assert 'did not finish' in result['Reason']
+
+def test_continuation_not_configured(slow_event, patch_get_resource_class, patch_send_response_data):
+    with mock.patch.dict('os.environ', clear=True):
+        result = handler.handler(slow_event)
+    assert result['Status'] == 'FAILED'
+    assert 'ContinuationException' in result['Reason']
+
+def test_poll_default_impl(create_request):
+    with pytest.raises(NotImplementedError):
+        resources.Resource('Foo').poll(create_request, None, {})
+
+def test_continuation_round_trip(create_event):
+    assert continuation.Continuation.from_event(create_event) is None
+    pending = continuation.Continuation(state={'a': 'b'}, attempt=2, started_at=123.0)
+    event = pending.to_event(create_event)
+    assert continuation.CONTINUATION_KEY not in create_event
+    assert continuation.Continuation.from_event(event) == pending
+    assert types.Request.from_dict(event) == types.Request.from_dict(create_event)
+
+def test_schedule_attempts(create_event):
+    scheduler = LocalScheduler()
+    with mock.patch('cloudseeder.continuation.get_scheduler', return_value=scheduler):
+        first = continuation.schedule(create_event, types.InProgress(), None, None, now=100)
+        second = continuation.schedule(create_event, types.InProgress(), first, None, now=200)
+    assert (first.attempt, first.started_at) == (1, 100)
+    assert (second.attempt, second.started_at) == (2, 100)
+
+def test_schedule_delay_limited_to_time_left(create_event):
+    scheduler = LocalScheduler()
+    started = continuation.Continuation(state={}, attempt=1, started_at=0)
+    limit = continuation.MAX_CONTINUATION_SECONDS
+    with mock.patch('cloudseeder.continuation.get_scheduler', return_value=scheduler):
+        continuation.schedule(create_event, types.InProgress(delay=900), started, None, now=limit - 1000)
+        continuation.schedule(create_event, types.InProgress(delay=900), started, None, now=limit - 60)
+        continuation.schedule(create_event, types.InProgress(delay=30), started, None, now=limit - 60)
+        with pytest.raises(exceptions.ContinuationException):
+            continuation.schedule(create_event, types.InProgress(delay=900), started, None, now=limit)
+    assert [delay for _, delay in scheduler.scheduled] == [900, 60, 30]
+
+def test_sqs_scheduler(create_event):
+    session = mock.MagicMock()
+    scheduler = continuation.SQSScheduler('https://sqs.example.com/queue', session)
+    scheduler.schedule(create_event, 3600)
+    session.client.assert_called_with('sqs')
+    _, kwargs = session.client.return_value.send_message.call_args
+    assert kwargs['DelaySeconds'] == continuation.MAX_SQS_DELAY_SECONDS
+    assert json.loads(kwargs['MessageBody']) == create_event
+
+def test_get_scheduler():
+    with mock.patch.dict('os.environ', {'CLOUDSEEDER_CONTINUATION_QUEUE_URL': 'https://queue'}):
+        assert isinstance(continuation.get_scheduler(None), continuation.SQSScheduler)
+    with mock.patch.dict('os.environ', clear=True):
+        assert continuation.get_scheduler(None) is None
+
+def test_in_progress_negative_delay():
+    with pytest.raises(ValueError):
+        types.InProgress(delay=-1)
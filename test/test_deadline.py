@@ -0,0 +1,112 @@
+import threading
+
+import boto3
+import mock
+import pytest
+
+from cloudseeder import clients, deadline, exceptions, handler, resources, transport, types
+
+
+class FakeContext(object):
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+
+class HangingResource(resources.Resource):
+    resource_type = 'Custom::HangingResource'
+    props = {
+        'Checkpoint': (str, False),
+    }
+    release = threading.Event()
+
+    def create(self, request, session):
+        if hasattr(self, 'Checkpoint'):
+            deadline.get_current_deadline().checkpoint({'step': self.Checkpoint})
+        self.release.wait(5)
+        return 'finished'
+
+
+@pytest.fixture
+def hanging_event(create_event, patch_get_resource_class, patch_send_response_data):
+    HangingResource.release.clear()
+    patch_get_resource_class.return_value = HangingResource
+    create_event['ResourceType'] = HangingResource.resource_type
+    create_event['ResourceProperties'] = {}
+    yield create_event
+    HangingResource.release.set()
+
+def test_deadline_without_context():
+    event_deadline = deadline.Deadline.from_context(None)
+    assert event_deadline.remaining() is None
+    assert not event_deadline.expired
+    assert event_deadline.cap(30) == 30
+    assert event_deadline.get_waiter_config(5) == {'Delay': 5}
+    assert event_deadline.run(lambda: 'ran') == 'ran'
+
+def test_deadline_from_context():
+    now = [100.0]
+    event_deadline = deadline.Deadline.from_context(FakeContext(60), margin=10, clock=lambda: now[0])
+    assert event_deadline.get_invocation_remaining() == 60
+    assert event_deadline.remaining() == 50
+    assert event_deadline.cap(30) == 30
+    assert event_deadline.get_waiter_config(15) == {'Delay': 15, 'MaxAttempts': 3}
+    now[0] += 55
+    assert event_deadline.expired
+    assert event_deadline.get_waiter_config(15) == {'Delay': 15, 'MaxAttempts': 1}
+    with pytest.raises(exceptions.DeadlineExceededException):
+        event_deadline.check()
+
+def test_run_propagates_errors():
+    event_deadline = deadline.Deadline.from_context(FakeContext(60), margin=0)
+
+    def fail():
+        assert deadline.get_current_deadline() is event_deadline
+        raise KeyError('boom')
+
+    with pytest.raises(KeyError):
+        event_deadline.run(fail)
+    assert deadline.get_current_deadline() is not event_deadline
+
+def test_run_overrun_cancels():
+    event_deadline = deadline.Deadline.from_context(FakeContext(0.2), margin=0.1)
+    release = threading.Event()
+    with pytest.raises(exceptions.DeadlineExceededException):
+        event_deadline.run(release.wait, 5)
+    release.set()
+    assert event_deadline.cancelled
+
+def test_clients_refuse_calls_past_deadline():
+    session = boto3.Session(
+        aws_access_key_id='AKIDEXAMPLE',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+    client = clients.ClientPool().get_client(session, 'cloudfront')
+    event_deadline = deadline.Deadline()
+    event_deadline.cancel()
+    with deadline.activate(event_deadline):
+        with pytest.raises(exceptions.DeadlineExceededException):
+            client.list_distributions()
+
+def test_handler_overrun_fails(hanging_event):
+    with mock.patch.object(deadline, 'RESPONSE_MARGIN', 0.1):
+        result = handler.handler(hanging_event, FakeContext(0.3))
+    assert result['Status'] == 'FAILED'
+    assert 'DeadlineExceededException' in result['Reason']
+
+def test_handler_overrun_continues_from_checkpoint(hanging_event):
+    hanging_event['ResourceProperties'] = {'Checkpoint': 'halfway'}
+    with mock.patch.object(deadline, 'RESPONSE_MARGIN', 0.1), \
+            mock.patch('cloudseeder.continuation.schedule') as schedule:
+        assert handler.handler(hanging_event, FakeContext(0.3)) is None
+    (_, in_progress, _, _), _ = schedule.call_args
+    assert in_progress == types.InProgress(state={'step': 'halfway'}, delay=0)
+
+def test_response_retry_policy():
+    event_deadline = deadline.Deadline.from_context(FakeContext(12))
+    assert handler.get_response_retry_policy(event_deadline).total_timeout == pytest.approx(12, abs=0.1)
+    assert handler.get_response_retry_policy(deadline.Deadline()).total_timeout == \
+        transport.DEFAULT_RETRY_POLICY.total_timeout
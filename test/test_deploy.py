@@ -0,0 +1,228 @@
+import io
+import json
+import os
+import zipfile
+
+import mock
+import py
+import pytest
+
+from cloudseeder import bundle, deploy, exceptions, prune
+
+
+@pytest.fixture
+def site_packages(tmpdir):
+    tmpdir.join('cloudseeder', '__init__.py').write('', ensure=True)
+    tmpdir.join('cloudseeder', 'resource_index.json').write('{"Custom::Stale": "nope:Nope"}')
+    tmpdir.join('cloudseeder', '__init__.pyc').write('', ensure=True)
+    tmpdir.join('somedep', '__init__.py').write('VALUE = 1\n', ensure=True)
+    return str(tmpdir)
+
+def create_zip(site_packages):
+    f = io.BytesIO()
+    deploy.create_environment_zip(f, site_packages)
+    f.seek(0)
+    return zipfile.ZipFile(f)
+
+def test_create_environment_zip(site_packages):
+    zipf = create_zip(site_packages)
+    names = zipf.namelist()
+    assert 'somedep/__init__.py' in names
+    assert 'cloudseeder/__init__.pyc' not in names
+    assert zipf.read('somedep/__init__.py') == b'VALUE = 1\n'
+
+def test_create_environment_zip_resource_index(site_packages):
+    zipf = create_zip(site_packages)
+    assert zipf.namelist().count('cloudseeder/resource_index.json') == 1
+    index = json.loads(zipf.read('cloudseeder/resource_index.json').decode('utf-8'))
+    assert 'Custom::Stale' not in index
+    assert index['Custom::AWS.CloudFront.OriginAccessIdentity'] == \
+        'cloudseeder.resources.cloudfront:OriginAccessIdentity'
+
+def test_create_template_without_optional_features():
+    template = json.loads(deploy.create_template('code.zip'))
+    assert sorted(template['Resources']) == ['CloudSeederLambda', 'CloudSeederRole']
+    assert 'Environment' not in template['Resources']['CloudSeederLambda']['Properties']
+    assert list(template['Outputs']) == ['CloudSeederLambdaArn']
+
+def test_create_template_event_queue():
+    template = json.loads(deploy.create_template('code.zip', event_queue=True))
+    resources = template['Resources']
+    variables = resources['CloudSeederLambda']['Properties']['Environment']['Variables']
+    assert variables['CLOUDSEEDER_CONTINUATION_QUEUE_URL'] == {'Ref': 'CloudSeederEventQueue'}
+    mapping = resources['CloudSeederEventQueueMapping']['Properties']
+    assert mapping['EventSourceArn'] == {'Fn::GetAtt': ['CloudSeederEventQueue', 'Arn']}
+    assert mapping['FunctionResponseTypes'] == ['ReportBatchItemFailures']
+    subscription = resources['CloudSeederTopicSubscription']['Properties']
+    assert subscription['Endpoint'] == {'Fn::GetAtt': ['CloudSeederEventQueue', 'Arn']}
+    assert 'CloudSeederTopicArn' in template['Outputs']
+
+def test_write_environment_zip_incremental(tmpdir_factory, site_packages):
+    output = tmpdir_factory.mktemp('output')
+    zip_path = str(output.join('code.zip'))
+    first = deploy.write_environment_zip(zip_path, site_packages)
+    assert output.join('code.zip.manifest.json').check()
+    assert not output.join('code.zip.tmp').check()
+    second = deploy.write_environment_zip(zip_path, site_packages)
+    assert first == second
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        assert zipf.read('somedep/__init__.py') == b'VALUE = 1\n'
+
+def test_get_files_recursive_symlinks(tmpdir):
+    tmpdir.join('real', 'module.py').write('', ensure=True)
+    tmpdir.join('alias').mksymlinkto(tmpdir.join('real'))
+    tmpdir.join('real', 'loop').mksymlinkto(tmpdir)
+    files = list(deploy.get_files_recursive(str(tmpdir)))
+    assert len(files) == 1
+
+def test_create_environment_zip_plan(site_packages):
+    plan = prune.PrunePlan({'somedep/__init__.py': 'unused'}, {'somedep': 'unused'}, frozenset())
+    f = io.BytesIO()
+    deploy.create_environment_zip(f, site_packages, plan=plan)
+    f.seek(0)
+    names = zipfile.ZipFile(f).namelist()
+    assert 'somedep/__init__.py' not in names
+    assert 'cloudseeder/__init__.py' in names
+
+def test_write_prune_report(tmpdir):
+    plan = prune.PrunePlan({'somedep/__init__.py': 'unused'}, {'somedep': 'unused'}, frozenset(['sqs']))
+    path = tmpdir.join('code.zip.prune.json')
+    deploy.write_prune_report(str(path), plan)
+    assert json.loads(path.read()) == {
+        'distributions': {'somedep': 'unused'},
+        'services': {'kept': ['sqs'], 'dropped': []},
+        'files': {'unused': 1},
+    }
+
+def test_create_environment_zip_bytecode(site_packages):
+    f = io.BytesIO()
+    deploy.create_environment_zip(f, site_packages, bytecode_runtime=deploy.get_interpreter_runtime())
+    f.seek(0)
+    names = zipfile.ZipFile(f).namelist()
+    assert 'somedep/__init__.py' in names
+    assert bundle.get_bytecode_name('somedep/__init__.py') in names
+    # the build environment's own bytecode is never shipped
+    assert 'cloudseeder/__init__.pyc' not in names
+
+def test_create_environment_zip_bytecode_mismatch(site_packages):
+    with pytest.raises(exceptions.RuntimeMismatchException):
+        deploy.create_environment_zip(io.BytesIO(), site_packages, bytecode_runtime='python2.6')
+
+def test_create_template_runtime():
+    template = json.loads(deploy.create_template('code.zip', runtime='python3.9'))
+    assert template['Resources']['CloudSeederLambda']['Properties']['Runtime'] == 'python3.9'
+
+def test_write_environment_zip_digest_manifest(tmpdir_factory, site_packages):
+    output = tmpdir_factory.mktemp('output')
+    manifest = deploy.write_environment_zip(str(output.join('code.zip')), site_packages)
+    digest_manifest = json.loads(output.join('code.zip.digest.json').read())
+    assert digest_manifest['digest'] == manifest['digest']
+    assert 'mtime_ns' not in json.dumps(digest_manifest)
+
+def test_create_template_code_digest():
+    template = json.loads(deploy.create_template('code.zip', code_digest='abc'))
+    assert template['Resources']['CloudSeederLambda']['Metadata'] == {'CloudSeederCodeDigest': 'abc'}
+    assert 'Metadata' not in json.loads(deploy.create_template('code.zip'))['Resources']['CloudSeederLambda']
+
+def test_split_layer_entries():
+    entries = [
+        bundle.DataEntry('cloudseeder/__init__.py', b''),
+        bundle.DataEntry('cloudseeder-0.1.0.dist-info/RECORD', b''),
+        bundle.DataEntry('somedep/__init__.py', b''),
+        bundle.DataEntry('somedep-1.0.dist-info/RECORD', b''),
+    ]
+    function_entries, layer_entries = deploy.split_layer_entries(entries)
+    assert [entry.name for entry in function_entries] == [
+        'cloudseeder/__init__.py', 'cloudseeder-0.1.0.dist-info/RECORD',
+    ]
+    assert [entry.name for entry in layer_entries] == [
+        'python/somedep/__init__.py', 'python/somedep-1.0.dist-info/RECORD',
+    ]
+
+def test_get_dependency_key(site_packages):
+    tmpdir = py.path.local(site_packages)
+    tmpdir.join('cloudseeder-0.1.0.dist-info', 'RECORD').write('', ensure=True)
+    key = deploy.get_dependency_key(site_packages)
+    tmpdir.join('cloudseeder-0.1.0.dist-info').rename(tmpdir.join('cloudseeder-0.2.0.dist-info'))
+    tmpdir.join('somedep', '__init__.py').write('VALUE = 2\n')
+    assert deploy.get_dependency_key(site_packages) == key
+    tmpdir.join('somedep-1.0.dist-info', 'RECORD').write('', ensure=True)
+    assert deploy.get_dependency_key(site_packages) != key
+
+def test_write_layered_zips(tmpdir_factory, site_packages):
+    output = tmpdir_factory.mktemp('output')
+    zip_path = str(output.join('code.zip'))
+    _, layer_path = deploy.write_layered_zips(zip_path, site_packages)
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert sorted(zipf.namelist()) == ['cloudseeder/__init__.py', 'cloudseeder/resource_index.json']
+    with zipfile.ZipFile(layer_path) as zipf:
+        assert zipf.namelist() == ['python/somedep/__init__.py']
+    layer_mtime = os.path.getmtime(layer_path)
+    py.path.local(site_packages).join('cloudseeder', '__init__.py').write('CHANGED = True\n')
+    _, second_layer_path = deploy.write_layered_zips(zip_path, site_packages)
+    assert second_layer_path == layer_path
+    assert os.path.getmtime(layer_path) == layer_mtime
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.read('cloudseeder/__init__.py') == b'CHANGED = True\n'
+
+def test_write_layered_zips_damaged_layer(tmpdir_factory, site_packages):
+    output = tmpdir_factory.mktemp('output')
+    zip_path = str(output.join('code.zip'))
+    _, layer_path = deploy.write_layered_zips(zip_path, site_packages)
+    with open(layer_path, 'rb') as f:
+        data = f.read()
+    with open(layer_path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    _, layer_path = deploy.write_layered_zips(zip_path, site_packages)
+    with zipfile.ZipFile(layer_path) as zipf:
+        assert zipf.testzip() is None
+        assert zipf.namelist() == ['python/somedep/__init__.py']
+    os.remove(layer_path)
+    _, layer_path = deploy.write_layered_zips(zip_path, site_packages)
+    with zipfile.ZipFile(layer_path) as zipf:
+        assert zipf.namelist() == ['python/somedep/__init__.py']
+
+def test_create_template_layer():
+    template = json.loads(deploy.create_template('code.zip', runtime='python3.9', layer_path='layer.zip'))
+    resources = template['Resources']
+    layer = resources['CloudSeederDependencies']
+    assert layer['Type'] == 'AWS::Lambda::LayerVersion'
+    assert layer['Properties']['Content'].endswith('layer.zip')
+    assert layer['Properties']['CompatibleRuntimes'] == ['python3.9']
+    assert resources['CloudSeederLambda']['Properties']['Layers'] == [{'Ref': 'CloudSeederDependencies'}]
+
+def test_create_template_memory_size():
+    properties = json.loads(deploy.create_template('code.zip', memory_size=1024))['Resources']['CloudSeederLambda']['Properties']
+    assert properties['MemorySize'] == 1024
+    properties = json.loads(deploy.create_template('code.zip'))['Resources']['CloudSeederLambda']['Properties']
+    assert properties['MemorySize'] == deploy.DEFAULT_MEMORY_SIZE
+
+def test_create_template_lease_table():
+    resources = json.loads(deploy.create_template('code.zip', lease_table=True))['Resources']
+    variables = resources['CloudSeederLambda']['Properties']['Environment']['Variables']
+    assert variables['CLOUDSEEDER_LEASE_TABLE'] == {'Ref': 'CloudSeederLeaseTable'}
+    assert resources['CloudSeederLeaseTable']['Properties']['TimeToLiveSpecification']['AttributeName'] == 'ExpiresAt'
+
+def test_create_template_result_table():
+    resources = json.loads(deploy.create_template('code.zip', result_table=True))['Resources']
+    variables = resources['CloudSeederLambda']['Properties']['Environment']['Variables']
+    assert variables == {'CLOUDSEEDER_RESULT_TABLE': {'Ref': 'CloudSeederResultTable'}}
+
+def test_main_without_pruning_removes_stale_report(tmpdir_factory, site_packages):
+    output = tmpdir_factory.mktemp('output')
+    zip_path = output.join('code.zip')
+    report = output.join('code.zip.prune.json')
+    report.write('{}')
+    with mock.patch.object(deploy, 'get_site_packages', return_value=site_packages):
+        deploy.main([
+            '--no-prune', '--code-output', str(zip_path), '--template-output', str(output.join('template.json')),
+        ])
+    assert zip_path.check()
+    assert not report.check()
+
+def test_get_args_bytecode_mismatch(capsys):
+    with pytest.raises(SystemExit):
+        deploy.get_args(['--compile', '--runtime', 'python2.6'])
+    assert 'Bytecode for the python2.6 runtime' in capsys.readouterr().err
+    assert deploy.get_args(['--compile', '--runtime', deploy.get_interpreter_runtime()]).compile
@@ -0,0 +1,33 @@
+from cloudseeder import diff
+
+
+def test_diff_empty():
+    properties = {'ServiceToken': 'arn', 'Name': 'a', 'Tags': [{'Key': 'k', 'Value': 'v'}]}
+    assert diff.diff_properties(properties, dict(properties)).is_empty
+
+def test_diff_ignores_service_token():
+    assert diff.diff_properties({'ServiceToken': 'old'}, {'ServiceToken': 'new'}).is_empty
+
+def test_diff_nested():
+    old = {'Config': {'Comment': 'a', 'Removed': '1'}, 'Tags': ['a', 'b']}
+    new = {'Config': {'Comment': 'b', 'Added': '2'}, 'Tags': ['a'], 'Name': 'n'}
+    property_diff = diff.diff_properties(old, new)
+    assert property_diff.changes == (
+        diff.Change(diff.ADDED, ('Config', 'Added'), new='2'),
+        diff.Change(diff.MODIFIED, ('Config', 'Comment'), old='a', new='b'),
+        diff.Change(diff.REMOVED, ('Config', 'Removed'), old='1'),
+        diff.Change(diff.ADDED, ('Name',), new='n'),
+        diff.Change(diff.REMOVED, ('Tags', 1), old='b'),
+    )
+    assert property_diff.changed_properties == frozenset(['Config', 'Name', 'Tags'])
+    assert property_diff.has_changed('Tags')
+    assert len(property_diff.get_changes('Config')) == 3
+
+def test_diff_type_change():
+    property_diff = diff.diff_properties({'Value': ['a']}, {'Value': 'a'})
+    assert property_diff.changes == (diff.Change(diff.MODIFIED, ('Value',), old=['a'], new='a'),)
+
+def test_requires_replacement():
+    property_diff = diff.diff_properties({'Key': 'a', 'Comment': 'a'}, {'Key': 'a', 'Comment': 'b'})
+    assert not property_diff.requires_replacement(('Key',))
+    assert property_diff.requires_replacement(('Key', 'Comment'))
@@ -0,0 +1,102 @@
+import json
+import os
+import uuid
+
+import mock
+import pytest
+
+pytest.importorskip('jinja2')
+pytest.importorskip('markdown')
+pytest.importorskip('pygments')
+
+from cloudseeder import docs
+from cloudseeder.resources.cloudfront import OriginAccessIdentity
+from cloudseeder.resources.dynamodb import Table
+
+RESOURCES = [Table, OriginAccessIdentity]
+
+
+def read_pages(output_dir):
+    return {
+        name: output_dir.join(name).read()
+        for name in os.listdir(str(output_dir)) if name != docs.MANIFEST_NAME
+    }
+
+def test_placeholder_encoder_substitutes_type_names():
+    encoded = json.dumps({'A': str, 'B': [int, {'C': Table}]}, cls=docs.PlaceholderEncoder, sort_keys=True)
+    assert encoded == '{"A": String, "B": [Integer, {"C": Table}]}'
+
+def test_placeholder_encoder_leaves_other_uuids_alone():
+    value = str(uuid.uuid4())
+    encoded = json.dumps({'A': value, 'B': bool}, cls=docs.PlaceholderEncoder, sort_keys=True)
+    assert encoded == '{{"A": "{}", "B": Boolean}}'.format(value)
+
+def test_build_writes_pages_and_index(tmpdir):
+    rendered = docs.build(str(tmpdir), RESOURCES)
+    assert rendered == [OriginAccessIdentity.resource_type, Table.resource_type]
+    pages = read_pages(tmpdir)
+    assert sorted(pages) == [
+        'Custom-AWS.CloudFront.OriginAccessIdentity.html',
+        'Custom-AWS.DynamoDB.Table.html',
+        docs.INDEX_NAME,
+    ]
+    assert 'Custom-AWS.DynamoDB.Table.html' in pages[docs.INDEX_NAME]
+    assert 'AttributeDefinitions' in pages['Custom-AWS.DynamoDB.Table.html']
+
+def test_build_skips_unchanged_resources(tmpdir):
+    docs.build(str(tmpdir), RESOURCES)
+    before = read_pages(tmpdir)
+    with mock.patch.object(docs, 'render_resource_page') as render:
+        assert docs.build(str(tmpdir), RESOURCES) == []
+    assert not render.called
+    assert read_pages(tmpdir) == before
+
+def test_fingerprint_covers_base_classes():
+    sources = docs.get_class_sources(Table)
+    # `ServiceToken` comes from the metaclass of `Resource`
+    assert any('class _ResourceMeta(' in source for source in sources)
+    assert any('class Resource(' in source for source in sources)
+    fingerprint = docs.get_resource_fingerprint(Table)
+    with mock.patch.object(docs, 'get_class_sources', return_value=sources[:1]):
+        assert docs.get_resource_fingerprint(Table) != fingerprint
+
+def test_templates_fingerprint_covers_module():
+    fingerprint = docs.get_templates_fingerprint()
+    with mock.patch.object(docs.inspect, 'getsource', return_value='changed'):
+        assert docs.get_templates_fingerprint() != fingerprint
+
+def test_build_renders_changed_resources(tmpdir):
+    docs.build(str(tmpdir), RESOURCES)
+    fingerprint = docs.get_resource_fingerprint
+
+    def get_fingerprint(resource):
+        return 'changed' if resource is Table else fingerprint(resource)
+
+    with mock.patch.object(docs, 'get_resource_fingerprint', get_fingerprint):
+        assert docs.build(str(tmpdir), RESOURCES) == [Table.resource_type]
+
+def test_build_renders_everything_when_templates_change(tmpdir):
+    docs.build(str(tmpdir), RESOURCES)
+    with mock.patch.object(docs, 'get_templates_fingerprint', return_value='changed'):
+        assert len(docs.build(str(tmpdir), RESOURCES)) == 2
+
+def test_build_renders_missing_pages(tmpdir):
+    docs.build(str(tmpdir), RESOURCES)
+    tmpdir.join('Custom-AWS.DynamoDB.Table.html').remove()
+    assert docs.build(str(tmpdir), RESOURCES) == [Table.resource_type]
+    assert tmpdir.join('Custom-AWS.DynamoDB.Table.html').check()
+
+def test_build_not_incremental(tmpdir):
+    docs.build(str(tmpdir), RESOURCES)
+    assert len(docs.build(str(tmpdir), RESOURCES, incremental=False)) == 2
+
+def test_build_removes_pages_of_removed_resources(tmpdir):
+    docs.build(str(tmpdir), RESOURCES)
+    docs.build(str(tmpdir), [Table])
+    assert sorted(read_pages(tmpdir)) == ['Custom-AWS.DynamoDB.Table.html', docs.INDEX_NAME]
+    assert OriginAccessIdentity.resource_type not in read_pages(tmpdir)[docs.INDEX_NAME]
+
+def test_build_parallel_matches_serial(tmpdir):
+    docs.build(str(tmpdir.join('serial')), RESOURCES)
+    docs.build(str(tmpdir.join('parallel')), RESOURCES, jobs=2)
+    assert read_pages(tmpdir.join('serial')) == read_pages(tmpdir.join('parallel'))
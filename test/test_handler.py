@@ -1,8 +1,10 @@
+import json
+
 import mock
 import pytest
 import requests.exceptions
 
-from cloudseeder import exceptions, handler, resources, types
+from cloudseeder import exceptions, handler, resources, transport, types
 
 
 class MyCustomResourceType(resources.Resource):
@@ -25,14 +27,15 @@ def patch_get_custom_resources_mapping():
 
 @pytest.fixture
 def patch_requests_put():
-    with mock.patch('cloudseeder.handler.requests.put') as m:
-        yield m
+    with mock.patch('cloudseeder.transport.get_http_session') as m, \
+            mock.patch('cloudseeder.transport.time.sleep'):
+        yield m.return_value.put
 
 def test_handler(create_event, patch_get_custom_resources_mapping, patch_requests_put):
     handler_result = handler.handler(create_event, None)
     assert patch_requests_put.call_count == 1
     args, kwargs = patch_requests_put.call_args
-    assert handler_result == kwargs['json']
+    assert handler_result == json.loads(kwargs['data'].decode('utf-8'))
     assert handler_result['Status'] == 'SUCCESS'
 
 def test_handler_bad_resource_type(create_event, patch_get_custom_resources_mapping, patch_requests_put):
@@ -48,6 +51,14 @@ def test_handler_extra_request_keys(create_event, patch_get_custom_resources_map
     assert patch_requests_put.call_count == 1
     assert handler_result['Status'] == 'SUCCESS'
 
+def test_handler_failure_reports_created_resource(create_event, patch_get_custom_resources_mapping,
+                                                  patch_requests_put):
+    error = exceptions.ResourceOperationException('Table table is ARCHIVED', physical_resource_id='table')
+    with mock.patch.object(MyCustomResourceType, 'create', side_effect=error):
+        handler_result = handler.handler(create_event, None)
+    assert handler_result['Status'] == 'FAILED'
+    assert handler_result['PhysicalResourceId'] == 'table'
+
 def test_handler_unknown_method(create_event, patch_get_custom_resources_mapping, patch_requests_put):
     with pytest.raises(exceptions.EventSerializationException):
         create_event['RequestType'] = 'Handstand'
@@ -58,11 +69,39 @@ def test_handler_put_error(create_event, patch_get_custom_resources_mapping, pat
     patch_requests_put.side_effect = requests.exceptions.ConnectionError()
     with pytest.raises(exceptions.CloudFormationReportingException):
         handler.handler(create_event, None)
-    assert patch_requests_put.call_count == 1
+    assert patch_requests_put.call_count == transport.DEFAULT_RETRY_POLICY.max_attempts
 
 def test_get_custom_resources_mapping():
     assert handler.get_custom_resources_mapping()
 
+@pytest.fixture
+def patch_get_resource_index():
+    with mock.patch('cloudseeder.handler.get_resource_index') as m:
+        m.return_value = {}
+        yield m.return_value
+
+def test_get_resource_class_indexed(patch_get_resource_index, patch_get_custom_resources_mapping):
+    patch_get_resource_index['Custom::MyCustomResourceType'] = \
+        '{}:{}'.format(__name__, MyCustomResourceType.__name__)
+    assert handler.get_resource_class('Custom::MyCustomResourceType') is MyCustomResourceType
+    assert patch_get_custom_resources_mapping.call_count == 0
+
+def test_get_resource_class_not_indexed(patch_get_resource_index, patch_get_custom_resources_mapping):
+    assert handler.get_resource_class('Custom::MyCustomResourceType') is MyCustomResourceType
+    assert patch_get_custom_resources_mapping.call_count == 1
+
+@pytest.mark.parametrize('reference', (
+    'cloudseeder.resources.nope:MyCustomResourceType',
+    '{}:Nope'.format(__name__),
+    'cloudseeder.resources.cloudfront:OriginAccessIdentity',
+    'cloudseeder.resources:Resource',
+))
+def test_get_resource_class_stale_index(reference, patch_get_resource_index,
+                                        patch_get_custom_resources_mapping):
+    patch_get_resource_index['Custom::MyCustomResourceType'] = reference
+    assert handler.get_resource_class('Custom::MyCustomResourceType') is MyCustomResourceType
+    assert patch_get_custom_resources_mapping.call_count == 1
+
 def test_unpack_response_str(create_request):
     response = handler.unpack_response(create_request, 'foo')
     assert response.physical_resource_id == 'foo'
@@ -105,3 +144,41 @@ def test_create_canonical_request_id_update(update_request):
     request_id = handler.create_canonical_request_id(update_request)
     assert len(request_id) != 256 // 8 * 2
     assert request_id == update_request.physical_resource_id
+
+def test_send_response_data_too_large(create_request, patch_requests_put):
+    response = types.Response.from_request(
+        create_request,
+        status=True,
+        physical_resource_id='foo',
+        data={'Big': 'x' * types.MAX_RESPONSE_BYTES},
+    )
+    result = handler.send_response_data('https://example.com/', response)
+    assert patch_requests_put.call_count == 1
+    _, kwargs = patch_requests_put.call_args
+    assert json.loads(kwargs['data'].decode('utf-8')) == result
+    assert result['Status'] == 'FAILED'
+    assert result['PhysicalResourceId'] == 'foo'
+    assert result['Data'] == {}
+    assert 'ResponseTooLargeException' in result['Reason']
+
+def test_send_response_data_unserializable(create_request, patch_requests_put):
+    response = types.Response.from_request(
+        create_request,
+        status=True,
+        physical_resource_id='foo',
+        data={'Thing': object()},
+    )
+    result = handler.send_response_data('https://example.com/', response)
+    assert result['Status'] == 'FAILED'
+    assert 'TypeError' in result['Reason']
+
+def test_send_response_data_long_reason(create_request, patch_requests_put):
+    response = types.Response.from_request(
+        create_request,
+        status=False,
+        physical_resource_id='foo',
+        reason='x' * types.MAX_RESPONSE_BYTES,
+    )
+    result = handler.send_response_data('https://example.com/', response)
+    assert result['Status'] == 'FAILED'
+    assert len(result['Reason']) <= handler.MAX_FAILURE_REASON_LENGTH
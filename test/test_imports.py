@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import pytest
+
+import cloudseeder
+from cloudseeder import handler
+
+
+def get_imported_modules(statement):
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        '{}\nimport sys\nprint("\\n".join(sys.modules))'.format(statement),
+    ], universal_newlines=True)
+    return set(output.splitlines())
+
+@pytest.mark.parametrize('statement', ('import cloudseeder', 'import cloudseeder.types'))
+def test_import_is_lightweight(statement):
+    modules = get_imported_modules(statement)
+    assert not modules & {'boto3', 'botocore', 'requests', 'troposphere', 'cloudseeder.handler'}
+
+def test_lambda_handler_imports_handler():
+    modules = get_imported_modules('import cloudseeder\ncloudseeder.lambda_handler')
+    assert 'cloudseeder.handler' in modules
+
+def test_lambda_handler():
+    assert cloudseeder.lambda_handler is handler.handler
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        cloudseeder.nope
+
+def test_handler_defers_optional_modules():
+    modules = get_imported_modules('import cloudseeder.handler')
+    assert not modules & {
+        'boto3', 'requests', 'troposphere',
+        'cloudseeder.batch', 'cloudseeder.continuation', 'cloudseeder.profiling', 'cloudseeder.store',
+    }
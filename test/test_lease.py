@@ -0,0 +1,98 @@
+import boto3
+import mock
+import pytest
+from botocore.stub import Stubber
+
+from cloudseeder import lease
+
+
+def test_memory_acquire():
+    manager = lease.MemoryLeaseManager()
+    first = manager.acquire('name', 'first', slots=2, now=100)
+    second = manager.acquire('name', 'second', slots=2, now=100)
+    assert (first.slot, second.slot) == (0, 1)
+    assert manager.acquire('name', 'third', slots=2, now=100) is None
+    assert manager.acquire('other', 'third', now=100) is not None
+
+def test_memory_acquire_expired():
+    manager = lease.MemoryLeaseManager()
+    manager.acquire('name', 'first', ttl=10, now=100)
+    assert manager.acquire('name', 'second', ttl=10, now=105) is None
+    assert manager.acquire('name', 'second', ttl=10, now=111) == lease.Lease('name', 0, 'second')
+
+def test_memory_renew():
+    manager = lease.MemoryLeaseManager()
+    held = manager.acquire('name', 'first', ttl=10, now=100)
+    assert manager.acquire('name', 'first', ttl=10, now=105) == held
+    assert manager.renew(held, ttl=10, now=108)
+    assert manager.acquire('name', 'second', now=115) is None
+    manager.release(held)
+    taken = manager.acquire('name', 'second', now=115)
+    assert taken is not None
+    assert not manager.renew(held, now=116)
+    # releasing a lost lease leaves the new holder alone
+    manager.release(held)
+    assert manager.acquire('name', 'third', now=116) is None
+
+def test_lease_dict_round_trip():
+    held = lease.Lease('name', 1, 'owner')
+    assert lease.Lease.from_dict(held.to_dict()) == held
+
+def test_get_lease_manager(monkeypatch):
+    monkeypatch.delenv(lease.LEASE_TABLE_ENV, raising=False)
+    assert lease.get_lease_manager(None) is lease.get_memory_lease_manager()
+    monkeypatch.setenv(lease.LEASE_TABLE_ENV, 'leases')
+    manager = lease.get_lease_manager(None)
+    assert isinstance(manager, lease.DynamoDBLeaseManager)
+    assert manager.table_name == 'leases'
+
+@pytest.fixture
+def dynamodb():
+    session = boto3.Session(
+        aws_access_key_id='AKIDEXAMPLE',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+    client = session.client('dynamodb')
+    session = mock.Mock()
+    session.client.return_value = client
+    with Stubber(client) as stubber:
+        yield lease.DynamoDBLeaseManager('leases', session), stubber
+        stubber.assert_no_pending_responses()
+
+def get_put_params(slot, owner):
+    return {
+        'TableName': 'leases',
+        'Item': {
+            'Key': {'S': 'lease#name#{}'.format(slot)},
+            'Owner': {'S': owner},
+            'ExpiresAt': {'N': '110'},
+        },
+        'ConditionExpression': 'attribute_not_exists(#key) OR #expires_at < :now OR #owner = :owner',
+        'ExpressionAttributeNames': {'#key': 'Key', '#expires_at': 'ExpiresAt', '#owner': 'Owner'},
+        'ExpressionAttributeValues': {':now': {'N': '100'}, ':owner': {'S': owner}},
+    }
+
+def test_dynamodb_acquire(dynamodb):
+    manager, stubber = dynamodb
+    stubber.add_client_error('put_item', 'ConditionalCheckFailedException')
+    stubber.add_response('put_item', {}, get_put_params(1, 'owner'))
+    assert manager.acquire('name', 'owner', slots=2, ttl=10, now=100) == lease.Lease('name', 1, 'owner')
+
+def test_dynamodb_acquire_none_free(dynamodb):
+    manager, stubber = dynamodb
+    stubber.add_client_error('put_item', 'ConditionalCheckFailedException')
+    assert manager.acquire('name', 'owner', ttl=10, now=100) is None
+
+def test_dynamodb_release(dynamodb):
+    manager, stubber = dynamodb
+    stubber.add_response('delete_item', {}, {
+        'TableName': 'leases',
+        'Key': {'Key': {'S': 'lease#name#0'}},
+        'ConditionExpression': '#owner = :owner',
+        'ExpressionAttributeNames': {'#owner': 'Owner'},
+        'ExpressionAttributeValues': {':owner': {'S': 'owner'}},
+    })
+    stubber.add_client_error('delete_item', 'ConditionalCheckFailedException')
+    manager.release(lease.Lease('name', 0, 'owner'))
+    manager.release(lease.Lease('name', 0, 'owner'))
@@ -0,0 +1,47 @@
+import json
+
+import mock
+import pytest
+
+from cloudseeder import loader, resources
+from cloudseeder.resources.cloudfront import OriginAccessIdentity
+
+
+def test_build_resource_index():
+    index = loader.build_resource_index()
+    assert index['Custom::AWS.CloudFront.OriginAccessIdentity'] == \
+        'cloudseeder.resources.cloudfront:OriginAccessIdentity'
+
+def test_build_resource_index_matches_scan():
+    index = loader.build_resource_index()
+    scanned = {cls.resource_type: cls for cls in loader.load_custom_resources()}
+    assert set(index) == set(scanned)
+    for resource_type, reference in index.items():
+        assert loader.import_resource_class(reference) is scanned[resource_type]
+
+def test_import_resource_class():
+    cls = loader.import_resource_class('cloudseeder.resources.cloudfront:OriginAccessIdentity')
+    assert cls is OriginAccessIdentity
+
+def test_import_resource_class_missing():
+    with pytest.raises(AttributeError):
+        loader.import_resource_class('cloudseeder.resources.cloudfront:Nope')
+
+def test_is_custom_resource():
+    assert loader.is_custom_resource(OriginAccessIdentity)
+    assert not loader.is_custom_resource(resources.Resource)
+    assert not loader.is_custom_resource('Custom::Nope')
+
+def test_load_resource_index_missing():
+    with mock.patch('cloudseeder.loader.pkgutil.get_data', side_effect=IOError()):
+        assert loader.load_resource_index() is None
+
+def test_load_resource_index_corrupt():
+    with mock.patch('cloudseeder.loader.pkgutil.get_data', return_value=b'{nope'):
+        assert loader.load_resource_index() is None
+
+def test_load_resource_index():
+    index = {'Custom::Foo': 'foo:Foo'}
+    with mock.patch('cloudseeder.loader.pkgutil.get_data') as m:
+        m.return_value = json.dumps(index).encode('utf-8')
+        assert loader.load_resource_index() == index
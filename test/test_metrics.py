@@ -0,0 +1,151 @@
+import json
+
+import mock
+import pytest
+
+from cloudseeder import handler, metrics, resources, types
+
+
+class TimedResource(resources.Resource):
+    resource_type = 'Custom::TimedResource'
+
+    props = {
+        'Fail': (str, False),
+    }
+
+    def create(self, request, session):
+        if self.properties.get('Fail'):
+            raise ValueError('failed on purpose')
+        return 'timed'
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sink():
+    sink = metrics.ListSink()
+    previous = metrics.set_sink(sink)
+    yield sink
+    metrics.set_sink(previous)
+
+@pytest.fixture
+def timed_event(create_event, patch_get_resource_class, patch_send_response_data):
+    patch_get_resource_class.return_value = TimedResource
+    create_event['ResourceType'] = TimedResource.resource_type
+    create_event['ResourceProperties'] = {}
+    with mock.patch('cloudseeder.handler.get_result_store', return_value=None):
+        yield create_event
+
+def get_metric_names(document):
+    return [metric['Name'] for metric in document['_aws']['CloudWatchMetrics'][0]['Metrics']]
+
+def test_recorder_times_phases():
+    clock = FakeClock()
+    recorder = metrics.Recorder(clock=clock)
+    with recorder.time(metrics.PARSE):
+        clock.now += 0.002
+    with pytest.raises(ValueError):
+        with recorder.time(metrics.INVOKE):
+            clock.now += 0.5
+            raise ValueError()
+    with recorder.time(metrics.INVOKE):
+        clock.now += 0.25
+    assert recorder.timings == {metrics.PARSE: pytest.approx(0.002), metrics.INVOKE: pytest.approx(0.75)}
+
+def test_recorder_document():
+    clock = FakeClock()
+    recorder = metrics.Recorder(clock=clock)
+    recorder.cold_start = False
+    recorder.set_request('Custom::Thing', 'Create')
+    recorder.outcome = metrics.SUCCESS
+    with recorder.time(metrics.RESPOND):
+        clock.now += 0.01
+    clock.now += 0.03
+    document = recorder.to_document(namespace='Test', timestamp=1500000000.5)
+    assert document == {
+        '_aws': {
+            'Timestamp': 1500000000500,
+            'CloudWatchMetrics': [{
+                'Namespace': 'Test',
+                'Dimensions': metrics.DIMENSIONS,
+                'Metrics': [
+                    {'Name': 'Duration', 'Unit': 'Milliseconds'},
+                    {'Name': 'RespondTime', 'Unit': 'Milliseconds'},
+                    {'Name': 'ColdStart', 'Unit': 'Count'},
+                    {'Name': 'WarmStart', 'Unit': 'Count'},
+                ],
+            }],
+        },
+        'ResourceType': 'Custom::Thing',
+        'RequestType': 'Create',
+        'Outcome': 'Success',
+        'Duration': 40.0,
+        'RespondTime': 10.0,
+        'ColdStart': 0,
+        'WarmStart': 1,
+    }
+    # every dimension and metric must be a member of the document for CloudWatch to pick it up
+    for name in get_metric_names(document) + sum(metrics.DIMENSIONS, []):
+        assert name in document
+
+def test_namespace_from_environment():
+    with mock.patch.dict('os.environ', {metrics.METRICS_NAMESPACE_ENV: 'Custom'}):
+        assert metrics.Recorder().to_document()['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'Custom'
+    with mock.patch.dict('os.environ', clear=True):
+        assert metrics.get_namespace() == metrics.DEFAULT_NAMESPACE
+
+def test_cold_start_only_once():
+    with mock.patch.object(metrics, '_cold_start', True):
+        assert metrics.Recorder().cold_start
+        assert not metrics.Recorder().cold_start
+        assert not metrics.consume_cold_start()
+
+def test_emit_failure_is_logged(sink):
+    broken = mock.Mock()
+    broken.emit.side_effect = IOError()
+    metrics.Recorder().emit(broken)
+    assert sink.documents == []
+
+def test_stdout_sink(capsys):
+    metrics.StdoutSink().emit({'A': 1})
+    assert json.loads(capsys.readouterr().out) == {'A': 1}
+
+def test_handler_emits_phases(sink, timed_event):
+    assert handler.handler(timed_event)['Status'] == 'SUCCESS'
+    document, = sink.documents
+    assert document['ResourceType'] == TimedResource.resource_type
+    assert document['RequestType'] == 'Create'
+    assert document['Outcome'] == metrics.SUCCESS
+    assert set(get_metric_names(document)) == set(
+        ['{}Time'.format(phase) for phase in metrics.PHASES] + ['Duration', 'ColdStart', 'WarmStart'],
+    )
+
+def test_handler_emits_failures(sink, timed_event):
+    timed_event['ResourceProperties'] = {'Fail': 'yes'}
+    assert handler.handler(timed_event)['Status'] == 'FAILED'
+    document, = sink.documents
+    assert document['Outcome'] == metrics.FAILED
+    assert 'InvokeTime' in document
+
+def test_handler_emits_unparseable_events(sink, timed_event):
+    timed_event['RequestType'] = 'Handstand'
+    with pytest.raises(Exception):
+        handler.handler(timed_event)
+    document, = sink.documents
+    assert document['Outcome'] == metrics.ERROR
+    assert document['ResourceType'] == metrics.UNKNOWN
+    assert 'ParseTime' in document
+    assert 'InvokeTime' not in document
+
+def test_handler_emits_in_progress(sink, timed_event):
+    with mock.patch.object(TimedResource, 'create', return_value=types.InProgress(state={})), \
+            mock.patch('cloudseeder.continuation.schedule'):
+        assert handler.handler(timed_event) is None
+    assert sink.documents[0]['Outcome'] == metrics.IN_PROGRESS
+    assert 'RespondTime' not in sink.documents[0]
@@ -0,0 +1,235 @@
+import cProfile
+import json
+import pstats
+import sys
+import threading
+import time
+
+import boto3
+import mock
+import pytest
+from botocore.stub import Stubber
+
+from cloudseeder import deadline, handler, profiling, resources
+
+
+class FakeContext(object):
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+
+class MemorySink(object):
+    def __init__(self):
+        self.data = {}
+
+    def write(self, key, data):
+        self.data[key] = data
+
+
+class RecordingProfile(cProfile.Profile):
+    disabled_in = None
+
+    def disable(self):
+        self.disabled_in = threading.current_thread()
+        super(RecordingProfile, self).disable()
+
+
+def spin(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+class SlowResource(resources.Resource):
+    resource_type = 'Custom::SlowResource'
+    props = {
+        'Seconds': (str, False),
+    }
+
+    def create(self, request, session):
+        spin(float(getattr(self, 'Seconds', '0.05')))
+        return 'slow'
+
+
+@pytest.fixture
+def profile_dir(tmpdir):
+    return tmpdir.join('profiles')
+
+@pytest.fixture
+def slow_event(create_event, profile_dir, patch_get_resource_class, patch_send_response_data):
+    patch_get_resource_class.return_value = SlowResource
+    create_event['ResourceType'] = SlowResource.resource_type
+    create_event['ResourceProperties'] = {}
+    environ = {
+        profiling.PROFILE_RATE_ENV: '1',
+        profiling.PROFILE_DESTINATION_ENV: str(profile_dir),
+    }
+    with mock.patch('cloudseeder.handler.get_result_store', return_value=None), \
+            mock.patch.dict('os.environ', environ):
+        yield create_event
+
+def create_capture(mode=profiling.CPROFILE):
+    request = mock.Mock(
+        request_id='request',
+        stack_id='stack',
+        logical_resource_id='Slow',
+        physical_resource_id=None,
+        resource_type=SlowResource.resource_type,
+        request_type='Create',
+    )
+    return profiling.Capture(request, mode, MemorySink())
+
+def get_artifacts(profile_dir):
+    """
+    Maps the names of the files of the only profile written to their paths.
+    """
+    resource_dir, = profile_dir.listdir()
+    assert resource_dir.basename == 'Custom_SlowResource'
+    profile, = resource_dir.listdir()
+    return {path.basename: path for path in profile.listdir()}
+
+def test_config_from_environ():
+    assert profiling.ProfilingConfig.from_environ({}) is None
+    assert profiling.ProfilingConfig.from_environ({profiling.PROFILE_RATE_ENV: '0.5'}) is None
+    assert profiling.ProfilingConfig.from_environ({
+        profiling.PROFILE_RATE_ENV: 'often', profiling.PROFILE_DESTINATION_ENV: '/tmp',
+    }) is None
+    assert profiling.ProfilingConfig.from_environ({
+        profiling.PROFILE_RATE_ENV: '1', profiling.PROFILE_DESTINATION_ENV: '/tmp',
+        profiling.PROFILE_MODE_ENV: 'perf',
+    }) is None
+    assert profiling.ProfilingConfig.from_environ({
+        profiling.PROFILE_RATE_ENV: '2',
+        profiling.PROFILE_DESTINATION_ENV: 's3://bucket/prefix',
+        profiling.PROFILE_RESOURCE_TYPES_ENV: 'Custom::AWS.DynamoDB.*, Custom::Other,',
+        profiling.PROFILE_MODE_ENV: 'Sample',
+    }) == profiling.ProfilingConfig(
+        rate=1.0,
+        destination='s3://bucket/prefix',
+        resource_types=('Custom::AWS.DynamoDB.*', 'Custom::Other'),
+        mode=profiling.SAMPLE,
+    )
+
+def test_should_profile():
+    config = profiling.ProfilingConfig(rate=0.25, destination='/tmp', resource_types=('Custom::AWS.*',))
+    assert config.should_profile('Custom::AWS.DynamoDB.Table', sample=lambda: 0.1)
+    assert not config.should_profile('Custom::AWS.DynamoDB.Table', sample=lambda: 0.3)
+    assert not config.should_profile('Custom::Other', sample=lambda: 0.1)
+    assert profiling.ProfilingConfig(rate=0.25, destination='/tmp').matches('Custom::Other')
+
+def test_s3_sink():
+    session = boto3.Session(region_name='us-east-1', aws_access_key_id='a', aws_secret_access_key='b')
+    sink = profiling.get_sink(session, 's3://bucket/some/prefix')
+    assert (sink.bucket, sink.prefix) == ('bucket', 'some/prefix/')
+    with Stubber(sink.client) as stubber:
+        stubber.add_response('put_object', {}, {'Bucket': 'bucket', 'Key': 'some/prefix/a/b', 'Body': b'data'})
+        sink.write('a/b', b'data')
+        stubber.assert_no_pending_responses()
+    assert profiling.get_sink(session, 's3://bucket').prefix == ''
+
+def test_collapse_stack():
+    stack = profiling.collapse_stack(sys._getframe())
+    assert stack.split(';')[-1].startswith('test_collapse_stack (')
+
+def test_handler_cprofile(slow_event, profile_dir):
+    assert handler.handler(slow_event)['Status'] == 'SUCCESS'
+    artifacts = get_artifacts(profile_dir)
+    assert sorted(artifacts) == ['metadata.json', 'profile.pstats']
+    stats = pstats.Stats(str(artifacts['profile.pstats']))
+    assert any(function == 'spin' for _, _, function in stats.stats)
+    metadata = json.loads(artifacts['metadata.json'].read())
+    assert metadata['RequestId'] == slow_event['RequestId']
+    assert metadata['StackId'] == slow_event['StackId']
+    assert metadata['LogicalResourceId'] == slow_event['LogicalResourceId']
+    assert metadata['RequestType'] == 'Create'
+    assert metadata['Mode'] == profiling.CPROFILE
+    assert metadata['Completed']
+
+def test_handler_sampled(slow_event, profile_dir):
+    slow_event['ResourceProperties'] = {'Seconds': '0.2'}
+    with mock.patch.dict('os.environ', {profiling.PROFILE_MODE_ENV: profiling.SAMPLE}):
+        assert handler.handler(slow_event)['Status'] == 'SUCCESS'
+    artifacts = get_artifacts(profile_dir)
+    assert sorted(artifacts) == ['metadata.json', 'stacks.txt']
+    lines = artifacts['stacks.txt'].read().splitlines()
+    assert lines
+    assert any('spin (' in line for line in lines)
+    assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+
+def test_handler_filtered_out(slow_event, profile_dir):
+    with mock.patch.dict('os.environ', {profiling.PROFILE_RESOURCE_TYPES_ENV: 'Custom::AWS.*'}):
+        assert handler.handler(slow_event)['Status'] == 'SUCCESS'
+    assert not profile_dir.check()
+
+def test_handler_overrun_writes_partial_profile(slow_event, profile_dir):
+    slow_event['ResourceProperties'] = {'Seconds': '1'}
+    with mock.patch.dict('os.environ', {profiling.PROFILE_MODE_ENV: profiling.SAMPLE}), \
+            mock.patch.object(deadline, 'RESPONSE_MARGIN', 0.1):
+        assert handler.handler(slow_event, FakeContext(0.4))['Status'] == 'FAILED'
+    artifacts = get_artifacts(profile_dir)
+    assert not json.loads(artifacts['metadata.json'].read())['Completed']
+    assert artifacts['stacks.txt'].read()
+
+def test_export_failure_is_logged(slow_event):
+    with mock.patch.object(profiling.FileSink, 'write', side_effect=IOError()):
+        assert handler.handler(slow_event)['Status'] == 'SUCCESS'
+
+def test_sink_failure_runs_unprofiled(slow_event, profile_dir):
+    with mock.patch.object(profiling, 'get_sink', side_effect=RuntimeError('no S3 client')):
+        assert handler.handler(slow_event)['Status'] == 'SUCCESS'
+    assert not profile_dir.check()
+
+def test_one_cprofile_capture_at_a_time():
+    captures = [create_capture(), create_capture()]
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def work(index):
+        # both operations are running by the time either finishes
+        barrier.wait(5)
+        spin(0.01)
+        return index
+
+    def target(index):
+        results[index] = captures[index].run(work, index)
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {0: 0, 1: 1}
+    for capture in captures:
+        capture.export()
+    assert sorted(len(capture.sink.data) for capture in captures) == [0, 2]
+    # and the next operation can be profiled again
+    capture = create_capture()
+    capture.run(spin, 0.01)
+    assert capture.completed
+
+def test_start_failure_runs_unprofiled():
+    capture = create_capture()
+    with mock.patch.object(cProfile.Profile, 'enable', side_effect=ValueError('Another profiler is active')):
+        assert capture.run(lambda: 'done') == 'done'
+    capture.export()
+    assert capture.sink.data == {}
+    assert profiling._cprofile_lock.acquire(False)
+    profiling._cprofile_lock.release()
+
+def test_export_while_running_leaves_profiler_to_its_thread():
+    capture = create_capture()
+
+    def work():
+        # as the handler does once the deadline passes
+        exporter = threading.Thread(target=capture.export)
+        exporter.start()
+        exporter.join()
+        return threading.current_thread()
+
+    with mock.patch('cProfile.Profile', RecordingProfile):
+        worker = capture.run(work)
+    assert capture._profiler.disabled_in is worker
+    assert not capture.completed
+    assert any(key.endswith(profiling.PROFILE_NAMES[profiling.CPROFILE]) for key in capture.sink.data)
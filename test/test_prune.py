@@ -0,0 +1,93 @@
+import pytest
+
+from cloudseeder import prune
+
+
+def install(root, name, files):
+    dist_info = root.join('{}-1.0.dist-info'.format(name))
+    for path, content in files.items():
+        root.join(*path.split('/')).write(content, ensure=True)
+    record = ['{},,'.format(path) for path in sorted(files)]
+    record.append('{}-1.0.dist-info/RECORD,,'.format(name))
+    dist_info.join('RECORD').write('\n'.join(record) + '\n', ensure=True)
+
+@pytest.fixture
+def site_packages(tmpdir):
+    tmpdir.join('app', '__init__.py').write(
+        'import used\n'
+        'def handler(session):\n'
+        '    return session.client("sqs")\n',
+        ensure=True,
+    )
+    install(tmpdir, 'used', {
+        'used/__init__.py': 'from . import helper\n',
+        'used/helper.py': '',
+        'used/data.txt': 'needed at runtime',
+        'used/tests/__init__.py': '',
+        'used/tests/test_helper.py': '',
+    })
+    install(tmpdir, 'Unused_Thing', {'unused_thing.py': ''})
+    install(tmpdir, 'botocore', {
+        'botocore/__init__.py': '',
+        'botocore/data/endpoints.json': '{}',
+        'botocore/data/sqs/2012-11-05/service-2.json': '{}',
+        'botocore/data/ec2/2016-11-15/service-2.json': '{}',
+    })
+    tmpdir.join('app', 'aws.py').write('import botocore\n', ensure=True)
+    tmpdir.join('app', '__init__.py').write('from . import aws\n', mode='a')
+    return tmpdir
+
+def create_plan(site_packages, **kwargs):
+    root = str(site_packages)
+    return prune.create_plan(root, roots=['app'], path=[root], **kwargs)
+
+def test_read_distributions(site_packages):
+    distributions = {dist.name: dist for dist in prune.read_distributions(str(site_packages))}
+    assert sorted(distributions) == ['botocore', 'unused-thing', 'used']
+    assert 'unused-thing-1.0.dist-info/RECORD' not in distributions['unused-thing'].files
+    assert 'Unused_Thing-1.0.dist-info/RECORD' in distributions['unused-thing'].files
+    assert 'unused_thing.py' in distributions['unused-thing'].files
+
+def test_create_plan_unreachable_distribution(site_packages):
+    plan = create_plan(site_packages)
+    assert plan.is_excluded('unused_thing.py')
+    assert plan.is_excluded('Unused_Thing-1.0.dist-info/RECORD')
+    assert not plan.is_excluded('used/__init__.py')
+    assert not plan.is_excluded('used/data.txt')
+    assert not plan.is_excluded('used-1.0.dist-info/RECORD')
+    assert not plan.is_excluded('app/__init__.py')
+
+def test_create_plan_service_models(site_packages):
+    plan = create_plan(site_packages)
+    assert plan.used_services == frozenset(['sqs'])
+    assert plan.is_excluded('botocore/data/ec2/2016-11-15/service-2.json')
+    assert not plan.is_excluded('botocore/data/sqs/2012-11-05/service-2.json')
+    assert not plan.is_excluded('botocore/data/endpoints.json')
+
+def test_create_plan_test_suites(site_packages):
+    plan = create_plan(site_packages)
+    assert plan.is_excluded('used/tests/test_helper.py')
+
+def test_create_plan_allow_list(site_packages):
+    plan = create_plan(site_packages, include_distributions=['unused-thing'], include_services=['ec2'])
+    assert not plan.is_excluded('unused_thing.py')
+    assert not plan.is_excluded('botocore/data/ec2/2016-11-15/service-2.json')
+
+def test_get_report(site_packages):
+    report = create_plan(site_packages).get_report()
+    assert report['distributions'] == {'unused-thing': prune.UNREACHABLE_REASON}
+    assert report['services'] == {'kept': ['sqs'], 'dropped': ['ec2']}
+    assert report['files'] == {
+        prune.UNREACHABLE_REASON: 2,
+        prune.UNUSED_SERVICE_REASON: 1,
+        prune.TEST_SUITE_REASON: 2,
+    }
+
+def test_find_used_services(tmpdir):
+    source = tmpdir.join('module.py')
+    source.write(
+        "a = session.client('cloudfront')\n"
+        "b = boto3.resource(service_name='dynamodb')\n"
+        "c = session.client(name)\n"
+    )
+    assert prune.find_used_services([str(source)]) == {'cloudfront', 'dynamodb'}
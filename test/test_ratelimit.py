@@ -0,0 +1,146 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from cloudseeder import clients, deadline, exceptions, ratelimit
+from cloudseeder.resources import cloudfront
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def limiter(clock):
+    return ratelimit.RateLimiter(clock=clock, sleep=clock.sleep)
+
+@pytest.fixture
+def cloudfront_client(limiter):
+    session = boto3.Session(
+        aws_access_key_id='AKIDEXAMPLE',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+    client = clients.ClientPool(rate_limiter=limiter).get_client(session, 'cloudfront')
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+def test_bucket_burst_then_rate(clock):
+    bucket = ratelimit.TokenBucket(ratelimit.RateLimit(rate=2.0, burst=2), clock=clock, sleep=clock.sleep)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.now == pytest.approx(0.5)
+    clock.now += 10
+    # refills up to the burst size only
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, pytest.approx(0.5)]
+
+def test_bucket_timeout(clock):
+    bucket = ratelimit.TokenBucket(ratelimit.RateLimit(rate=1.0, burst=1), clock=clock, sleep=clock.sleep)
+    assert bucket.acquire(timeout=0) == 0
+    with pytest.raises(exceptions.DeadlineExceededException):
+        bucket.acquire(timeout=0.5)
+    # the token wasn't taken, so the next caller doesn't wait any longer for it
+    assert clock.sleeps == []
+    assert bucket.acquire(timeout=1.0) == pytest.approx(1.0)
+
+def test_bucket_aimd(clock):
+    limit = ratelimit.RateLimit(rate=10.0, burst=5, min_rate=1.0)
+    bucket = ratelimit.TokenBucket(limit, clock=clock, sleep=clock.sleep)
+    bucket.on_throttle()
+    assert bucket.rate == 5.0
+    assert bucket.acquire() == pytest.approx(0.2)
+    for _ in range(5):
+        bucket.on_throttle()
+    assert bucket.rate == 1.0
+    bucket.on_success()
+    assert bucket.rate == 2.0
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate == 10.0
+
+def test_limiter_limits_by_operation(limiter):
+    limiter.configure({
+        'cloudfront': ratelimit.RateLimit(rate=2.0, burst=4),
+        ('cloudfront', 'GetDistribution'): ratelimit.RateLimit(rate=1.0, burst=1),
+    })
+    assert limiter.get_bucket('cloudfront', 'ListDistributions').limit.rate == 2.0
+    assert limiter.get_bucket('cloudfront', 'GetDistribution').limit.rate == 1.0
+    assert limiter.get_bucket('dynamodb', 'GetItem').limit == ratelimit.DEFAULT_RATE_LIMIT
+    assert limiter.get_bucket('cloudfront', 'ListDistributions') is \
+        limiter.get_bucket('cloudfront', 'ListDistributions')
+
+def test_limiter_configure_updates_buckets(limiter):
+    bucket = limiter.get_bucket('cloudfront', 'ListDistributions')
+    limiter.configure({'cloudfront': ratelimit.RateLimit(rate=1.0, burst=1)})
+    assert bucket.rate == 1.0
+    assert bucket.tokens == 1.0
+
+def test_configure_resource(limiter):
+    limiter.configure_resource(cloudfront.OriginAccessIdentity)
+    assert limiter.get_limit('cloudfront', 'ListDistributions') == cloudfront.RATE_LIMITS['cloudfront']
+
+def test_client_calls_take_tokens(cloudfront_client, limiter, clock):
+    client, stubber = cloudfront_client
+    limiter.configure({'cloudfront': ratelimit.RateLimit(rate=1.0, burst=1)})
+    stubber.add_response('list_distributions', {})
+    stubber.add_response('list_distributions', {})
+    client.list_distributions()
+    client.list_distributions()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+def test_client_calls_fail_rather_than_wait_past_deadline(cloudfront_client, limiter, clock):
+    client, stubber = cloudfront_client
+    limiter.configure({'cloudfront': ratelimit.RateLimit(rate=1.0, burst=1)})
+    stubber.add_response('list_distributions', {})
+    stubber.add_response('list_distributions', {})
+    with deadline.activate(deadline.Deadline(expires_at=0.5, margin=0, clock=clock)):
+        client.list_distributions()
+        with pytest.raises(exceptions.DeadlineExceededException):
+            client.list_distributions()
+    assert clock.sleeps == []
+    client.list_distributions()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+def test_client_throttling_backs_off(cloudfront_client, limiter):
+    client, stubber = cloudfront_client
+    stubber.add_client_error('list_distributions', 'Throttling', http_status_code=400)
+    with pytest.raises(ClientError):
+        client.list_distributions()
+    bucket = limiter.get_bucket('cloudfront', 'ListDistributions')
+    assert bucket.rate == ratelimit.DEFAULT_RATE_LIMIT.rate * ratelimit.DECREASE_FACTOR
+    stubber.add_client_error('list_distributions', 'AccessDenied', http_status_code=403)
+    with pytest.raises(ClientError):
+        client.list_distributions()
+    # other errors neither throttle nor recover
+    assert bucket.rate == ratelimit.DEFAULT_RATE_LIMIT.rate * ratelimit.DECREASE_FACTOR
+    stubber.add_response('list_distributions', {})
+    client.list_distributions()
+    assert bucket.rate > ratelimit.DEFAULT_RATE_LIMIT.rate * ratelimit.DECREASE_FACTOR
+
+def test_is_throttled():
+    assert ratelimit.is_throttled({'Error': {'Code': 'ThrottlingException'}})
+    # quota errors, such as DynamoDB's limit on tables being created, aren't throttling
+    assert not ratelimit.is_throttled({'Error': {'Code': 'LimitExceededException'}})
+    assert not ratelimit.is_throttled({})
+
+def test_client_retries_count_as_throttling(cloudfront_client, limiter):
+    client, stubber = cloudfront_client
+    stubber.add_response('list_distributions', {'ResponseMetadata': {'RetryAttempts': 2}})
+    client.list_distributions()
+    assert limiter.get_bucket('cloudfront', 'ListDistributions').rate < ratelimit.DEFAULT_RATE_LIMIT.rate
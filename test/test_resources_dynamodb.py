@@ -0,0 +1,293 @@
+import boto3
+import mock
+import pytest
+from botocore.stub import ANY, Stubber
+
+from cloudseeder import exceptions, handler, lease, types
+from cloudseeder.resources import dynamodb
+
+TABLE_ARN = 'arn:aws:dynamodb:us-east-1:123456789012:table/{}'
+
+PROPERTIES = {
+    'AttributeDefinitions': [
+        {'AttributeName': 'Id', 'AttributeType': 'S'},
+        {'AttributeName': 'Owner', 'AttributeType': 'S'},
+    ],
+    'KeySchema': [{'AttributeName': 'Id', 'KeyType': 'HASH'}],
+    'ProvisionedThroughput': {'ReadCapacityUnits': '5', 'WriteCapacityUnits': '5'},
+}
+
+INDEX = {
+    'IndexName': 'ByOwner',
+    'KeySchema': [{'AttributeName': 'Owner', 'KeyType': 'HASH'}],
+    'Projection': {'ProjectionType': 'KEYS_ONLY'},
+    'ProvisionedThroughput': {'ReadCapacityUnits': '1', 'WriteCapacityUnits': '1'},
+}
+
+
+@pytest.fixture
+def leases(monkeypatch):
+    manager = lease.MemoryLeaseManager()
+    monkeypatch.delenv(lease.LEASE_TABLE_ENV, raising=False)
+    monkeypatch.setattr(lease, 'get_memory_lease_manager', lambda: manager)
+    return manager
+
+@pytest.fixture
+def dynamodb_session(leases):
+    session = boto3.Session(
+        aws_access_key_id='AKIDEXAMPLE',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+    client = session.client('dynamodb')
+    session = mock.Mock()
+    session.client.return_value = client
+    with Stubber(client) as stubber:
+        yield session, stubber
+        stubber.assert_no_pending_responses()
+
+def create_request(create_event, **properties):
+    create_event['ResourceType'] = dynamodb.Table.resource_type
+    create_event['ResourceProperties'] = dict(PROPERTIES, **properties)
+    return types.Request.from_dict(create_event)
+
+def create_update_request(update_event, old_properties, **properties):
+    update_event['ResourceType'] = dynamodb.Table.resource_type
+    update_event['PhysicalResourceId'] = 'table'
+    update_event['ResourceProperties'] = dict(PROPERTIES, **properties)
+    update_event['OldResourceProperties'] = old_properties
+    return types.Request.from_dict(update_event)
+
+def get_resource(request):
+    return dynamodb.Table.from_dict(request.logical_resource_id, request.resource_properties)
+
+def describe(name, status='ACTIVE', **kwargs):
+    table = {
+        'TableName': name,
+        'TableStatus': status,
+        'TableArn': TABLE_ARN.format(name),
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+    }
+    table.update(kwargs)
+    return {'Table': table}
+
+def test_table_properties_vivify():
+    table = dynamodb.Table.from_dict('Table', dict(PROPERTIES, GlobalSecondaryIndexes=[INDEX]))
+    index = table.properties['GlobalSecondaryIndexes'][0]
+    assert isinstance(index, dynamodb.GlobalSecondaryIndex)
+    assert dynamodb.to_api_value(index)['ProvisionedThroughput'] == {
+        'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1,
+    }
+
+def test_get_table_name(create_event):
+    request = create_request(create_event)
+    name = get_resource(request).get_table_name(request)
+    assert name.startswith('stack-name-BigCustomMan-')
+    assert name == get_resource(request).get_table_name(request)
+    request = create_request(create_event, TableName='named')
+    assert get_resource(request).get_table_name(request) == 'named'
+
+def test_create_without_indexes(create_event, dynamodb_session, leases):
+    session, stubber = dynamodb_session
+    request = create_request(create_event, TableName='table')
+    stubber.add_response('create_table', {}, {
+        'TableName': 'table',
+        'AttributeDefinitions': PROPERTIES['AttributeDefinitions'],
+        'KeySchema': PROPERTIES['KeySchema'],
+        'BillingMode': 'PROVISIONED',
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+    })
+    result = get_resource(request).create(request, session)
+    assert result.state == {'phase': dynamodb.CREATING, 'table_name': 'table', 'lease': None}
+    stubber.add_response('describe_table', describe('table'), {'TableName': 'table'})
+    assert get_resource(request).poll(request, session, result.state) == \
+        ('table', {'Arn': TABLE_ARN.format('table')})
+
+def test_create_with_indexes_takes_lease(create_event, dynamodb_session, leases, monkeypatch):
+    monkeypatch.setenv(dynamodb.INDEXED_TABLE_CREATION_SLOTS_ENV, '1')
+    session, stubber = dynamodb_session
+    request = create_request(create_event, TableName='table', GlobalSecondaryIndexes=[INDEX])
+    resource = get_resource(request)
+    stubber.add_response('create_table', {}, {
+        'TableName': 'table',
+        'AttributeDefinitions': ANY,
+        'KeySchema': ANY,
+        'BillingMode': 'PROVISIONED',
+        'ProvisionedThroughput': ANY,
+        'GlobalSecondaryIndexes': [dynamodb.to_api_value(resource.properties['GlobalSecondaryIndexes'][0])],
+    })
+    result = resource.create(request, session)
+    assert result.state['lease'] == {'name': dynamodb.INDEXED_TABLE_LEASE, 'slot': 0, 'owner': 'table'}
+
+    # another table with indexes has to wait, without calling DynamoDB
+    other_request = create_request(create_event, TableName='other', GlobalSecondaryIndexes=[INDEX])
+    waiting = get_resource(other_request).create(other_request, session)
+    assert waiting.state == {'phase': dynamodb.WAITING_FOR_LEASE, 'table_name': 'other'}
+    assert waiting.delay == dynamodb.LEASE_RETRY_DELAY
+
+    throughput = {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+    creating_index = dict(INDEX, IndexStatus='CREATING', ProvisionedThroughput=throughput)
+    stubber.add_response('describe_table', describe('table', GlobalSecondaryIndexes=[creating_index]))
+    assert resource.poll(request, session, result.state).state == result.state
+    assert leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'other') is None
+
+    active_index = dict(creating_index, IndexStatus='ACTIVE')
+    stubber.add_response('describe_table', describe('table', GlobalSecondaryIndexes=[active_index]))
+    physical_id, _ = resource.poll(request, session, result.state)
+    assert physical_id == 'table'
+    assert leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'other') is not None
+
+def test_indexed_table_creation_slots(monkeypatch):
+    monkeypatch.delenv(dynamodb.INDEXED_TABLE_CREATION_SLOTS_ENV, raising=False)
+    assert dynamodb.get_indexed_table_creation_slots() == dynamodb.DEFAULT_INDEXED_TABLE_CREATION_SLOTS
+    monkeypatch.setenv(dynamodb.INDEXED_TABLE_CREATION_SLOTS_ENV, '3')
+    assert dynamodb.get_indexed_table_creation_slots() == 3
+
+def test_poll_takes_lease_again_when_lost(create_event, dynamodb_session, leases, monkeypatch):
+    monkeypatch.setenv(dynamodb.INDEXED_TABLE_CREATION_SLOTS_ENV, '2')
+    session, stubber = dynamodb_session
+    request = create_request(create_event, TableName='table', GlobalSecondaryIndexes=[INDEX])
+    resource = get_resource(request)
+    state = {
+        'phase': dynamodb.CREATING,
+        'table_name': 'table',
+        'lease': {'name': dynamodb.INDEXED_TABLE_LEASE, 'slot': 0, 'owner': 'table'},
+    }
+    # the slot expired while the table was being created, and was taken by another table
+    assert leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'other') is not None
+    stubber.add_response('describe_table', describe('table', 'CREATING'))
+    result = resource.poll(request, session, state)
+    assert result.state['lease'] == {'name': dynamodb.INDEXED_TABLE_LEASE, 'slot': 1, 'owner': 'table'}
+
+    # with every slot taken, the table is still polled, just without a lease
+    leases.release(lease.Lease.from_dict(result.state['lease']))
+    assert leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'third', slots=2) is not None
+    stubber.add_response('describe_table', describe('table', 'CREATING'))
+    result = resource.poll(request, session, result.state)
+    assert result.state['lease'] is None
+    assert result.delay == dynamodb.POLL_DELAY
+
+def test_create_limit_exceeded_waits(create_event, dynamodb_session, leases):
+    session, stubber = dynamodb_session
+    request = create_request(create_event, TableName='table', GlobalSecondaryIndexes=[INDEX])
+    stubber.add_client_error('create_table', 'LimitExceededException')
+    result = get_resource(request).create(request, session)
+    assert result.state['phase'] == dynamodb.WAITING_FOR_LEASE
+    assert leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'other') is not None
+
+def test_create_failure_releases_lease(create_event, dynamodb_session, leases):
+    session, stubber = dynamodb_session
+    request = create_request(create_event, TableName='table', GlobalSecondaryIndexes=[INDEX])
+    stubber.add_client_error('create_table', 'ResourceInUseException')
+    with pytest.raises(Exception):
+        get_resource(request).create(request, session)
+    assert leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'other') is not None
+
+def test_poll_failed_table(create_event, dynamodb_session):
+    session, stubber = dynamodb_session
+    request = create_request(create_event, TableName='table')
+    stubber.add_response('describe_table', describe('table', 'ARCHIVED'))
+    with pytest.raises(exceptions.ResourceOperationException) as excinfo:
+        get_resource(request).poll(request, session, {'phase': dynamodb.CREATING, 'table_name': 'table'})
+    assert excinfo.value.physical_resource_id == 'table'
+
+def test_poll_describe_failure_reports_table(create_event, dynamodb_session, leases):
+    session, stubber = dynamodb_session
+    request = create_request(create_event, TableName='table', GlobalSecondaryIndexes=[INDEX])
+    held = leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'table', slots=1)
+    stubber.add_client_error('describe_table', 'InternalServerError')
+    state = {'phase': dynamodb.CREATING, 'table_name': 'table', 'lease': held.to_dict()}
+    with pytest.raises(exceptions.ResourceOperationException) as excinfo:
+        get_resource(request).poll(request, session, state)
+    assert excinfo.value.physical_resource_id == 'table'
+    assert 'InternalServerError' in str(excinfo.value)
+    assert leases.acquire(dynamodb.INDEXED_TABLE_LEASE, 'other', slots=1) is not None
+
+def test_update_replaces_on_key_change(update_event, dynamodb_session):
+    session, stubber = dynamodb_session
+    old = dict(PROPERTIES, KeySchema=[{'AttributeName': 'Owner', 'KeyType': 'HASH'}])
+    request = create_update_request(update_event, old)
+    stubber.add_response('create_table', {})
+    resource = get_resource(request)
+    result = handler.get_lifecycle_method(resource, request)(request, session)
+    assert result.state['phase'] == dynamodb.CREATING
+    assert result.state['table_name'] != 'table'
+
+def test_update_steps(update_event, dynamodb_session):
+    session, stubber = dynamodb_session
+    request = create_update_request(
+        update_event, PROPERTIES,
+        ProvisionedThroughput={'ReadCapacityUnits': '10', 'WriteCapacityUnits': '5'},
+        GlobalSecondaryIndexes=[INDEX],
+    )
+    resource = get_resource(request)
+    state = {'phase': dynamodb.UPDATING, 'table_name': 'table'}
+    stubber.add_response('describe_table', describe('table'))
+    stubber.add_response('update_table', {}, {
+        'TableName': 'table',
+        'BillingMode': 'PROVISIONED',
+        'ProvisionedThroughput': {'ReadCapacityUnits': 10, 'WriteCapacityUnits': 5},
+    })
+    assert resource.update(request, session).state == state
+
+    stubber.add_response('describe_table', describe('table', 'UPDATING'))
+    assert resource.poll(request, session, state).state == state
+
+    throughput = {'ReadCapacityUnits': 10, 'WriteCapacityUnits': 5}
+    stubber.add_response('describe_table', describe('table', ProvisionedThroughput=throughput))
+    stubber.add_response('update_table', {}, {
+        'TableName': 'table',
+        'AttributeDefinitions': ANY,
+        'GlobalSecondaryIndexUpdates': [{'Create': ANY}],
+    })
+    assert resource.poll(request, session, state).state == state
+
+    index = dict(
+        INDEX, IndexStatus='ACTIVE', ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1},
+    )
+    stubber.add_response('describe_table', describe(
+        'table', ProvisionedThroughput=throughput, GlobalSecondaryIndexes=[index],
+    ))
+    assert resource.poll(request, session, state) == ('table', {'Arn': TABLE_ARN.format('table')})
+
+def test_get_next_update_recreates_changed_index(create_event):
+    request = create_request(create_event, GlobalSecondaryIndexes=[INDEX])
+    current = dict(INDEX, Projection={'ProjectionType': 'ALL'}, ProvisionedThroughput={})
+    table = describe('table', GlobalSecondaryIndexes=[current])['Table']
+    assert get_resource(request).get_next_update(table) == {
+        'GlobalSecondaryIndexUpdates': [{'Delete': {'IndexName': 'ByOwner'}}],
+    }
+
+def test_get_next_update_stream_view_type(create_event):
+    request = create_request(create_event, StreamSpecification={'StreamViewType': 'NEW_IMAGE'})
+    resource = get_resource(request)
+    table = describe('table', StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'KEYS_ONLY'})['Table']
+    assert resource.get_next_update(table) == {'StreamSpecification': {'StreamEnabled': False}}
+    table = describe('table')['Table']
+    assert resource.get_next_update(table) == {
+        'StreamSpecification': {'StreamEnabled': True, 'StreamViewType': 'NEW_IMAGE'},
+    }
+
+def test_delete(delete_event, dynamodb_session):
+    session, stubber = dynamodb_session
+    delete_event['PhysicalResourceId'] = 'table'
+    request = types.Request.from_dict(delete_event)
+    resource = dynamodb.Table.from_dict('Table', PROPERTIES)
+    stubber.add_response('delete_table', {}, {'TableName': 'table'})
+    result = resource.delete(request, session)
+    assert result.state == {'phase': dynamodb.DELETING, 'table_name': 'table', 'requested': True}
+    stubber.add_response('describe_table', describe('table', 'DELETING'))
+    assert resource.poll(request, session, result.state).state == result.state
+    stubber.add_client_error('describe_table', 'ResourceNotFoundException')
+    assert resource.poll(request, session, result.state) is None
+
+def test_delete_in_use_retries(delete_event, dynamodb_session):
+    session, stubber = dynamodb_session
+    delete_event['PhysicalResourceId'] = 'table'
+    request = types.Request.from_dict(delete_event)
+    resource = dynamodb.Table.from_dict('Table', PROPERTIES)
+    stubber.add_client_error('delete_table', 'ResourceInUseException')
+    result = resource.delete(request, session)
+    assert result.state['requested'] is False
+    stubber.add_client_error('delete_table', 'ResourceNotFoundException')
+    assert resource.poll(request, session, result.state) is None
@@ -0,0 +1,139 @@
+import pytest
+import troposphere
+from troposphere.validators import integer
+
+from cloudseeder import schema
+from cloudseeder.resources import Property, Resource, dynamodb
+
+
+class Inner(Property):
+    props = {
+        'Name': (str, True),
+        'Count': (integer, False),
+    }
+
+
+class Outer(Property):
+    props = {
+        'Inner': (Inner, True),
+        'Inners': ([Inner], False),
+    }
+
+
+class Everything(Resource):
+    props = {
+        'Basic': (str, False),
+        'ListBasic': ([int], False),
+        'Validated': (integer, False),
+        'ListValidated': ([integer], False),
+        'Tupular': ((float, int), False),
+        'TupularList': ([float, int], False),
+        'Nested': (Outer, False),
+        'ListNested': ([Outer], False),
+        'Anything': (dict, False),
+    }
+
+
+def to_plain(value):
+    if isinstance(value, troposphere.BaseAWSObject):
+        return {name: to_plain(item) for name, item in value.properties.items()}
+    if isinstance(value, list):
+        return [to_plain(item) for item in value]
+    return value
+
+def get_outcome(construct, cls, title, values):
+    try:
+        resource = construct(cls, title, values)
+    except Exception as ex:
+        return type(ex), str(ex)
+    return to_plain(resource), resource.title, type(resource)
+
+VALID = {
+    'ServiceToken': 'arn',
+    'Basic': 'a',
+    'ListBasic': [1, 2],
+    'Validated': '5',
+    'ListValidated': ['1', 2],
+    'Tupular': 2.5,
+    'TupularList': [1, 2.5],
+    'Nested': {'Inner': {'Name': 'n', 'Count': '3'}, 'Inners': [{'Name': 'm'}]},
+    'ListNested': [{'Inner': {'Name': 'x'}}],
+    'Anything': {'a': ['b']},
+}
+
+CASES = [
+    VALID,
+    dict(VALID, Unknown='x'),
+    dict(VALID, Basic=1),
+    dict(VALID, ListBasic='1'),
+    dict(VALID, ListBasic=['1']),
+    dict(VALID, Validated='five'),
+    dict(VALID, ListValidated=['1', 'x']),
+    dict(VALID, Tupular='2'),
+    dict(VALID, TupularList=[1, '2']),
+    dict(VALID, Nested='x'),
+    dict(VALID, Nested={'Inner': 'x'}),
+    dict(VALID, Nested={'Inner': {'Name': 1}}),
+    dict(VALID, Nested={'Inner': {'Name': 'n', 'Bad': 1}}),
+    dict(VALID, ListNested={'Inner': {'Name': 'x'}}),
+    dict(VALID, ListNested=['x']),
+    dict(VALID, Anything=[]),
+    # the unknown property is rejected before the earlier type error is found
+    dict([('ServiceToken', 'arn'), ('Basic', 1), ('Unknown', 'x')]),
+    {'ServiceToken': 'arn'},
+]
+
+@pytest.mark.parametrize('values', CASES)
+def test_construct_matches_from_dict(values):
+    expected = get_outcome(lambda cls, title, values: cls.from_dict(title, values), Everything, 'Title', values)
+    assert get_outcome(schema.construct_resource, Everything, 'Title', values) == expected
+
+@pytest.mark.parametrize('title', ['Title', 'Not-Alphanumeric'])
+def test_construct_title(title):
+    expected = get_outcome(lambda cls, title, values: cls.from_dict(title, values), Everything, title, VALID)
+    assert get_outcome(schema.construct_resource, Everything, title, VALID) == expected
+
+def test_construct_resource_behaves_like_from_dict():
+    resource = schema.construct_resource(Everything, 'Title', VALID)
+    reference = Everything.from_dict('Title', VALID)
+    assert resource.Basic == 'a'
+    assert getattr(resource, 'Missing', 'default') == 'default'
+    assert resource.properties.keys() == reference.properties.keys()
+    assert resource.resource_type == reference.resource_type
+    assert resource.to_dict(validation=False)['Type'] == 'Custom::Everything'
+
+def test_property_values():
+    nested = schema.construct_resource(Everything, 'Title', VALID).Nested
+    assert type(nested) is Outer
+    assert type(nested.Inner) is Inner
+    assert nested.Inner.Count == '3'
+    assert nested.Inner.properties == schema.construct_property(Inner, {'Name': 'n', 'Count': '3'}).properties
+
+def test_construct_to_dict_matches_from_dict():
+    resource = schema.construct_resource(Everything, 'Title', VALID)
+    assert resource.to_dict() == Everything.from_dict('Title', VALID).to_dict()
+    missing_name = dict(VALID, Nested={'Inner': {'Count': '3'}})
+    with pytest.raises(ValueError) as excinfo:
+        schema.construct_resource(Everything, 'Title', missing_name).to_dict()
+    assert 'Name required' in str(excinfo.value)
+
+def test_validator_errors_reported(capsys):
+    for construct in (lambda cls, title, values: cls.from_dict(title, values), schema.construct_resource):
+        with pytest.raises(ValueError):
+            construct(Everything, 'Title', dict(VALID, Validated='five'))
+        assert "Title.Validated function validator 'integer' threw exception" in capsys.readouterr().err
+
+def test_construct_without_service_token():
+    resource = schema.construct_resource(Everything, 'Title', {'Basic': 'a'})
+    assert isinstance(resource.ServiceToken, troposphere.ImportValue)
+
+def test_dynamodb_table_api_values():
+    values = {
+        'ServiceToken': 'arn',
+        'AttributeDefinitions': [{'AttributeName': 'Id', 'AttributeType': 'S'}],
+        'KeySchema': [{'AttributeName': 'Id', 'KeyType': 'HASH'}],
+        'ProvisionedThroughput': {'ReadCapacityUnits': '5', 'WriteCapacityUnits': '5'},
+    }
+    table = schema.construct_resource(dynamodb.Table, 'Table', values)
+    reference = dynamodb.Table.from_dict('Table', values)
+    assert table.get_create_table_kwargs('name') == reference.get_create_table_kwargs('name')
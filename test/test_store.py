@@ -0,0 +1,256 @@
+import json
+
+import attr
+import boto3
+import mock
+import pytest
+from botocore.stub import Stubber
+
+from cloudseeder import handler, resources, store, types
+
+
+class CountingResource(resources.Resource):
+    resource_type = 'Custom::CountingResource'
+    calls = []
+
+    props = {
+        'Comment': (str, False),
+        'Replaced': (str, False),
+    }
+    replacement_properties = ('Replaced',)
+
+    def create(self, request, session):
+        self.calls.append(request.request_id)
+        return 'counted-{}'.format(len(self.calls)), {'Calls': str(len(self.calls))}
+
+    def update(self, request, session):
+        self.calls.append(request.request_id)
+        return request.physical_resource_id, {'Calls': str(len(self.calls))}
+
+
+@pytest.fixture
+def result_store(tmpdir):
+    return store.SQLiteResultStore(str(tmpdir.join('results.db')))
+
+@pytest.fixture
+def patch_result_store(result_store):
+    with mock.patch('cloudseeder.handler.get_result_store', return_value=result_store):
+        yield result_store
+
+@pytest.fixture
+def counting_event(create_event, patch_get_resource_class):
+    CountingResource.calls = []
+    patch_get_resource_class.return_value = CountingResource
+    create_event['ResourceType'] = CountingResource.resource_type
+    create_event['ResourceProperties'] = {}
+    return create_event
+
+def test_begin(result_store):
+    assert result_store.begin('key', now=100) is None
+    record = result_store.begin('key', now=101)
+    assert record.status == store.IN_PROGRESS
+    assert record.expires_at == 100 + store.IN_PROGRESS_TTL
+
+def test_begin_expired(result_store):
+    assert result_store.begin('key', ttl=10, now=100) is None
+    assert result_store.begin('key', ttl=10, now=111) is None
+
+def test_complete(result_store):
+    result_store.begin('key', now=100)
+    result_store.complete('key', {'Status': 'SUCCESS'}, now=105)
+    record = result_store.begin('key', now=106)
+    assert record.status == store.COMPLETE
+    assert record.response == {'Status': 'SUCCESS'}
+    assert result_store.begin('key', now=106 + store.COMPLETE_TTL) is None
+
+def test_get(result_store):
+    assert result_store.get('key', now=100) is None
+    result_store.complete('key', {'Status': 'SUCCESS'}, ttl=10, now=100)
+    assert result_store.get('key', now=105).response == {'Status': 'SUCCESS'}
+    assert result_store.get('key', now=111) is None
+
+def test_keep_alive(result_store):
+    result_store.begin('key', ttl=10, now=100)
+    result_store.keep_alive('key', 100, now=105)
+    assert result_store.begin('key', now=150).status == store.IN_PROGRESS
+
+def test_get_result_key(create_request):
+    assert store.get_result_key(create_request) == \
+        'unique id for this create request#BigCustomMan'
+
+def test_get_result_store():
+    with mock.patch.dict('os.environ', {'CLOUDSEEDER_RESULT_TABLE': 'results'}):
+        assert isinstance(store.get_result_store(None), store.DynamoDBResultStore)
+    with mock.patch.dict('os.environ', clear=True):
+        assert store.get_result_store(None) is None
+
+def test_redelivery_resends_recorded_response(counting_event, patch_result_store, patch_send_response_data):
+    first = handler.handler(counting_event)
+    second = handler.handler(counting_event)
+    assert CountingResource.calls == [counting_event['RequestId']]
+    assert first == second
+    assert first['PhysicalResourceId'] == 'counted-1'
+    assert patch_send_response_data.call_count == 2
+
+def test_redelivery_while_in_progress(counting_event, patch_result_store, patch_send_response_data):
+    patch_result_store.begin(store.get_result_key(types.Request.from_dict(counting_event)))
+    assert handler.handler(counting_event) is None
+    assert CountingResource.calls == []
+    assert patch_send_response_data.call_count == 0
+
+def test_other_logical_resource_not_deduplicated(counting_event, patch_result_store, patch_send_response_data):
+    handler.handler(counting_event)
+    counting_event['LogicalResourceId'] = 'OtherResource'
+    handler.handler(counting_event)
+    assert len(CountingResource.calls) == 2
+
+def test_store_failure_does_not_fail_request(counting_event, patch_result_store, patch_send_response_data):
+    with mock.patch.object(patch_result_store, 'begin', side_effect=RuntimeError()):
+        result = handler.handler(counting_event)
+    assert result['Status'] == 'SUCCESS'
+
+@pytest.fixture
+def counting_update_event(counting_event, update_event):
+    update_event['ResourceType'] = counting_event['ResourceType']
+    update_event['PhysicalResourceId'] = 'counted-1'
+    update_event['ResourceProperties'] = {'ServiceToken': 'new', 'Comment': 'a'}
+    update_event['OldResourceProperties'] = {'ServiceToken': 'old', 'Comment': 'a'}
+    counting_event['ResourceProperties'] = {'Comment': 'a'}
+    return update_event
+
+def test_unchanged_update_skipped(
+        counting_event, counting_update_event, patch_result_store, patch_send_response_data):
+    handler.handler(counting_event)
+    response = handler.handler(counting_update_event)
+    assert CountingResource.calls == [counting_event['RequestId']]
+    assert response['Status'] == 'SUCCESS'
+    assert response['PhysicalResourceId'] == 'counted-1'
+    assert response['RequestId'] == counting_update_event['RequestId']
+    assert response['Data'] == {'Calls': '1'}
+
+def test_unchanged_update_without_record(counting_update_event, patch_result_store, patch_send_response_data):
+    response = handler.handler(counting_update_event)
+    assert CountingResource.calls == []
+    assert response['Status'] == 'SUCCESS'
+    assert response['PhysicalResourceId'] == 'counted-1'
+    assert response['Data'] == {}
+
+def test_unchanged_update_without_store(counting_update_event, patch_send_response_data):
+    with mock.patch('cloudseeder.handler.get_result_store', return_value=None):
+        response = handler.handler(counting_update_event)
+    assert CountingResource.calls == []
+    assert response['Status'] == 'SUCCESS'
+    assert response['PhysicalResourceId'] == 'counted-1'
+
+def test_changed_update_calls_resource(
+        counting_event, counting_update_event, patch_result_store, patch_send_response_data):
+    handler.handler(counting_event)
+    counting_update_event['ResourceProperties']['Comment'] = 'b'
+    first = handler.handler(counting_update_event)
+    assert first['Data'] == {'Calls': '2'}
+    # the update's response is what later unchanged updates answer with
+    counting_update_event['RequestId'] = 'another update'
+    counting_update_event['OldResourceProperties']['Comment'] = 'b'
+    assert handler.handler(counting_update_event)['Data'] == {'Calls': '2'}
+    assert len(CountingResource.calls) == 2
+
+def test_update_replacement_calls_create(counting_update_event, patch_result_store, patch_send_response_data):
+    counting_update_event['ResourceProperties']['Replaced'] = 'yes'
+    response = handler.handler(counting_update_event)
+    assert response['PhysicalResourceId'] == 'counted-1'
+    assert response['Data'] == {'Calls': '1'}
+    counting_update_event['RequestId'] = 'another update'
+    counting_update_event['OldResourceProperties']['Replaced'] = 'yes'
+    counting_update_event['ResourceProperties']['Comment'] = 'b'
+    response = handler.handler(counting_update_event)
+    # only the comment changed this time, so the resource is updated in place
+    assert response['PhysicalResourceId'] == 'counted-1'
+    assert response['Data'] == {'Calls': '2'}
+
+def test_response_round_trip(create_request):
+    response = types.Response.from_request(
+        create_request, status=True, physical_resource_id='foo', data={'a': 'b'}, no_echo=True,
+    )
+    assert types.Response.from_dict(response.to_dict()) == response
+
+def test_stored_response_omits_no_echo_data(create_request):
+    response = types.Response.from_request(
+        create_request, status=True, physical_resource_id='foo', data={'Password': 'hunter2'}, no_echo=True,
+    )
+    stored = store.to_stored_response(response)
+    assert 'hunter2' not in json.dumps(stored)
+    assert not store.Record(store.COMPLETE, 0, stored).is_replayable
+    plain = attr.evolve(response, no_echo=False)
+    assert store.to_stored_response(plain) == plain.to_dict()
+    assert store.Record(store.COMPLETE, 0, store.to_stored_response(plain)).is_replayable
+
+def test_no_echo_redelivery_runs_again(counting_event, patch_result_store, patch_send_response_data):
+    with mock.patch.object(CountingResource, 'create', autospec=True) as create:
+        create.side_effect = lambda self, request, session: types.Response.from_request(
+            request, status=True, physical_resource_id='secret', data={'Password': 'hunter2'}, no_echo=True,
+        )
+        first = handler.handler(counting_event)
+        second = handler.handler(counting_event)
+    assert create.call_count == 2
+    assert first['Data'] == second['Data'] == {'Password': 'hunter2'}
+    record = patch_result_store.get(store.get_result_key(types.Request.from_dict(counting_event)))
+    assert 'hunter2' not in json.dumps(record.response)
+
+@pytest.fixture
+def dynamodb():
+    session = boto3.Session(
+        aws_access_key_id='AKIDEXAMPLE',
+        aws_secret_access_key='secret',
+        region_name='us-east-1',
+    )
+    client = session.client('dynamodb')
+    session = mock.Mock()
+    session.client.return_value = client
+    with Stubber(client) as stubber:
+        yield store.DynamoDBResultStore('results', session), stubber
+        stubber.assert_no_pending_responses()
+
+def test_dynamodb_begin(dynamodb):
+    result_store, stubber = dynamodb
+    stubber.add_response('put_item', {}, {
+        'TableName': 'results',
+        'Item': {'Key': {'S': 'key'}, 'Status': {'S': 'IN_PROGRESS'}, 'ExpiresAt': {'N': '110'}},
+        'ConditionExpression': 'attribute_not_exists(#key) OR #expires_at < :now',
+        'ExpressionAttributeNames': {'#key': 'Key', '#expires_at': 'ExpiresAt'},
+        'ExpressionAttributeValues': {':now': {'N': '100'}},
+    })
+    assert result_store.begin('key', ttl=10, now=100) is None
+
+def test_dynamodb_begin_existing(dynamodb):
+    result_store, stubber = dynamodb
+    stubber.add_client_error('put_item', 'ConditionalCheckFailedException')
+    stubber.add_response('get_item', {'Item': {
+        'Key': {'S': 'key'},
+        'Status': {'S': 'COMPLETE'},
+        'ExpiresAt': {'N': '1000'},
+        'Response': {'S': json.dumps({'Status': 'SUCCESS'})},
+    }}, {'TableName': 'results', 'Key': {'Key': {'S': 'key'}}, 'ConsistentRead': True})
+    record = result_store.begin('key', now=100)
+    assert record == store.Record(status='COMPLETE', expires_at=1000, response={'Status': 'SUCCESS'})
+
+def test_dynamodb_complete(dynamodb):
+    result_store, stubber = dynamodb
+    stubber.add_response('put_item', {}, {
+        'TableName': 'results',
+        'Item': {
+            'Key': {'S': 'key'},
+            'Status': {'S': 'COMPLETE'},
+            'ExpiresAt': {'N': '200'},
+            'Response': {'S': '{"Status": "SUCCESS"}'},
+        },
+    })
+    result_store.complete('key', {'Status': 'SUCCESS'}, ttl=100, now=100)
+
+def test_dynamodb_get_expired(dynamodb):
+    result_store, stubber = dynamodb
+    stubber.add_response('get_item', {'Item': {
+        'Key': {'S': 'key'},
+        'Status': {'S': 'COMPLETE'},
+        'ExpiresAt': {'N': '100'},
+    }}, {'TableName': 'results', 'Key': {'Key': {'S': 'key'}}, 'ConsistentRead': True})
+    assert result_store.get('key', now=200) is None
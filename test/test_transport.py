@@ -0,0 +1,116 @@
+import threading
+import time
+
+import mock
+import pytest
+import requests.exceptions
+from six.moves import BaseHTTPServer, socketserver
+
+from cloudseeder import transport
+
+
+class StandInServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive, so connection reuse can be observed
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        status, latency = self.server.behaviours.pop(0) if self.server.behaviours else (200, 0)
+        self.server.received.append((self.client_address, body))
+        time.sleep(latency)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    server.behaviours = []
+    server.received = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    server.url = 'http://127.0.0.1:{}/response'.format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(autouse=True)
+def http_session():
+    # each test gets its own connection pool
+    transport.get_http_session.cache_clear()
+    yield
+    transport.get_http_session().close()
+    transport.get_http_session.cache_clear()
+
+@pytest.fixture
+def policy():
+    return transport.RetryPolicy(
+        max_attempts=4,
+        base_delay=0.01,
+        max_delay=0.02,
+        total_timeout=5,
+        read_timeout=0.5,
+    )
+
+def test_put(server, policy):
+    transport.put(server.url, b'{}', retry_policy=policy)
+    assert server.received[0][1] == b'{}'
+
+def test_put_keep_alive(server, policy):
+    for _ in range(3):
+        transport.put(server.url, b'{}', retry_policy=policy)
+    assert len(server.received) == 3
+    assert len(set(address for address, _ in server.received)) == 1
+
+def test_put_retries_server_errors(server, policy):
+    server.behaviours = [(503, 0), (500, 0)]
+    response = transport.put(server.url, b'{}', retry_policy=policy)
+    assert response.status_code == 200
+    assert len(server.received) == 3
+
+def test_put_gives_up(server, policy):
+    server.behaviours = [(502, 0)] * 10
+    with pytest.raises(requests.exceptions.HTTPError):
+        transport.put(server.url, b'{}', retry_policy=policy)
+    assert len(server.received) == policy.max_attempts
+
+def test_put_client_error_not_retried(server, policy):
+    server.behaviours = [(403, 0)]
+    with pytest.raises(requests.exceptions.HTTPError):
+        transport.put(server.url, b'{}', retry_policy=policy)
+    assert len(server.received) == 1
+
+def test_put_retries_timeouts(server, policy):
+    server.behaviours = [(200, 1)]
+    transport.put(server.url, b'{}', retry_policy=policy)
+    assert len(server.received) == 2
+
+def test_put_total_timeout(server, policy):
+    server.behaviours = [(200, 1)] * 10
+    policy = transport.RetryPolicy(max_attempts=10, base_delay=0.01, total_timeout=0.5, read_timeout=5)
+    start = time.time()
+    with pytest.raises(requests.exceptions.Timeout):
+        transport.put(server.url, b'{}', retry_policy=policy)
+    assert time.time() - start < 1.5
+
+def test_put_connection_error(policy):
+    with mock.patch('cloudseeder.transport.time.sleep') as sleep:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            # nothing listens on port 9 (discard) on the loopback interface
+            transport.put('http://127.0.0.1:9/', b'{}', retry_policy=policy)
+    assert sleep.call_count == policy.max_attempts - 1
+
+@pytest.mark.parametrize('attempt', range(1, 10))
+def test_retry_policy_delay(attempt):
+    policy = transport.RetryPolicy(base_delay=0.5, max_delay=4)
+    for _ in range(20):
+        assert 0 <= policy.get_delay(attempt) <= min(4, 0.5 * 2 ** (attempt - 1))
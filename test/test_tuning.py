@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from cloudseeder import clients, exceptions, transport, tuning
+
+
+@pytest.fixture
+def recording(create_event):
+    event = dict(
+        create_event,
+        ResourceType='Custom::AWS.CloudFront.OriginAccessIdentity',
+        ResourceProperties={'CallerReference': 'ref'},
+    )
+    return tuning.Recording(event, {
+        'cloudfront': {
+            'CreateCloudFrontOriginAccessIdentity': {
+                'CloudFrontOriginAccessIdentity': {'Id': 'E123', 'S3CanonicalUserId': 'abc'},
+            },
+        },
+    })
+
+def create_result(cpu_seconds, wall_seconds, peak_rss_mb=100.0):
+    invocation = tuning.Measurement(cpu_seconds, wall_seconds)
+    return tuning.ReplayResult(invocation, (invocation,), peak_rss_mb, ('SUCCESS',))
+
+def test_load_recordings(tmpdir, recording):
+    path = tmpdir.join('events.jsonl')
+    path.write('{}\n\n{}\n'.format(
+        json.dumps({'event': recording.event, 'responses': recording.responses}),
+        json.dumps(recording.event),
+    ))
+    assert tuning.load_recordings(str(path)) == [recording, tuning.Recording(recording.event)]
+    path.write(json.dumps([recording.event]))
+    assert tuning.load_recordings(str(path)) == [tuning.Recording(recording.event)]
+
+def test_replay(recording):
+    original_get_session, original_put = clients.get_session, transport.put
+    result = tuning.replay([recording, tuning.Recording(recording.event)])
+    assert clients.get_session is original_get_session
+    assert transport.put is original_put
+    # the second recording has no canned response, so the resource fails on its missing keys
+    assert result.statuses == ('SUCCESS', 'FAILED')
+    assert len(result.invocations) == 2
+    assert result.peak_rss_mb > 0
+
+def test_canned_responder(recording):
+    responder = tuning.CannedResponder()
+    session = tuning.create_stub_session(responder)
+    response = session.client('cloudfront').list_distributions()
+    assert response['ResponseMetadata']['HTTPStatusCode'] == 200
+    responder.responses = recording.responses
+    response = session.client('cloudfront').create_cloud_front_origin_access_identity(
+        CloudFrontOriginAccessIdentityConfig={'CallerReference': 'ref', 'Comment': ''},
+    )
+    assert response['CloudFrontOriginAccessIdentity']['Id'] == 'E123'
+
+def test_estimate_duration_scales_cpu_only():
+    measurement = tuning.Measurement(cpu_seconds=0.1, wall_seconds=0.3)
+    assert tuning.estimate_duration(measurement, tuning.FULL_CPU_MEMORY_SIZE) == pytest.approx(0.3)
+    assert tuning.estimate_duration(measurement, tuning.FULL_CPU_MEMORY_SIZE * 2) == pytest.approx(0.3)
+    half = tuning.FULL_CPU_MEMORY_SIZE / 2.0
+    assert tuning.estimate_duration(measurement, half) == pytest.approx(0.4)
+
+def test_estimate_fits():
+    result = create_result(0.1, 0.1, peak_rss_mb=150.0)
+    assert not tuning.estimate(result, 128).fits
+    assert tuning.estimate(result, 256).fits
+
+def test_recommend_strategies():
+    # entirely CPU-bound, so more memory is faster at about the same cost until a full vCPU
+    result = create_result(cpu_seconds=1.0, wall_seconds=1.0)
+    estimates = [tuning.estimate(result, memory_size) for memory_size in tuning.MEMORY_SIZES]
+    assert tuning.recommend(estimates, 'speed').memory_size == tuning.FULL_CPU_MEMORY_SIZE
+    assert tuning.recommend(estimates, 'balanced').memory_size == tuning.FULL_CPU_MEMORY_SIZE
+    cheapest = tuning.recommend(estimates, 'cost')
+    assert cheapest.cost == min(estimate.cost for estimate in estimates if estimate.fits)
+
+def test_recommend_waiting_prefers_small():
+    # entirely waiting on I/O, so more memory only costs more
+    result = create_result(cpu_seconds=0.0, wall_seconds=1.0)
+    estimates = [tuning.estimate(result, memory_size) for memory_size in tuning.MEMORY_SIZES]
+    assert tuning.recommend(estimates, 'balanced').memory_size == 128
+
+def test_recommend_nothing_fits():
+    result = create_result(0.1, 0.1, peak_rss_mb=10000.0)
+    with pytest.raises(exceptions.TuningException):
+        tuning.recommend([tuning.estimate(result, 128)])
+
+def test_tune_report():
+    report = tuning.tune([], memory_sizes=(128, 256), result=create_result(0.01, 0.02))
+    assert report.to_dict()['recommended_memory_size'] == report.recommended.memory_size
+    assert 'recommended' in report.format_table()
@@ -1,3 +1,6 @@
+import json
+
+import attr
 import pytest
 
 from cloudseeder import exceptions, types
@@ -49,3 +52,110 @@ def test_response_too_big(create_event):
             reason='foo',
             physical_resource_id='bar' * 1000,
         )
+
+def test_request_slots(create_event):
+    request = types.Request.from_dict(create_event)
+    assert not hasattr(request, '__dict__')
+
+def test_request_fast_path_equivalent(create_event, update_event, delete_event):
+    for event in (create_event, update_event, delete_event):
+        request = types.Request.from_dict(event)
+        kwargs = {types.to_attribute_name(k): v for k, v in event.items()}
+        assert request == type(request)(**kwargs)
+
+def test_to_attribute_name():
+    assert types.to_attribute_name('ResponseURL') == 'response_url'
+    assert types.to_attribute_name('OldResourceProperties') == 'old_resource_properties'
+
+def test_request_class_from_request_type(create_event):
+    create_event['RequestType'] = 'Response'
+    with pytest.raises(exceptions.EventSerializationException):
+        types.Request.from_dict(create_event)
+
+def get_construction_error(request_cls, kwargs):
+    try:
+        request_cls(**kwargs)
+    except Exception as ex:
+        return type(ex), str(ex)
+    raise AssertionError('construction did not fail')
+
+def test_request_error_wrong_type(update_event):
+    update_event['RequestId'] = 1234
+    with pytest.raises(TypeError) as excinfo:
+        types.Request.from_dict(update_event)
+    kwargs = {types.to_attribute_name(k): v for k, v in update_event.items()}
+    assert (TypeError, str(excinfo.value)) == get_construction_error(types.Update, kwargs)
+
+def test_request_error_missing_key(delete_event):
+    del delete_event['PhysicalResourceId']
+    with pytest.raises(TypeError) as excinfo:
+        types.Request.from_dict(delete_event)
+    kwargs = {types.to_attribute_name(k): v for k, v in delete_event.items()}
+    assert (TypeError, str(excinfo.value)) == get_construction_error(types.Delete, kwargs)
+
+def test_request_error_bad_request_type(create_event):
+    create_event['RequestType'] = 'Handstand'
+    with pytest.raises(exceptions.EventSerializationException) as excinfo:
+        types.Request.from_dict(create_event)
+    kwargs = {types.to_attribute_name(k): v for k, v in create_event.items()}
+    error_type, error_message = get_construction_error(types.Request, kwargs)
+    assert error_type is ValueError
+    assert str(excinfo.value) == (
+        "Couldn't instantiate request object: ValueError: {}; ".format(error_message) +
+        "Source object: {}".format(json.dumps(create_event, sort_keys=True))
+    )
+
+def test_request_extra_keys_not_cached_forever(create_event):
+    for i in range(types.MAX_CACHED_KEYS * 2):
+        create_event['Extra{}'.format(i)] = i
+    types.Request.from_dict(create_event)
+    assert len(types.get_request_schema(types.Create).key_map) <= types.MAX_CACHED_KEYS
+
+@pytest.fixture
+def response(create_request):
+    return types.Response.from_request(
+        create_request,
+        status=True,
+        physical_resource_id='bar',
+        data={'Nested': {'Key': 'value'}},
+    )
+
+def test_response_to_dict(response):
+    serialized = response.to_dict()
+    assert serialized == {
+        'PhysicalResourceId': 'bar',
+        'StackId': response.stack_id,
+        'RequestId': response.request_id,
+        'LogicalResourceId': response.logical_resource_id,
+        'Status': 'SUCCESS',
+        'Reason': '',
+        'Data': {'Nested': {'Key': 'value'}},
+        'NoEcho': False,
+    }
+    assert serialized['Data'] is response.data
+
+def test_response_encode(response):
+    assert json.loads(response.encode().decode('utf-8')) == response.to_dict()
+
+def test_response_encode_size_limit(response):
+    size = len(response.encode())
+    padding = types.MAX_RESPONSE_BYTES - size
+    fits = attr.evolve(response, data={'Nested': {'Key': 'value' + 'x' * padding}})
+    assert len(fits.encode()) == types.MAX_RESPONSE_BYTES
+    too_big = attr.evolve(response, data={'Nested': {'Key': 'value' + 'x' * (padding + 1)}})
+    with pytest.raises(exceptions.ResponseTooLargeException) as excinfo:
+        too_big.encode()
+    assert '4097 bytes' in str(excinfo.value)
+
+def test_response_encode_size_multibyte(response):
+    # the limit applies to the encoded body, not the number of characters
+    too_big = attr.evolve(response, data={'Key': u'☃' * 1000})
+    with pytest.raises(exceptions.ResponseTooLargeException):
+        too_big.encode()
+
+def test_update_property_diff(update_event):
+    update_event['OldResourceProperties'] = dict(update_event['ResourceProperties'], key1='old')
+    request = types.Request.from_dict(update_event)
+    assert request.property_diff.changed_properties == frozenset(['key1'])
+    assert request.property_diff is request.property_diff
+    assert request == types.Update(**{types.to_attribute_name(k): v for k, v in update_event.items()})